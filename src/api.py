@@ -1,42 +1,160 @@
-from flask import Flask, jsonify, request, render_template
-from blockchain import Blockchain
+from flask import Flask, Response, jsonify, request, render_template, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
+from blockchain import Blockchain, SYNC_PAGE_SIZE, BLOCK_CONNECTED
 from wallet import Wallet
+from storage import open_storage, FSYNC_POLICIES, FSYNC_BATCH
+from scheduler import MiningScheduler
+from peers import PeerClient
+from mempool import transaction_size
+import codec
+from compact import CompactRecord, json_default
+from assembler import DEFAULT_MAX_BLOCK_SIZE
+import metrics
+from profiler import SamplingProfiler, ProfilerBusy
+from server import serve, DEFAULT_THREADS
+from runtime import NodeRuntime
+from gossip import ITEM_PATHS
+from validation import transaction_hash, valid_block_body
+import hmac
+import os
 import json
+import time
 from argparse import ArgumentParser
-import requests
+
+class ChainJSONProvider(DefaultJSONProvider):
+    """Materializa os blocos e transações compactos da cadeia apenas na resposta."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, CompactRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 # Instancia o nosso nó
 app = Flask(__name__, template_folder='templates')
+app.json = ChainJSONProvider(app)
+
+# Número máximo de blocos por página em /chain (use ?stream=true para a cadeia inteira)
+CHAIN_PAGE_SIZE = 100
+# Campos exigidos de um bloco recebido (`bits` é opcional nos blocos legados)
+BLOCK_FIELDS = ('index', 'timestamp', 'proof', 'previous_hash', 'merkle_root', 'transactions')
+# Blocos (ou transações) por página no explorador
+EXPLORER_PAGE_SIZE = 20
 
 # A instância da Blockchain será criada no main, com o arquivo de storage correto
 blockchain = None
 # A carteira do nó será criada no main, com o ID do nó (porta)
 node_wallet = None
 node_identifier = None
+# Agendador da mineração em segundo plano, criado no main
+mining_scheduler = None
+
+# Profiler por amostragem, ligado sob demanda pelos endpoints /admin/profiler
+profiler = SamplingProfiler()
+# Sem token, os endpoints de administração só atendem requisições locais
+admin_token = None
+
+# Métricas das requisições HTTP, por endpoint (nome da função da rota)
+HTTP_REQUEST_SECONDS = metrics.histogram('cryptomesh_http_request_seconds', 'Latência das requisições HTTP atendidas', ('endpoint', 'method'))
+HTTP_REQUESTS = metrics.counter('cryptomesh_http_requests_total', 'Requisições HTTP atendidas', ('endpoint', 'status'))
+# Estado do nó, lido apenas na coleta
+metrics.gauge('cryptomesh_chain_height', 'Altura da cadeia ativa', fn=lambda: blockchain.state.length)
+metrics.gauge('cryptomesh_chain_work', 'Trabalho acumulado da cadeia ativa', fn=lambda: blockchain.state.work)
+metrics.gauge('cryptomesh_mempool_transactions', 'Transações no mempool', fn=lambda: len(blockchain.mempool))
+metrics.gauge('cryptomesh_utxo_count', 'Saídas não gastas no conjunto de UTXOs', fn=lambda: len(blockchain.utxo))
+metrics.gauge('cryptomesh_peers', 'Nós vizinhos registrados', fn=lambda: len(blockchain.nodes))
+metrics.gauge('cryptomesh_hash_rate', 'Hashes por segundo na última rodada de mineração', fn=lambda: blockchain.miner.stats()['hash_rate'])
+
+def broadcast_block(block):
+    """Anuncia um bloco recém-minerado aos nós da rede; quem não o tem recebe o bloco no formato binário compacto."""
+    blockchain.gossip.announce(blockchain.nodes, 'block', {blockchain.hash(block): codec.encode_block(block)})
+
+def wants_binary():
+    """Indica se o cliente pediu o formato binário compacto (cabeçalho Accept)."""
+    return request.accept_mimetypes.best == codec.BINARY_MIMETYPE
+
+def binary_response(data, status=200, headers=None):
+    return Response(data, status=status, mimetype=codec.BINARY_MIMETYPE, headers=headers)
+
+def request_body(decode):
+    """Corpo da requisição: binário compacto (decodificado com `decode`) ou JSON."""
+    if request.mimetype == codec.BINARY_MIMETYPE:
+        try:
+            return decode(request.get_data())
+        except ValueError:
+            return None
+    return request.get_json(silent=True)
+
+@app.before_request
+def start_request_timer():
+    if metrics.REGISTRY.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'desconhecido'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    if not request.path.startswith('/admin/'):
+        profiler.request_finished()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas do nó no formato de texto do Prometheus."""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def admin_allowed():
+    """Requisições de administração: com o token configurado (X-Admin-Token) ou, sem ele, apenas locais."""
+    if admin_token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/admin/profiler/start', methods=['POST'])
+def start_profiler():
+    if not admin_allowed():
+        return jsonify({'message': 'Acesso negado'}), 403
+    # Sessão limitada por `seconds` e/ou pelo número de `requests` atendidas
+    try:
+        profiler.start(
+            seconds=request.args.get('seconds', type=float),
+            requests=request.args.get('requests', type=int),
+            interval=request.args.get('interval', type=float),
+        )
+    except ProfilerBusy as e:
+        return jsonify({'message': str(e), 'status': profiler.status()}), 409
+    return jsonify({'message': 'Profiling iniciado', 'status': profiler.status()}), 202
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+def stop_profiler():
+    if not admin_allowed():
+        return jsonify({'message': 'Acesso negado'}), 403
+    profiler.stop()
+    return jsonify({'message': 'Profiling encerrado', 'status': profiler.status()}), 200
+
+@app.route('/admin/profiler', methods=['GET'])
+def profiler_result():
+    """Estado da sessão, ou as pilhas amostradas no formato collapsed (?format=collapsed), prontas para um flame graph."""
+    if not admin_allowed():
+        return jsonify({'message': 'Acesso negado'}), 403
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(profiler.status()), 200
 
 @app.route('/mine', methods=['GET'])
 def mine():
-    # Executamos o algoritmo de prova de trabalho para obter a próxima prova...
-    last_block = blockchain.last_block
-    proof = blockchain.proof_of_work(last_block)
-
-    # Calcula o total de taxas das transações no mempool
-    total_fees = sum(blockchain.get_transaction_fee(tx) for tx in blockchain.mempool)
+    # A busca da prova roda na thread de mineração, não nesta requisição
+    job = mining_scheduler.submit()
 
-    # Adiciona a transação de recompensa (coinbase), incluindo as taxas
-    blockchain.new_coinbase_transaction(node_identifier, total_fees)
+    # Com ?wait=false, apenas agenda a mineração e retorna imediatamente
+    if request.args.get('wait', 'true').lower() == 'false':
+        return jsonify({'message': 'Mineração agendada', 'status': mining_scheduler.status()}), 202
 
-    # Forja o novo Bloco, adicionando-o à cadeia
-    previous_hash = blockchain.hash(last_block)
-    block = blockchain.new_block(proof, previous_hash)
-
-    # Transmite o novo bloco para todos os nós da rede
-    for node in blockchain.nodes:
-        try:
-            requests.post(f'http://{node}/blocks/receive', json=block)
-        except requests.exceptions.ConnectionError:
-            # Ignora nós que não estão respondendo
-            pass
+    block = job.result()
+    if block is None:
+        return 'Mineração interrompida', 409
 
     response = {
         'message': "Novo bloco forjado e transmitido",
@@ -44,6 +162,44 @@ def mine():
         'transactions': block['transactions'],
         'proof': block['proof'],
         'previous_hash': block['previous_hash'],
+        'hash_rate': blockchain.miner.stats()['hash_rate'],
+    }
+    return jsonify(response), 200
+
+@app.route('/mining/start', methods=['POST'])
+def start_mining():
+    mining_scheduler.start()
+    return jsonify({'message': 'Mineração contínua iniciada', 'status': mining_scheduler.status()}), 200
+
+@app.route('/mining/stop', methods=['POST'])
+def stop_mining():
+    mining_scheduler.stop()
+    return jsonify({'message': 'Mineração interrompida', 'status': mining_scheduler.status()}), 200
+
+@app.route('/mining/status', methods=['GET'])
+def mining_status():
+    return jsonify(mining_scheduler.status()), 200
+
+@app.route('/mining/stats', methods=['GET'])
+def mining_stats():
+    return jsonify(blockchain.miner.stats()), 200
+
+@app.route('/mining/template', methods=['GET'])
+def mining_template():
+    # Modelo do próximo bloco que este nó minaria, com as taxas de cada transação
+    with blockchain.lock:
+        template = blockchain.block_template(node_identifier)
+    fees = template['fees']
+    response = {
+        'index': template['index'],
+        'previous_hash': template['previous_hash'],
+        'total_fees': template['total_fees'],
+        'size': template['size'],
+        'max_size': template['max_size'],
+        'transactions': [
+            {'id': tx['id'], 'fee': fees.get(tx['id'], 0.0), 'size': transaction_size(tx)}
+            for tx in template['transactions']
+        ],
     }
     return jsonify(response), 200
 
@@ -60,62 +216,315 @@ def new_transaction():
 
     try:
         # Cria uma nova transação UTXO usando a carteira do nó
-        tx = blockchain.new_utxo_transaction(node_wallet, values['recipient_address'], values['amount'], fee)
+        tx = blockchain.writer.call(blockchain.new_utxo_transaction, node_wallet, values['recipient_address'], values['amount'], fee)
     except ValueError as e:
         return str(e), 400
 
     if tx is None:
         return 'Saldo insuficiente para a transação', 400
 
-    # Transmite a nova transação para todos os nós da rede
-    for node in blockchain.nodes:
-        try:
-            requests.post(f'http://{node}/transactions/receive', json=tx.to_dict())
-        except requests.exceptions.ConnectionError:
-            # Ignora nós que não estão respondendo
-            pass
+    # Anuncia a nova transação aos nós da rede
+    blockchain.gossip.announce(blockchain.nodes, 'tx', {tx.id: tx.to_bytes()})
 
     response = {'message': f'Transação criada e transmitida.'}
     return jsonify(response), 201
 
 @app.route('/transactions/receive', methods=['POST'])
 def receive_transaction():
-    tx_data = request.get_json()
+    tx_data = request_body(codec.decode_transaction)
     # TODO: Adicionar validação completa da transação recebida
     required = ['inputs', 'outputs', 'id']
-    if not all(k in tx_data for k in required):
+    if not tx_data or not all(k in tx_data for k in required):
         return 'Valores faltando na transação recebida', 400
 
+    # Uma transação já vista não é verificada de novo. O id não cobre as
+    # assinaturas: uma cópia com assinatura forjada tem o mesmo id da
+    # verdadeira, então uma transação rejeitada deixa de contar como vista
+    try:
+        well_formed = transaction_hash(tx_data) == tx_data['id']
+    except (KeyError, TypeError, AttributeError):
+        well_formed = False
+    if not well_formed:
+        return 'Transação recebida inválida', 400
+    if not blockchain.gossip.mark_seen('tx', tx_data['id']):
+        return jsonify({'message': 'Transação já recebida.'}), 200
+
+    message, status = blockchain.writer.call(admit_transaction, tx_data)
+    if status >= 400:
+        # Forjada, conflitante ou com entrada ainda desconhecida (a transação
+        # pai pode não ter chegado): a verdadeira ainda pode ser aceita depois
+        blockchain.gossip.seen['tx'].discard(tx_data['id'])
+        return message, status
+    if status == 201:
+        # Retransmite aos vizinhos apenas o anúncio; quem não tem a transação a pede
+        blockchain.gossip.announce(blockchain.nodes, 'tx', {tx_data['id']: codec.encode_transaction(tx_data)})
+    return jsonify({'message': message}), status
+
+def admit_transaction(tx_data):
+    """Admite no mempool uma transação recebida (executada pelo escritor). Retorna (mensagem, status)."""
+    if tx_data['id'] in blockchain.mempool:
+        return 'Transação já está no mempool.', 200
+
+    if blockchain.mempool.conflicts(tx_data):
+        return 'Transação recebida conflita com outra do mempool', 409
+
+    if any(blockchain._lookup_output(f"{i['transaction_id']}:{i['output_index']}") is None for i in tx_data['inputs']):
+        return 'Transação recebida inválida: entrada desconhecida', 400
+
     if not blockchain.verify_transaction(tx_data):
         return 'Transação recebida inválida', 400
 
-    blockchain.mempool.append(tx_data)
-    
-    response = {'message': f'Transação recebida e adicionada ao mempool.'}
-    return jsonify(response), 201
+    if not blockchain.mempool.add(tx_data, blockchain.get_transaction_fee(tx_data)):
+        return 'Mempool cheio: taxa da transação insuficiente', 409
+
+    return 'Transação recebida e adicionada ao mempool.', 201
+
+def well_formed_body(block):
+    """Confere o formato das transações do bloco recebido e os seus ids, antes de tocar na cadeia."""
+    try:
+        return (isinstance(block.get('transactions'), list) and valid_block_body(block)
+                and all(transaction_hash(tx) == tx['id'] for tx in block['transactions']))
+    except (KeyError, TypeError, AttributeError):
+        return False
 
 @app.route('/blocks/receive', methods=['POST'])
 def receive_block():
-    block = request.get_json()
+    block = request_body(codec.decode_block)
     if not block:
         return 'Bloco faltando', 400
 
-    if blockchain.add_block(block):
+    try:
+        block_hash = blockchain.hash(block) if all(field in block for field in BLOCK_FIELDS) else None
+    except TypeError:
+        block_hash = None
+    if block_hash is None:
+        return 'Bloco recebido inválido', 400
+    if block_hash in blockchain.gossip.seen['block']:
+        return jsonify({'message': 'Bloco já recebido'}), 200
+    # Como nas transações, o bloco só conta como visto se o corpo confere com o cabeçalho
+    if not well_formed_body(block):
+        return 'Bloco recebido inválido', 400
+    if not blockchain.gossip.mark_seen('block', block_hash):
+        return jsonify({'message': 'Bloco já recebido'}), 200
+
+    tip = blockchain.state.tip
+    result = blockchain.writer.call(blockchain.add_block, block)
+
+    if blockchain.state.tip is not tip:
+        # A ponta mudou: a mineração local sobre a ponta antiga é inútil
+        mining_scheduler.notify_new_tip()
+    if result == BLOCK_CONNECTED:
+        # Só retransmite blocos validados por completo na cadeia ativa
+        blockchain.gossip.announce(blockchain.nodes, 'block', {block_hash: codec.encode_block(block)})
         return jsonify({'message': 'Bloco recebido e adicionado à cadeia'}), 201
-    
+    if result:
+        return jsonify({'message': 'Bloco recebido em um ramo lateral'}), 202
+
+    # Rejeitado (pai ainda desconhecido, ou uma cópia com assinaturas forjadas,
+    # que tem o mesmo hash do bloco verdadeiro): o hash deixa de contar como visto
+    blockchain.gossip.seen['block'].discard(block_hash)
     return 'Bloco recebido inválido', 400
 
+@app.route('/inventory', methods=['POST'])
+def inventory():
+    """Anúncio de ids de transações ou blocos de um vizinho; responde com os que este nó quer receber."""
+    values = request.get_json(silent=True) or {}
+    kind, ids = values.get('type'), values.get('ids')
+    if kind not in ITEM_PATHS or not isinstance(ids, list):
+        return 'Inventário inválido: type (tx ou block) e ids', 400
+
+    if kind == 'block':
+        have = lambda block_hash: block_hash in blockchain.tree
+    else:
+        def have(txid):
+            with blockchain.lock:
+                return txid in blockchain.mempool or blockchain.index.transaction_location(txid) is not None
+    return jsonify({'wanted': blockchain.gossip.wanted(kind, ids, have)}), 200
+
 @app.route('/chain', methods=['GET'])
 def full_chain():
+    start = max(0, request.args.get('start', 0, type=int))
+
+    # Modo streaming: NDJSON (um bloco por linha), serializado sob demanda a partir do retrato da cadeia
+    if request.args.get('stream') == 'true' or request.accept_mimetypes.best == 'application/x-ndjson':
+        limit = request.args.get('limit', type=int)
+        stop = start + max(0, limit) if limit is not None else None
+        lines = (json.dumps(block, separators=(',', ':'), default=json_default) + '\n' for block in blockchain.iter_blocks(start, stop))
+        return Response(lines, mimetype='application/x-ndjson')
+
+    limit = min(max(0, request.args.get('limit', CHAIN_PAGE_SIZE, type=int)), CHAIN_PAGE_SIZE)
+    state = blockchain.state
+    page = state.chain[start:start + limit]
+    length = state.length
+    if wants_binary():
+        return binary_response(codec.encode_blocks(page), headers={'X-Chain-Length': str(length)})
     response = {
-        'chain': blockchain.chain,
-        'length': len(blockchain.chain),
+        'chain': page,
+        'length': length,
+        'start': start,
+        'next': start + len(page) if start + len(page) < length else None,
     }
     return jsonify(response), 200
 
+def range_args(max_limit):
+    """Lê os parâmetros `from` (posição na cadeia, a partir de 0) e `limit` da requisição."""
+    start = request.args.get('from', 0, type=int)
+    limit = request.args.get('limit', max_limit, type=int)
+    return max(0, start), min(max(0, limit), max_limit)
+
+@app.route('/headers', methods=['GET'])
+def headers():
+    start, limit = range_args(SYNC_PAGE_SIZE)
+    state = blockchain.state
+    response = {
+        'headers': blockchain.headers(start, limit, chain=state.chain),
+        'length': state.length,
+        'work': state.work,
+    }
+    return jsonify(response), 200
+
+@app.route('/blocks', methods=['GET'])
+def blocks():
+    start, limit = range_args(SYNC_PAGE_SIZE)
+    state = blockchain.state
+    page = state.chain[start:start + limit]
+    if wants_binary():
+        return binary_response(codec.encode_blocks(page), headers={'X-Chain-Length': str(state.length)})
+    response = {
+        'blocks': page,
+        'length': state.length,
+    }
+    return jsonify(response), 200
+
+# --- Explorador: consultas pelos índices da cadeia ---
+
+def block_summary(block):
+    return {
+        'index': block['index'],
+        'hash': blockchain.hash(block),
+        'timestamp': block['timestamp'],
+        'previous_hash': block['previous_hash'],
+        'transactions': len(block['transactions']),
+    }
+
+def block_details(block):
+    return dict(block, hash=blockchain.hash(block), confirmations=len(blockchain.chain) - block['index'] + 1)
+
+def recent_blocks(page, per_page=EXPLORER_PAGE_SIZE):
+    """Resumos dos blocos mais recentes (página 1 = ponta da cadeia) e o número de páginas."""
+    state = blockchain.state
+    height = state.length
+    top = height - (page - 1) * per_page
+    blocks = [state.block_by_height(h) for h in range(top, max(0, top - per_page), -1)]
+    return [block_summary(block) for block in blocks], max(1, -(-height // per_page))
+
+def find_block(ref):
+    """Busca um bloco pela altura (só dígitos) ou pelo hash."""
+    with blockchain.lock:
+        return blockchain.block_by_height(int(ref)) if ref.isdigit() else blockchain.block_by_hash(ref)
+
+def transaction_details(txid):
+    with blockchain.lock:
+        found = blockchain.find_transaction(txid)
+        if found is None:
+            pending = blockchain.mempool.get(txid)
+            return {'transaction': pending, 'pending': True} if pending else None
+        block, position = found
+        return {
+            'transaction': block['transactions'][position],
+            'pending': False,
+            'block_index': block['index'],
+            'block_hash': blockchain.hash(block),
+            'position': position,
+            'confirmations': len(blockchain.chain) - block['index'] + 1,
+        }
+
+def address_details(address, page, per_page=EXPLORER_PAGE_SIZE):
+    history, total = blockchain.address_history(address, (page - 1) * per_page, per_page)
+    return {
+        'address': address,
+        'balance': blockchain.state.get_balance(address),
+        'transactions': [{'id': txid, 'block_index': height} for txid, height in history],
+        'total': total,
+        'page': page,
+        'pages': max(1, -(-total // per_page)),
+    }
+
+def page_arg():
+    return max(1, request.args.get('page', 1, type=int))
+
+@app.route('/blocks/recent', methods=['GET'])
+def recent_blocks_json():
+    page = page_arg()
+    blocks, pages = recent_blocks(page)
+    return jsonify({'blocks': blocks, 'page': page, 'pages': pages}), 200
+
+@app.route('/blocks/<int:height>', methods=['GET'])
+def block_by_height(height):
+    block = find_block(str(height))
+    if block is None:
+        return jsonify({'message': 'Bloco não encontrado'}), 404
+    if wants_binary():
+        return binary_response(codec.encode_block(block))
+    return jsonify(block_details(block)), 200
+
+@app.route('/blocks/hash/<block_hash>', methods=['GET'])
+def block_by_hash(block_hash):
+    block = find_block(block_hash)
+    if block is None:
+        return jsonify({'message': 'Bloco não encontrado'}), 404
+    if wants_binary():
+        return binary_response(codec.encode_block(block))
+    return jsonify(block_details(block)), 200
+
+@app.route('/tx/<txid>', methods=['GET'])
+def transaction(txid):
+    details = transaction_details(txid)
+    if details is None:
+        return jsonify({'message': 'Transação não encontrada'}), 404
+    return jsonify(details), 200
+
+@app.route('/tx/<txid>/proof', methods=['GET'])
+def transaction_proof(txid):
+    proof = blockchain.transaction_proof(txid)
+    if proof is None:
+        return jsonify({'message': 'Transação não encontrada em um bloco com raiz de Merkle'}), 404
+    return jsonify(proof), 200
+
+@app.route('/address/<address>/history', methods=['GET'])
+def address_history(address):
+    return jsonify(address_details(address, page_arg())), 200
+
 @app.route('/explorer', methods=['GET'])
 def explorer():
-    return render_template('explorer.html', chain=blockchain.chain)
+    page = page_arg()
+    blocks, pages = recent_blocks(page)
+    return render_template('explorer.html', blocks=blocks, page=page, pages=pages)
+
+@app.route('/explorer/search', methods=['GET'])
+def explorer_search():
+    query = request.args.get('q', '').strip()
+    if find_block(query) is not None:
+        return redirect(url_for('explorer_block', ref=query))
+    if transaction_details(query) is not None:
+        return redirect(url_for('explorer_transaction', txid=query))
+    return redirect(url_for('explorer_address', address=query))
+
+@app.route('/explorer/block/<ref>', methods=['GET'])
+def explorer_block(ref):
+    block = find_block(ref)
+    if block is None:
+        return render_template('explorer_block.html', block=None), 404
+    return render_template('explorer_block.html', block=block_details(block))
+
+@app.route('/explorer/tx/<txid>', methods=['GET'])
+def explorer_transaction(txid):
+    details = transaction_details(txid)
+    return render_template('explorer_tx.html', txid=txid, details=details), 200 if details else 404
+
+@app.route('/explorer/address/<address>', methods=['GET'])
+def explorer_address(address):
+    return render_template('explorer_address.html', details=address_details(address, page_arg()))
 
 @app.route('/nodes/register', methods=['POST'])
 def register_nodes():
@@ -126,7 +535,7 @@ def register_nodes():
         return "Erro: Forneça uma lista de nós", 400
 
     for node in nodes:
-        blockchain.register_node(node)
+        blockchain.writer.call(blockchain.register_node, node)
 
     response = {
         'message': 'Novos nós foram adicionados',
@@ -137,23 +546,26 @@ def register_nodes():
 @app.route('/nodes/resolve', methods=['GET'])
 def consensus():
     replaced = blockchain.resolve_conflicts()
+    if replaced:
+        mining_scheduler.notify_new_tip()
 
     if replaced:
         response = {
             'message': 'Nossa cadeia foi substituída',
-            'new_chain': blockchain.chain
+            'new_chain': list(blockchain.state.chain)
         }
     else:
         response = {
             'message': 'Nossa cadeia é autoritativa',
-            'chain': blockchain.chain
+            'chain': list(blockchain.state.chain)
         }
 
     return jsonify(response), 200
 
 @app.route('/balance/<address>', methods=['GET'])
 def get_balance(address):
-    balance = blockchain.get_balance(address)
+    # Leitura sem lock, a partir do retrato publicado pelo escritor
+    balance = blockchain.state.get_balance(address)
     response = {
         'address': address,
         'balance': balance,
@@ -166,21 +578,69 @@ if __name__ == '__main__':
     parser.add_argument('--difficulty-interval', default=10, type=int, help='Intervalo de ajuste de dificuldade')
     parser.add_argument('--block-time', default=10, type=int, help='Tempo de geração de bloco em segundos')
     parser.add_argument('--wallet-password', default=None, help='Senha para a carteira do nó (se criptografada)')
+    parser.add_argument('--storage', default='log', choices=['log', 'json'], help='Formato de armazenamento da cadeia')
+    parser.add_argument('--snapshot-interval', default=100, type=int, help='Intervalo (em blocos) entre snapshots do conjunto de UTXOs')
+    parser.add_argument('--verify-snapshot', action='store_true', help='Confere o snapshot de UTXOs contra a cadeia completa na inicialização')
+    parser.add_argument('--mining-workers', default=os.cpu_count(), type=int, help='Número de processos usados na mineração')
+    parser.add_argument('--validation-workers', default=os.cpu_count(), type=int, help='Número de processos usados na validação de cadeias e assinaturas')
+    parser.add_argument('--peer-timeout', default=5.0, type=float, help='Timeout (em segundos) das requisições a outros nós')
+    parser.add_argument('--mempool-size', default=5000, type=int, help='Número máximo de transações no mempool')
+    parser.add_argument('--max-block-size', default=DEFAULT_MAX_BLOCK_SIZE, type=int, help='Tamanho máximo (em bytes) das transações dos blocos minerados por este nó (até o limite de consenso)')
+    parser.add_argument('--mine', action='store_true', help='Inicia a mineração contínua em segundo plano')
+    parser.add_argument('--server', default='dev', choices=['dev', 'production', 'async'], help='Servidor HTTP: o de desenvolvimento do Flask, o de produção (pool fixo de threads) ou o runtime asyncio')
+    parser.add_argument('--threads', default=DEFAULT_THREADS, type=int, help='Threads que executam as rotas nos servidores de produção e asyncio')
+    parser.add_argument('--sync-interval', default=0, type=float, help='Com --server async, intervalo (em segundos) da sincronização automática com os vizinhos (0 desativa)')
+    parser.add_argument('--admin-token', default=None, help='Token exigido (cabeçalho X-Admin-Token) nos endpoints /admin; sem ele, só requisições locais são aceitas')
+    parser.add_argument('--no-metrics', action='store_true', help='Desativa a coleta de métricas (contadores e cronômetros)')
+    parser.add_argument('--fsync', default=FSYNC_BATCH, choices=FSYNC_POLICIES, help='Política de fsync do log de blocos')
     args = parser.parse_args()
     port = args.port
+    metrics.REGISTRY.enabled = not args.no_metrics
+    admin_token = args.admin_token
+
+    # No runtime asyncio, as conexões com os vizinhos ficam no laço de eventos
+    runtime = NodeRuntime(timeout=args.peer_timeout, handler_threads=args.threads) if args.server == 'async' else None
 
-    # Instancia a blockchain com um arquivo de storage específico para esta porta
-    storage_file = f'blockchain-{port}.json'
+    # Instancia a blockchain com um arquivo de storage específico para esta porta.
+    # O log de blocos migra automaticamente um `blockchain-<porta>.json` existente.
+    storage_file = f'blockchain-{port}.{args.storage}'
     blockchain = Blockchain(
         storage_path=storage_file,
+        storage=open_storage(storage_file, fsync=args.fsync),
         difficulty_adjustment_interval=args.difficulty_interval,
-        block_generation_interval=args.block_time
+        block_generation_interval=args.block_time,
+        snapshot_interval=args.snapshot_interval,
+        mining_workers=args.mining_workers,
+        validation_workers=args.validation_workers,
+        peers=runtime.peers if runtime else PeerClient(timeout=args.peer_timeout),
+        mempool_max_size=args.mempool_size,
+        max_block_size=args.max_block_size
     )
 
+    if args.verify_snapshot:
+        verified = blockchain.verify_utxo_snapshot(repair=True)
+        if verified is None:
+            print("Nenhum snapshot de UTXOs compatível com a cadeia atual.")
+        elif verified:
+            print("Snapshot de UTXOs conferido com a cadeia completa.")
+        else:
+            print("Aviso: snapshot de UTXOs divergente; conjunto reconstruído a partir da cadeia completa.")
+
     # Cria a carteira para este nó, usando a porta como identificador
     node_wallet = Wallet(node_id=port, password=args.wallet_password)
     node_identifier = node_wallet.public_key
 
     print(f"Carteira do nó: {node_identifier}")
 
-    app.run(host='0.0.0.0', port=port)
+    mining_scheduler = MiningScheduler(blockchain, node_identifier, on_block=broadcast_block)
+    if args.mine:
+        mining_scheduler.start()
+
+    if runtime:
+        if args.sync_interval > 0:
+            runtime.start_sync(blockchain, args.sync_interval, on_new_tip=mining_scheduler.notify_new_tip)
+        runtime.serve_forever(app, host='0.0.0.0', port=port)
+    elif args.server == 'production':
+        serve(app, host='0.0.0.0', port=port, threads=args.threads)
+    else:
+        app.run(host='0.0.0.0', port=port)
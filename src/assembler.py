@@ -0,0 +1,61 @@
+from validation import is_coinbase, MAX_BLOCK_SIZE
+
+# Tamanho máximo padrão dos blocos montados por este nó (no máximo o limite de consenso)
+DEFAULT_MAX_BLOCK_SIZE = MAX_BLOCK_SIZE
+# Espaço reservado no bloco para a transação coinbase
+COINBASE_RESERVED_SIZE = 1_000
+
+
+class BlockAssembler:
+    """
+    Escolhe as transações do mempool que entram no próximo bloco.
+
+    As transações são consideradas em ordem decrescente de taxa por byte,
+    usando as taxas calculadas quando cada transação entrou no mempool. Uma
+    transação que gasta saídas de outras pendentes só entra junto com seus
+    ancestrais ainda não escolhidos (que vêm antes dela no bloco), e apenas se
+    o pacote inteiro couber no espaço restante.
+    """
+
+    def __init__(self, mempool, max_block_size=DEFAULT_MAX_BLOCK_SIZE):
+        self.mempool = mempool
+        self.max_block_size = max_block_size
+
+    def select(self):
+        """Retorna (entradas escolhidas, em ordem válida para o bloco, e o tamanho total)."""
+        budget = self.max_block_size - COINBASE_RESERVED_SIZE
+        selected = {}
+        size = 0
+        for entry in self.mempool.by_fee_rate():
+            if entry.tx['id'] in selected or is_coinbase(entry.tx):
+                continue
+
+            package = self._package(entry, selected)
+            if package is None:
+                continue
+            package_size = sum(e.size for e in package)
+            if size + package_size > budget:
+                continue
+
+            for e in package:
+                selected[e.tx['id']] = e
+            size += package_size
+        return list(selected.values()), size
+
+    def _package(self, entry, selected):
+        """A entrada precedida pelos seus ancestrais ainda não escolhidos, em ordem topológica."""
+        package = []
+        visited = set()
+
+        def visit(current):
+            visited.add(current.tx['id'])
+            for parent_id in current.parents:
+                if parent_id in selected or parent_id in visited:
+                    continue
+                parent = self.mempool.entries.get(parent_id)
+                if parent is None or not visit(parent):
+                    return False
+            package.append(current)
+            return True
+
+        return package if visit(entry) else None
@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import platform
+import tempfile
+import threading
+import statistics
+import logging
+import tracemalloc
+from argparse import ArgumentParser
+import requests
+from compact import CompactBlock
+from wallet import Wallet
+from transaction import Transaction, TxInput, TxOutput
+from merkle import merkle_root
+from miner import check_proof, search_nonces, ProofOfWorkMiner
+import blockchain as blockchain_module
+from blockchain import Blockchain, INITIAL_DIFFICULTY
+
+# Versão do formato dos resultados (ver `compare`)
+RESULTS_VERSION = 1
+# Variação relativa a partir da qual `--compare` aponta uma regressão
+DEFAULT_TOLERANCE = 0.10
+# Tamanho padrão da cadeia sintética
+DEFAULT_BLOCKS = 100
+DEFAULT_TRANSACTIONS = 10
+DEFAULT_ADDRESSES = 10
+
+
+def synthetic_blocks(count, transactions_per_block, addresses=50, seed=1):
+    """
+    Gera blocos serializados em JSON com o formato dos blocos reais: endereços
+    de ~590 caracteres hexadecimais (chaves RSA de 2048 bits), assinaturas de
+    512 caracteres e ids de 64.
+    """
+    rng = random.Random(seed)
+    pool = [os.urandom(294).hex() for _ in range(addresses)]
+    blocks = []
+    previous_hash = '1'
+    for index in range(1, count + 1):
+        transactions = []
+        for _ in range(transactions_per_block):
+            transactions.append({
+                'inputs': [
+                    {'transaction_id': os.urandom(32).hex(), 'output_index': rng.randrange(3), 'signature': os.urandom(256).hex()}
+                    for _ in range(rng.randint(1, 2))
+                ],
+                'outputs': [
+                    {'recipient_address': rng.choice(pool), 'amount': round(rng.uniform(0.01, 10), 8)}
+                    for _ in range(2)
+                ],
+                'id': os.urandom(32).hex(),
+            })
+        block = {
+            'index': index,
+            'timestamp': 1700000000.0 + index * 10,
+            'transactions': transactions,
+            'proof': rng.randrange(10 ** 6),
+            'previous_hash': previous_hash,
+            'merkle_root': os.urandom(32).hex(),
+        }
+        previous_hash = os.urandom(32).hex()
+        blocks.append(json.dumps(block))
+    return blocks
+
+
+def measure(load, serialized):
+    """Bytes retidos em memória pelos blocos carregados com `load`."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    chain = [load(raw) for raw in serialized]
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del chain
+    return retained
+
+
+def memory_benchmark(blocks=200, transactions=20):
+    """Compara os bytes por bloco da cadeia em dicionários e na forma compacta."""
+    serialized = synthetic_blocks(blocks, transactions)
+    as_dicts = measure(json.loads, serialized)
+    compact = measure(lambda raw: CompactBlock.from_dict(json.loads(raw)), serialized)
+    return {
+        'blocks': blocks,
+        'transactions_per_block': transactions,
+        'dict_bytes_per_block': as_dicts // blocks,
+        'compact_bytes_per_block': compact // blocks,
+        'reduction': 1 - compact / as_dicts,
+    }
+
+
+# --- Cadeia sintética válida ---
+
+def synthetic_chain(blocks=DEFAULT_BLOCKS, transactions_per_block=DEFAULT_TRANSACTIONS, addresses=DEFAULT_ADDRESSES, seed=1):
+    """
+    Gera uma cadeia válida (hashes encadeados, raízes de Merkle, transações
+    assinadas gastando UTXOs reais) com `blocks` blocos após o gênese. Cada
+    transação gasta uma saída confirmada em um bloco anterior e paga outro
+    endereço, com troco. As provas de trabalho não são mineradas.
+
+    As escolhas são determinísticas para a mesma `seed`; as chaves RSA são
+    novas a cada execução, o que não altera o tamanho dos dados.
+    Retorna (blocos em dicionários, carteiras).
+    """
+    rng = random.Random(seed)
+    # Carteiras apenas em memória (sem arquivo nem senha)
+    wallets = [Wallet() for _ in range(addresses)]
+    spendable = []  # (txid, índice, carteira, valor)
+    chain = []
+
+    def add_block(transactions):
+        previous = chain[-1] if chain else None
+        block = {
+            'index': len(chain) + 1,
+            'timestamp': 1700000000.0 + len(chain) * 10,
+            'transactions': transactions,
+            'proof': rng.randrange(10 ** 6) if previous else 100,
+            'previous_hash': Blockchain.hash(previous) if previous else '1',
+            'merkle_root': merkle_root([tx['id'] for tx in transactions]),
+            'bits': INITIAL_DIFFICULTY,
+        }
+        chain.append(block)
+
+    def coinbase(recipient, amount):
+        return Transaction([TxInput('0', len(chain) + 1)], [TxOutput(recipient.public_key, amount)]).to_dict()
+
+    # O gênese financia todas as carteiras
+    genesis = [Transaction([TxInput('0', i)], [TxOutput(w.public_key, 1000.0)]).to_dict() for i, w in enumerate(wallets)]
+    add_block(genesis)
+    for tx, wallet in zip(genesis, wallets):
+        spendable.append((tx['id'], 0, wallet, 1000.0))
+
+    for _ in range(blocks):
+        created = []
+        transactions = [coinbase(rng.choice(wallets), 1.0)]
+        for _ in range(min(transactions_per_block, len(spendable))):
+            txid, index, owner, value = spendable.pop(rng.randrange(len(spendable)))
+            recipient = rng.choice(wallets)
+            amount = round(value * rng.uniform(0.1, 0.9), 8)
+            # Troco sem arredondar; a soma das saídas (em float) nunca passa da entrada
+            change = value - amount
+            while amount + change > value:
+                change = math.nextafter(change, 0)
+            unsigned = Transaction([TxInput(txid, index)], [TxOutput(recipient.public_key, amount), TxOutput(owner.public_key, change)])
+            signature = owner.sign(owner.private_key, unsigned.calculate_hash())
+            tx = Transaction([TxInput(txid, index, signature)], unsigned.outputs).to_dict()
+            transactions.append(tx)
+            # O consenso permite gastar no mesmo bloco uma saída criada nele; aqui,
+            # por simplicidade, as novas saídas só são gastas a partir do próximo
+            created += [(tx['id'], 0, recipient, amount), (tx['id'], 1, owner, change)]
+        add_block(transactions)
+        spendable += created
+    return chain, wallets
+
+
+# --- Medições ---
+
+def _timings(fn, repeat):
+    """Durações (em segundos) de `repeat` execuções de `fn`."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _rate(count, durations, unit):
+    """Vazão (operações por segundo) na mediana das execuções."""
+    return {'value': count / statistics.median(durations), 'unit': unit, 'better': 'higher'}
+
+
+def _latency(durations):
+    ordered = sorted(durations)
+    return {
+        'value': statistics.median(ordered) * 1000,
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'unit': 'ms',
+        'better': 'lower',
+    }
+
+
+def bench_hash(chain, repeat):
+    """Blockchain.hash sobre todos os blocos, sem o cache de cabeçalhos."""
+    def run():
+        blockchain_module._hash_header.cache_clear()
+        for block in chain:
+            Blockchain.hash(block)
+    return _rate(len(chain), _timings(run, repeat), 'hashes/s')
+
+
+def bench_proofs(count, repeat):
+    """Vazão de `valid_proof` (check_proof) e do laço de mineração (search_nonces)."""
+    last_hash = 'ab' * 32
+    target = ProofOfWorkMiner.target_for(64)  # praticamente inalcançável: percorre todas as provas
+
+    def run_check():
+        for proof in range(count):
+            check_proof(12345, proof, last_hash, INITIAL_DIFFICULTY)
+
+    return {
+        'valid_proof': _rate(count, _timings(run_check, repeat), 'hashes/s'),
+        'search_nonces': _rate(count, _timings(lambda: search_nonces(12345, last_hash, target, 0, count), repeat), 'hashes/s'),
+    }
+
+
+def bench_node(chain, wallets, repeat, http_requests):
+    """Mede as operações de um nó com a cadeia sintética carregada."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        node = Blockchain(storage_path=os.path.join(tmpdir, 'bench.log'))
+        try:
+            node.chain = [CompactBlock.from_dict(block) for block in chain]
+
+            results['rebuild_utxo_set'] = _rate(len(chain), _timings(node._rebuild_utxo_set, repeat), 'blocks/s')
+
+            addresses = [wallet.public_key for wallet in wallets]
+            def balances():
+                for address in addresses:
+                    node.get_balance(address)
+            results['get_balance'] = _rate(len(addresses), _timings(balances, repeat * 100), 'lookups/s')
+
+            # Verifica as transações do último bloco contra o conjunto de UTXOs anterior a ele
+            node.chain = node.chain[:-1]
+            node._rebuild_utxo_set()
+            pending = chain[-1]['transactions'][1:]
+            def verify():
+                for tx in pending:
+                    if not node.verify_transaction(tx):
+                        raise RuntimeError('transação sintética inválida')
+            if pending:
+                results['verify_transaction'] = _rate(len(pending), _timings(verify, repeat), 'tx/s')
+            node.chain = [CompactBlock.from_dict(block) for block in chain]
+
+            results['save_chain'] = _rate(len(chain), _timings(node.save_chain, repeat), 'blocks/s')
+            node.load_chain()  # a primeira carga reindexa a cadeia; as seguintes medem só a leitura
+            results['load_chain'] = _rate(len(chain), _timings(node.load_chain, repeat), 'blocks/s')
+
+            results.update(bench_http(node, http_requests))
+        finally:
+            node.verifier.close()
+            node.index.close()
+            node.storage.close()
+    return results
+
+
+def bench_http(node, count):
+    """Latência dos endpoints de leitura, por HTTP real (servidor em uma thread deste processo)."""
+    from werkzeug.serving import make_server
+    import api
+
+    api.blockchain = node
+    # O log de cada requisição do servidor de desenvolvimento distorceria as medições
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    block = node.chain[len(node.chain) // 2]
+    endpoints = {
+        'chain_page': '/chain?limit=100',
+        'headers': '/headers',
+        'balance': f"/balance/{block['transactions'][0]['outputs'][0]['recipient_address']}",
+        'block': f"/blocks/{block['index']}",
+        'tx': f"/tx/{block['transactions'][-1]['id']}",
+        'tx_proof': f"/tx/{block['transactions'][-1]['id']}/proof",
+    }
+    results = {}
+    try:
+        with requests.Session() as session:
+            for name, path in endpoints.items():
+                session.get(base + path).raise_for_status()  # aquecimento
+                durations = []
+                for _ in range(count):
+                    start = time.perf_counter()
+                    session.get(base + path).raise_for_status()
+                    durations.append(time.perf_counter() - start)
+                results[f'http_{name}'] = _latency(durations)
+    finally:
+        server.shutdown()
+        thread.join()
+    return results
+
+
+def run(blocks=100, transactions=10, addresses=10, repeat=5, proofs=50000, http_requests=50, seed=1):
+    """Executa todo o conjunto de medições e retorna os resultados em um dicionário serializável em JSON."""
+    chain, wallets = synthetic_chain(blocks, transactions, addresses, seed)
+    results = {'hash': bench_hash(chain, repeat)}
+    results.update(bench_proofs(proofs, repeat))
+    results.update(bench_node(chain, wallets, repeat, http_requests))
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {
+            'blocks': blocks, 'transactions': transactions, 'addresses': addresses,
+            'repeat': repeat, 'proofs': proofs, 'http_requests': http_requests, 'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compara dois resultados de `run`. Retorna uma lista de tuplas
+    (medida, valor anterior, valor atual, variação relativa, regressão?),
+    onde a variação é positiva quando o resultado melhorou.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['value']:
+            continue
+        change = result['value'] / previous['value'] - 1
+        if result['better'] == 'lower':
+            change = -change
+        rows.append((name, previous['value'], result['value'], change, change < -tolerance))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmarks do nó')
+    parser.add_argument('--blocks', default=DEFAULT_BLOCKS, type=int, help='Número de blocos sintéticos')
+    parser.add_argument('--transactions', default=DEFAULT_TRANSACTIONS, type=int, help='Transações por bloco')
+    parser.add_argument('--addresses', default=DEFAULT_ADDRESSES, type=int, help='Número de endereços (carteiras) da cadeia sintética')
+    parser.add_argument('--repeat', default=5, type=int, help='Execuções de cada medição (é usada a mediana)')
+    parser.add_argument('--proofs', default=50000, type=int, help='Provas por execução na medição da taxa de hashes')
+    parser.add_argument('--http-requests', default=50, type=int, help='Requisições por endpoint na medição de latência')
+    parser.add_argument('--seed', default=1, type=int, help='Semente da cadeia sintética')
+    parser.add_argument('--output', help='Grava os resultados em JSON neste arquivo')
+    parser.add_argument('--compare', help='Compara com resultados anteriores (JSON) e sai com erro se houver regressão')
+    parser.add_argument('--tolerance', default=DEFAULT_TOLERANCE, type=float, help='Piora relativa tolerada na comparação')
+    parser.add_argument('--memory', action='store_true', help='Executa apenas a medição de memória por bloco')
+    args = parser.parse_args()
+
+    if args.memory:
+        result = memory_benchmark(args.blocks, args.transactions)
+        print(f"Memória por bloco ({result['blocks']} blocos, {result['transactions_per_block']} transações cada):")
+        print(f"  dicionários: {result['dict_bytes_per_block']} bytes")
+        print(f"  compacto:    {result['compact_bytes_per_block']} bytes ({result['reduction']:.0%} menor)")
+        sys.exit(0)
+
+    report = run(args.blocks, args.transactions, args.addresses, args.repeat, args.proofs, args.http_requests, args.seed)
+    for name, result in report['results'].items():
+        print(f"{name:24} {result['value']:>14.2f} {result['unit']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados gravados em {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print(f"\nComparação com {args.compare} (tolerância {args.tolerance:.0%}):")
+        if baseline.get('params') != report['params']:
+            print("Aviso: os parâmetros das duas execuções são diferentes.")
+        for name, before, after, change, regressed in compare(baseline, report, args.tolerance):
+            regressions += regressed
+            print(f"{name:24} {before:>14.2f} -> {after:>14.2f} {change:+.1%}{'  REGRESSÃO' if regressed else ''}")
+        sys.exit(1 if regressions else 0)
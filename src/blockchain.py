@@ -1,24 +1,105 @@
+import os
 import time
+import threading
+from contextlib import contextmanager
 import json
 import hashlib
+from functools import lru_cache
 from urllib.parse import urlparse
 import requests
 from wallet import Wallet
 from transaction import Transaction, TxInput, TxOutput
+import codec
+from storage import open_storage, UTXOSnapshotStore, UndoLogStorage
+from miner import ProofOfWorkMiner, check_proof, MIN_DIFFICULTY, MAX_DIFFICULTY
+from validation import BatchVerifier, UtxoView, collect_signature_jobs, is_coinbase, valid_block_body, SIGNATURES_VERIFIED, MAX_BLOCK_SIZE
+from merkle import merkle_root, merkle_branch
+from peers import PeerClient
+from chainindex import ChainIndex
+from blocktree import BlockTree, BlockNode, block_work
+from compact import CompactBlock, to_plain
+from mempool import Mempool, transaction_size
+from assembler import BlockAssembler, DEFAULT_MAX_BLOCK_SIZE
+from chainstate import ChainState, ChainWriter, VersionedBalances
+from gossip import Gossip
+import metrics
+from metrics import timed
 
 # Constante para o endereço do bloco gênese
 GENESIS_ADDRESS = "CryptoMesh_Genesis_Address"
 
+# Campos do cabeçalho do bloco: o hash do bloco cobre apenas estes campos,
+# e as transações entram nele somente através da raiz de Merkle. `bits` é a
+# dificuldade com que o bloco foi minerado (ausente em blocos antigos)
+HEADER_FIELDS = ('index', 'timestamp', 'proof', 'previous_hash', 'merkle_root', 'bits')
+
+# Número máximo de cabeçalhos/blocos por página na sincronização entre nós
+SYNC_PAGE_SIZE = 500
+# Dificuldade do bloco gênese e dos primeiros blocos, antes do primeiro ajuste
+INITIAL_DIFFICULTY = 4
+# Quantos blocos a partir da ponta guardam dados para desfazer (reorganizações mais
+# profundas reconstroem o conjunto de UTXOs) e até onde ramos laterais são mantidos
+UNDO_DEPTH = 1000
+# Número máximo de cabeçalhos após o bloco da transação em uma prova de inclusão
+PROOF_MAX_HEADERS = 100
+# Resultados de add_block: rejeitado (falso), guardado em um ramo lateral, ou a ponta mudou
+BLOCK_REJECTED = 0
+BLOCK_SIDE_BRANCH = 1
+BLOCK_CONNECTED = 2
+
+CHAIN_OPERATION_SECONDS = metrics.histogram(
+    'cryptomesh_chain_operation_seconds',
+    'Duração das operações sobre a cadeia (conectar, persistir, reorganizar, regravar)',
+    ('operation',),
+)
+VERIFY_TRANSACTION_SECONDS = metrics.histogram('cryptomesh_verify_transaction_seconds', 'Duração da verificação de uma transação avulsa')
+
+def block_header(block):
+    """Retorna apenas o cabeçalho de um bloco (sem as transações)."""
+    return {field: block[field] for field in HEADER_FIELDS if field in block}
+
+@lru_cache(maxsize=4096)
+def _hash_header(header_items):
+    header_string = json.dumps(dict(header_items), sort_keys=True).encode()
+    return hashlib.sha256(header_string).hexdigest()
+
 class Blockchain:
-    def __init__(self, storage_path='blockchain.json', difficulty_adjustment_interval=10, block_generation_interval=10):
+    def __init__(self, storage_path='blockchain.json', difficulty_adjustment_interval=10, block_generation_interval=10, storage=None, snapshot_interval=100, mining_workers=1, validation_workers=1, peers=None, mempool_max_size=5000, max_block_size=DEFAULT_MAX_BLOCK_SIZE):
         self.storage_path = storage_path
+        self.storage = storage or open_storage(storage_path)
+        # Snapshots do conjunto de UTXOs a cada `snapshot_interval` blocos
+        self.snapshots = UTXOSnapshotStore(f'{os.path.splitext(storage_path)[0]}-utxo.json')
+        self.snapshot_interval = snapshot_interval
+        # Dados para desfazer os UNDO_DEPTH blocos mais recentes, para reorganizar após um reinício
+        self.undo_log = UndoLogStorage(f'{os.path.splitext(storage_path)[0]}-undo.log', keep=UNDO_DEPTH)
+        # Índices do explorador (hash -> altura, transação -> bloco, endereço -> transações)
+        self.index = ChainIndex(f'{os.path.splitext(storage_path)[0]}-index.sqlite')
         self.chain = []
-        self.mempool = []
+        # Árvore com todos os blocos conhecidos (cadeia ativa e ramos laterais)
+        self.tree = BlockTree()
+        self.tip = None
+        self.mempool = Mempool(max_size=mempool_max_size)
+        # O tamanho configurado só dimensiona os modelos de mineração, sem passar do limite de consenso
+        self.assembler = BlockAssembler(self.mempool, max_block_size=min(max_block_size, MAX_BLOCK_SIZE))
         self.nodes = set()
-        self.difficulty = 4
+        self.peers = peers or PeerClient()
+        # Anúncios por inventário e ids já vistos, para não reenviar nem reverificar itens
+        self.gossip = Gossip(self.peers)
+        self.difficulty = INITIAL_DIFFICULTY
         self.difficulty_adjustment_interval = difficulty_adjustment_interval
         self.block_generation_interval = block_generation_interval # in seconds
+        self.miner = ProofOfWorkMiner(workers=mining_workers)
+        self.verifier = BatchVerifier(workers=validation_workers)
+        # Serializa as mutações da cadeia e do mempool entre as requisições e a thread de mineração
+        self.lock = threading.RLock()
+        # Escritor único das mutações feitas pelo nó em execução e o retrato lido pelas requisições
+        self.writer = ChainWriter(self)
+        self.state = None
         self.utxo = {}
+        # Índice secundário das UTXOs por endereço e saldos acumulados,
+        # mantidos incrementalmente junto com self.utxo
+        self.utxo_by_address = {}
+        self.balances = VersionedBalances()
 
         self.load_chain()
 
@@ -31,47 +112,168 @@ class Blockchain:
         return genesis_block
 
     def load_chain(self):
-        """Carrega a blockchain do arquivo ou cria uma nova se não existir."""
-        try:
-            with open(self.storage_path, 'r') as f:
-                self.chain = json.load(f)
-            if not self.chain:
-                # Se o arquivo estiver vazio, cria o bloco gênese
-                self.create_genesis_block()
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Se o arquivo não existir ou for inválido, cria o bloco gênese
+        """Carrega a blockchain do armazenamento ou cria uma nova se não existir."""
+        self.chain = []
+        self.tree = BlockTree()
+        self.tip = None
+        for block in self.storage.load():
+            block = CompactBlock.from_dict(block)
+            self.chain.append(block)
+            self.tip = self.tree.insert(self._new_node(block, self.tip))
+            self.tip.validated = True
+        if not self.chain:
+            # Se o armazenamento estiver vazio ou inválido, cria o bloco gênese
             self.create_genesis_block()
-        
-        self._rebuild_utxo_set()
+
+        self.difficulty = self.tip.difficulty
+        self._restore_utxo_set()
+        self._restore_undo()
+        self._sync_index()
+        self.state = ChainState(self)
+
+    @contextmanager
+    def writing(self):
+        """Seção de escrita: serializa as mutações e, se a ponta mudou, publica um novo retrato da cadeia."""
+        with self.lock:
+            try:
+                yield
+            finally:
+                if self.state is None or self.state.tip is not self.tip:
+                    self.state = ChainState(self)
+
+    def _sync_index(self):
+        """Reindexa os blocos que divergem da cadeia carregada (ou que ainda não foram indexados)."""
+        height = min(self.index.height(), len(self.chain))
+        while height > 0 and self.index.block_hash(height) != self.hash(self.chain[height - 1]):
+            height -= 1
+        if height < len(self.chain) or self.index.height() > len(self.chain):
+            self.index.rebuild_from(self.chain, height + 1, self.hash)
+
+    def _restore_utxo_set(self):
+        """
+        Reconstrói o conjunto de UTXOs a partir do último snapshot compatível
+        com a cadeia atual, reaplicando apenas os blocos posteriores a ele.
+        Sem snapshot compatível, reaplica a cadeia inteira.
+        """
+        snapshot = self.snapshots.load()
+        height = snapshot['height'] if snapshot else 0
+        if not snapshot or not 0 < height <= len(self.chain) or self.hash(self.chain[height - 1]) != snapshot['hash']:
+            self._rebuild_utxo_set()
+            return
+
+        self.utxo = {}
+        self.utxo_by_address = {}
+        self.balances = VersionedBalances()
+        for utxo_key, output in snapshot['utxo'].items():
+            self._add_utxo(utxo_key, output)
+        for block in self.chain[height:]:
+            self._update_utxo_set(block)
+
+    def _restore_undo(self):
+        """Recupera do disco os dados para desfazer os blocos mais recentes que ainda conferem com a cadeia."""
+        for height, block_hash, undo in self.undo_log.load(len(self.chain) - UNDO_DEPTH):
+            if height <= len(self.chain) and self.hash(self.chain[height - 1]) == block_hash:
+                self.tree.get(block_hash).undo = undo
+
+    def save_utxo_snapshot(self):
+        """Persiste o conjunto de UTXOs atual, marcado com a altura e o hash do último bloco."""
+        self.snapshots.save(len(self.chain), self.hash(self.last_block), self.utxo)
+
+    def _maybe_save_utxo_snapshot(self):
+        if self.snapshot_interval and len(self.chain) % self.snapshot_interval == 0:
+            self.save_utxo_snapshot()
+
+    def verify_utxo_snapshot(self, repair=False):
+        """
+        Confere o snapshot persistido contra uma reaplicação completa da cadeia
+        até a mesma altura. Retorna None se não houver snapshot compatível.
+        Com `repair=True`, um snapshot divergente é descartado: o conjunto de
+        UTXOs é reconstruído do zero e um novo snapshot é gravado.
+        """
+        snapshot = self.snapshots.load()
+        if not snapshot or not 0 < snapshot['height'] <= len(self.chain):
+            return None
+        if self.hash(self.chain[snapshot['height'] - 1]) != snapshot['hash']:
+            return None
+
+        replay = Blockchain.__new__(Blockchain)
+        replay.chain = self.chain[:snapshot['height']]
+        replay._rebuild_utxo_set()
+        if replay.utxo == snapshot['utxo']:
+            return True
+
+        if repair:
+            self._rebuild_utxo_set()
+            self.save_utxo_snapshot()
+        return False
 
     def _rebuild_utxo_set(self):
         self.utxo = {}
+        self.utxo_by_address = {}
+        self.balances = VersionedBalances()
         for block in self.chain:
             self._update_utxo_set(block)
 
     def get_balance(self, address):
-        """Calcula e retorna o saldo de um endereço."""
-        balance = 0
-        for utxo_output in self.utxo.values():
-            if utxo_output['recipient_address'] == address:
-                balance += utxo_output['amount']
-        return balance
+        """Retorna o saldo de um endereço a partir do índice por endereço."""
+        return self.balances.get(address, 0)
 
     def _update_utxo_set(self, block):
+        """
+        Aplica um bloco ao conjunto de UTXOs. Retorna os dados para desfazê-lo:
+        para cada transação, as saídas (chave, saída) que ela gastou.
+        """
+        undo = []
         for tx in block['transactions']:
+            spent = []
             # Adiciona as novas saídas
             for i, output in enumerate(tx['outputs']):
-                self.utxo[f"{tx['id']}:{i}"] = output
+                self._add_utxo(f"{tx['id']}:{i}", output)
             # Remove as entradas gastas (ignorando transações coinbase)
             if tx['inputs'] and tx['inputs'][0]['transaction_id'] != '0':
                 for input_tx in tx['inputs']:
-                    spent_utxo_key = f"{input_tx['transaction_id']}:{input_tx['output_index']}"
-                    if spent_utxo_key in self.utxo:
-                        del self.utxo[spent_utxo_key]
+                    utxo_key = f"{input_tx['transaction_id']}:{input_tx['output_index']}"
+                    output = self._remove_utxo(utxo_key)
+                    if output is not None:
+                        spent.append((utxo_key, output))
+            undo.append(spent)
+        return undo
+
+    def _undo_utxo_set(self, block, undo):
+        """Desfaz `_update_utxo_set(block)`, da última transação para a primeira."""
+        for tx, spent in zip(reversed(block['transactions']), reversed(undo)):
+            for utxo_key, output in spent:
+                self._add_utxo(utxo_key, output)
+            for i in range(len(tx['outputs'])):
+                self._remove_utxo(f"{tx['id']}:{i}")
+
+    def _add_utxo(self, utxo_key, output):
+        if utxo_key in self.utxo:
+            self._remove_utxo(utxo_key)
+        address = output['recipient_address']
+        self.utxo[utxo_key] = output
+        self.utxo_by_address.setdefault(address, {})[utxo_key] = output
+        self.balances[address] = self.balances.get(address, 0) + output['amount']
+
+    def _remove_utxo(self, utxo_key):
+        output = self.utxo.pop(utxo_key, None)
+        if output is None:
+            return None
+        address = output['recipient_address']
+        owned = self.utxo_by_address[address]
+        del owned[utxo_key]
+        if owned:
+            self.balances[address] -= output['amount']
+        else:
+            # Sem saídas restantes: descarta as entradas para não acumular erro de arredondamento
+            del self.utxo_by_address[address]
+            del self.balances[address]
+        return output
 
+    @timed(CHAIN_OPERATION_SECONDS, operation='save_chain')
     def save_chain(self):
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.chain, f, indent=2)
+        """Regrava a cadeia inteira no armazenamento (usado quando a cadeia é substituída)."""
+        self.storage.rewrite(self.chain)
 
     def register_node(self, address):
         """
@@ -90,140 +292,538 @@ class Blockchain:
 
     def valid_chain(self, chain):
         """
-        Determina se uma dada blockchain é válida
-        """
-        last_block = chain[0]
-        current_index = 1
+        Determina se uma dada blockchain é válida.
 
-        while current_index < len(chain):
-            block = chain[current_index]
-            # Verifica se o hash do bloco está correto
-            if block['previous_hash'] != self.hash(last_block):
+        A validação é feita em fases, da mais barata para a mais cara, e para
+        na primeira falha: encadeamento dos hashes, provas de trabalho de todos
+        os blocos (verificadas em paralelo), conjunto de UTXOs e, por fim, as
+        assinaturas de todas as transações (verificadas em lote, em paralelo).
+        """
+        # Verifica o encadeamento dos hashes e a dificuldade declarada em cada
+        # bloco, recalculando a dificuldade exigida ao longo da própria cadeia
+        nodes = []
+        parent = None
+        for block in chain:
+            if parent is not None:
+                if block['previous_hash'] != parent.hash or block['index'] != parent.height + 1:
+                    return False
+                # Depois do primeiro bloco com raiz de Merkle, não são aceitos blocos legados
+                if 'merkle_root' in parent.block and 'merkle_root' not in block:
+                    return False
+            if not self._valid_bits(block, parent):
                 return False
+            parent = self._new_node(block, parent)
+            nodes.append(parent)
+
+        # Verifica se as Provas de Trabalho estão corretas, cada uma com o alvo do seu bloco
+        proof_jobs = [
+            (nodes[i - 1].block['proof'], chain[i]['proof'], nodes[i - 1].hash, nodes[i - 1].difficulty)
+            for i in range(1, len(chain))
+        ]
+        if not self.verifier.verify_proofs(proof_jobs):
+            return False
 
-            # Verifica se a Prova de Trabalho é correta
-            last_block_hash = self.hash(last_block)
-            if not self.valid_proof(last_block['proof'], block['proof'], last_block_hash):
+        # Reaplica as transações sobre um conjunto de UTXOs próprio da cadeia recebida
+        view = UtxoView()
+        signature_jobs = []
+        for block in chain:
+            jobs = self._check_block_transactions(block, view)
+            if jobs is None:
                 return False
+            signature_jobs.extend(jobs)
 
-            last_block = block
-            current_index += 1
+        return self.verifier.verify_signatures(signature_jobs)
 
-        return True
+    def _check_block_transactions(self, block, view):
+        """
+        Aplica as transações de um bloco sobre `view` (um UtxoView), conferindo
+        entradas e valores. Retorna as assinaturas a verificar, ou None se
+        alguma transação for inválida.
+
+        As saídas de cada transação entram na visão logo depois dela: uma
+        transação pode gastar a saída de outra anterior no mesmo bloco (como
+        nos pacotes pai e filho do mempool), mas uma saída gasta sai da visão,
+        então gastá-la de novo no bloco é rejeitado.
+        """
+        if not valid_block_body(block):
+            return None
+        if sum(transaction_size(tx) for tx in block['transactions']) > MAX_BLOCK_SIZE:
+            return None
+
+        signature_jobs = []
+        for tx in block['transactions']:
+            if not is_coinbase(tx):
+                jobs = collect_signature_jobs(tx, view.get)
+                if jobs is None:
+                    return None
+                signature_jobs.extend(jobs)
+                for input_tx in tx['inputs']:
+                    view.spend(f"{input_tx['transaction_id']}:{input_tx['output_index']}")
+            for i, output in enumerate(tx['outputs']):
+                view.add(f"{tx['id']}:{i}", output)
+        return signature_jobs
 
     def resolve_conflicts(self):
         """
         Este é o nosso algoritmo de consenso, ele resolve conflitos
-        substituindo nossa cadeia pela mais longa da rede.
-        """
-        neighbours = self.nodes
-        new_chain = None
-
-        # Estamos apenas procurando por cadeias mais longas que a nossa
-        max_length = len(self.chain)
+        adotando a cadeia com mais trabalho acumulado da rede.
 
-        # Pega e verifica as cadeias de todos os nós da nossa rede
-        for node in neighbours:
+        A sincronização é feita primeiro por cabeçalhos: o nó localiza o ponto
+        de bifurcação com cada vizinho e baixa apenas os blocos que faltam.
+        """
+        # Consulta em paralelo apenas o comprimento e o trabalho da cadeia de cada vizinho
+        responses = self.peers.get_many(list(self.nodes), '/headers', {'from': 0, 'limit': 0})
+        candidates = []
+        for node, response in responses.items():
+            if response is None or response.status_code != 200:
+                continue
+            try:
+                info = response.json()
+                peer_work, peer_length = info['work'], info['length']
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ignorando o vizinho {node}: resposta inválida ({e!r}).")
+                continue
+            if isinstance(peer_work, int) and isinstance(peer_length, int) and peer_work > self.tip.work:
+                candidates.append((peer_work, peer_length, node))
+        candidates.sort(reverse=True)
+
+        # Sincroniza começando pelo vizinho com mais trabalho declarado (conferido nos cabeçalhos)
+        replaced = False
+        for peer_work, peer_length, node in candidates:
+            if peer_work <= self.tip.work:
+                break
             try:
-                response = requests.get(f'http://{node}/chain')
-                if response.status_code == 200:
-                    length = response.json()['length']
-                    chain = response.json()['chain']
-
-                    # Verifica se o comprimento é maior e se a cadeia é válida
-                    if length > max_length and self.valid_chain(chain):
-                        max_length = length
-                        new_chain = chain
-            except requests.exceptions.ConnectionError:
+                replaced = self._sync_with(node, peer_length) or replaced
+            except requests.exceptions.RequestException:
                 # Ignora nós que não estão respondendo
                 pass
+            except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+                # Cabeçalhos ou blocos malformados (JSON inválido, campos faltando, binário
+                # que não decodifica): segue para o próximo vizinho
+                print(f"Ignorando o vizinho {node}: resposta inválida ({e!r}).")
+        return replaced
+
+    def headers(self, start=0, limit=SYNC_PAGE_SIZE, chain=None):
+        """Cabeçalhos dos blocos a partir da posição `start` (0 = gênese), com os respectivos hashes."""
+        chain = self.chain if chain is None else chain
+        return [dict(block_header(block), hash=self.hash(block)) for block in chain[start:start + limit]]
+
+    def iter_blocks(self, start=0, stop=None):
+        """
+        Gera os blocos [start, stop) do retrato publicado da cadeia. O retrato
+        é fixado na chamada: blocos conectados e reorganizações posteriores
+        não afetam uma leitura em andamento.
+        """
+        chain = self.state.chain
+        return (chain[i] for i in range(len(chain))[start:stop])
 
-        # Substitui nossa cadeia se descobrirmos uma nova cadeia válida mais longa
-        if new_chain:
-            self.chain = new_chain
-            self.save_chain()
-            self._rebuild_utxo_set()
-            return True
+    def _sync_with(self, node, peer_length):
+        fork_point = self._find_fork_point(node, peer_length)
+        headers = self._fetch_range(node, '/headers', 'headers', fork_point, peer_length)
+        if headers is None:
+            return False
+        # Só baixa os blocos se os cabeçalhos forem válidos e somarem mais trabalho que a cadeia ativa
+        peer_tip = self._valid_headers(headers, fork_point)
+        if peer_tip is None or peer_tip.work <= self.tip.work:
+            return False
 
-        return False
+        blocks = self._fetch_range(node, '/blocks', 'blocks', fork_point, peer_length)
+        if blocks is None or [self.hash(block) for block in blocks] != [header['hash'] for header in headers]:
+            return False
 
-    def new_block(self, proof, previous_hash=None):
+        return self.writer.call(self._adopt_blocks, blocks)
+
+    def _adopt_blocks(self, blocks):
+        # Os blocos entram na árvore a partir do ponto de bifurcação; quando o
+        # ramo do vizinho passa a ter mais trabalho, add_block reorganiza a cadeia
+        old_tip = self.tip
+        root = None
+        for block in blocks:
+            if self.hash(block) in self.tree:
+                continue
+            if block['index'] == 1 and block['previous_hash'] not in self.tree:
+                # Gênese diferente do nosso: os cabeçalhos do ramo já mostraram mais trabalho
+                if not self._valid_bits(block, None) or not valid_block_body(block):
+                    break
+                root = self.tree.insert(self._new_node(CompactBlock.from_dict(block), None))
+            elif not self.add_block(block):
+                break
+        if root is not None and self.tip is old_tip:
+            # O ramo do outro gênese não foi adotado: não fica na árvore
+            self.tree.remove_subtree(root)
+        return self.tip is not old_tip
+
+    def _find_fork_point(self, node, peer_length):
+        """
+        Retorna quantos blocos iniciais temos em comum com o vizinho, buscando
+        seus cabeçalhos de trás para frente em janelas de tamanho crescente.
+        """
+        end = min(len(self.chain), peer_length)
+        window = 16
+        while end > 0:
+            start = max(0, end - window)
+            headers = self._fetch_range(node, '/headers', 'headers', start, end) or []
+            for offset in reversed(range(len(headers))):
+                if headers[offset]['hash'] == self.hash(self.chain[start + offset]):
+                    return start + offset + 1
+            end = start
+            window *= 2
+        return 0
+
+    def _valid_headers(self, headers, fork_point):
         """
-        Cria um novo bloco e o adiciona à blockchain
+        Confere encadeamento, dificuldade declarada e provas de trabalho dos
+        cabeçalhos baixados, antes de baixar os blocos. Retorna o nó (fora
+        da árvore) do último cabeçalho, com o trabalho acumulado, ou None.
         """
+        parent = self.tree.get(self.hash(self.chain[fork_point - 1])) if fork_point > 0 else None
+        proof_jobs = []
+        for header in headers:
+            # O hash de cabeçalhos com raiz de Merkle pode ser recalculado sem as transações
+            if 'merkle_root' in header and self.hash(header) != header['hash']:
+                return None
+            if parent is not None:
+                if header['previous_hash'] != parent.hash or header['index'] != parent.height + 1:
+                    return None
+                proof_jobs.append((parent.block['proof'], header['proof'], parent.hash, parent.difficulty))
+            if not self._valid_bits(header, parent):
+                return None
+            parent = self._new_node(header, parent, header['hash'])
+        return parent if self.verifier.verify_proofs(proof_jobs) else None
+
+    def _fetch_range(self, node, path, key, start, end):
+        """Baixa, em páginas, os itens [start, end) de um endpoint paginado do vizinho."""
+        items = []
+        while start + len(items) < end:
+            page = self._fetch_page(node, path, key, {'from': start + len(items), 'limit': min(SYNC_PAGE_SIZE, end - start - len(items))})
+            if not page:
+                return None
+            items.extend(page)
+        return items[:end - start]
+
+    def _fetch_page(self, node, path, key, params):
+        # Prefere o formato binário compacto; endpoints sem suporte a ele respondem em JSON
+        response = self.peers.get(node, path, params, headers={'Accept': f'{codec.BINARY_MIMETYPE}, application/json;q=0.9'})
+        if response.status_code != 200:
+            return None
+        if response.headers.get('Content-Type', '').startswith(codec.BINARY_MIMETYPE):
+            return codec.decode_blocks(response.content)
+        return response.json()[key]
+
+    def _fetch_json(self, node, path, params):
+        response = self.peers.get(node, path, params)
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    def new_block(self, proof, previous_hash=None, transactions=None):
+        """
+        Cria um novo bloco e o adiciona à blockchain.
+        Sem `transactions`, o bloco leva todo o mempool.
+        """
+        if transactions is None:
+            transactions = list(self.mempool)
         block = {
             'index': len(self.chain) + 1,
             'timestamp': time.time(),
-            'transactions': self.mempool,
+            'transactions': transactions,
             'proof': proof,
             'previous_hash': previous_hash or self.hash(self.chain[-1]),
+            'merkle_root': merkle_root([tx['id'] for tx in transactions]),
+            'bits': self.difficulty,
         }
 
-        self.chain.append(block)
-        self._update_utxo_set(block)
-        self._adjust_difficulty()
-        self.save_chain() # Salva a cadeia após adicionar um novo bloco
-        
-        # Reseta a lista de transações atuais
-        self.mempool = []
+        # Na memória, a cadeia guarda a forma compacta do bloco
+        block = CompactBlock.from_dict(block)
+        node = self._new_node(block, self.tip)
+        self._connect_block(node)
+        self.tree.insert(node)
+        self._block_connected(block)
         return block
 
     def add_block(self, block):
         """
-        Adiciona um bloco recebido de outro nó à cadeia, após validação.
+        Adiciona um bloco recebido de outro nó, após validação.
+
+        Um bloco que estende a ponta é validado por completo e conectado. Um
+        bloco sobre outro ponto da árvore fica em um ramo lateral, validado
+        apenas no formato e na prova de trabalho; se esse ramo passar a ter
+        mais trabalho acumulado que a cadeia ativa, a cadeia é reorganizada.
+
+        Retorna BLOCK_CONNECTED se a ponta mudou, BLOCK_SIDE_BRANCH se o bloco
+        ficou em um ramo lateral e BLOCK_REJECTED (falso) se ele for inválido,
+        repetido ou de pai desconhecido. Um gênese diferente do nosso só entra
+        pela sincronização (`_adopt_blocks`), depois que os cabeçalhos do seu
+        ramo mostraram mais trabalho.
+
+        O hash não cobre as assinaturas: um bloco de ramo lateral ainda não
+        conectado pode ser uma cópia forjada do verdadeiro, então outro bloco
+        com o mesmo hash e conteúdo diferente o substitui.
         """
-        previous_block = self.last_block
+        block_hash = self.hash(block)
+        existing = self.tree.get(block_hash)
+        if existing is not None and (existing.validated or to_plain(existing.block) == to_plain(block)):
+            return BLOCK_REJECTED
+        parent = self.tree.get(block['previous_hash'])
+        if parent is None or block['index'] != parent.height + 1:
+            return BLOCK_REJECTED
+
+        # Blocos novos precisam ter raiz de Merkle (o hash não cobre as transações sem ela)
+        if 'merkle_root' not in block:
+            return BLOCK_REJECTED
+
+        # Verifica se a prova de trabalho é válida para a dificuldade exigida pelo histórico do ramo
+        if not self._valid_bits(block, parent):
+            return BLOCK_REJECTED
+        if not check_proof(parent.block['proof'], block['proof'], parent.hash, parent.difficulty):
+            return BLOCK_REJECTED
+        if not valid_block_body(block):
+            return BLOCK_REJECTED
+
+        block = CompactBlock.from_dict(block)
+        if existing is not None:
+            existing.block = block
+            node = existing
+        else:
+            node = self._new_node(block, parent, block_hash)
+        if parent is not self.tip:
+            self.tree.insert(node)
+            if node.work > self.tip.work:
+                return BLOCK_CONNECTED if self._reorganize(node) else BLOCK_REJECTED
+            return BLOCK_SIDE_BRANCH
+
+        # Verifica todas as transações no bloco (entradas e valores primeiro, assinaturas em lote)
+        if not self._connect_block(node, validate=True):
+            return BLOCK_REJECTED
+        self.tree.insert(node)
+        self._block_connected(block)
+        return BLOCK_CONNECTED
+
+    def _new_node(self, block, parent, block_hash=None):
+        """Cria o nó da árvore para `block`, calculando a dificuldade exigida dos filhos e o trabalho acumulado."""
+        block_hash = block_hash or self.hash(block)
+        if parent is None:
+            return BlockNode(block_hash, block, None, INITIAL_DIFFICULTY, 0)
+        node = BlockNode(block_hash, block, parent, parent.difficulty, parent.work + block_work(parent.difficulty))
+        node.difficulty = self._next_difficulty(node)
+        return node
 
-        # Verifica se o previous_hash do bloco recebido é o hash do último bloco da nossa cadeia
-        if block['previous_hash'] != self.hash(previous_block):
-            return False
+    @staticmethod
+    def _valid_bits(block, parent):
+        """Confere a dificuldade declarada no cabeçalho com a exigida pelo histórico do ramo (`parent`: nó do pai)."""
+        if 'bits' in block:
+            return block['bits'] == (parent.difficulty if parent else INITIAL_DIFFICULTY)
+        # Depois do primeiro bloco com a dificuldade no cabeçalho, ela passa a ser obrigatória
+        return parent is None or 'bits' not in parent.block
+
+    def _next_difficulty(self, node):
+        """
+        Ajusta a dificuldade da mineração a cada DIFFICULTY_ADJUSTMENT_INTERVAL blocos,
+        com base no tempo gasto pelos últimos blocos do ramo do nó.
+        """
+        difficulty = node.parent.difficulty
+        if node.height % self.difficulty_adjustment_interval != 0:
+            return difficulty
 
-        # Verifica se a prova de trabalho é válida
-        if not self.valid_proof(previous_block['proof'], block['proof'], self.hash(previous_block)):
-            return False
+        last_adjustment_block = node.ancestor(node.height - self.difficulty_adjustment_interval + 1).block
+        actual_time = node.block['timestamp'] - last_adjustment_block['timestamp']
+        expected_time = self.difficulty_adjustment_interval * self.block_generation_interval
 
-        # Verifica todas as transações no bloco
-        for tx in block['transactions']:
-            if not self.verify_transaction(tx):
+        if actual_time < expected_time / 2:
+            return min(MAX_DIFFICULTY, difficulty + 1)
+        if actual_time > expected_time * 2:
+            return max(MIN_DIFFICULTY, difficulty - 1)
+        return difficulty
+
+    @timed(CHAIN_OPERATION_SECONDS, operation='connect_block')
+    def _connect_block(self, node, validate=False):
+        """
+        Conecta o bloco do nó na ponta da cadeia ativa (memória e UTXOs). Com
+        `validate`, confere antes as transações contra o conjunto de UTXOs.
+        """
+        block = node.block
+        if validate:
+            signature_jobs = self._check_block_transactions(block, UtxoView(self.utxo))
+            if signature_jobs is None or not self.verifier.verify_signatures(signature_jobs):
                 return False
 
         self.chain.append(block)
-        self._update_utxo_set(block)
-        self._adjust_difficulty()
-        self.save_chain()
-
-        # Limpa o mempool de transações que já estão no bloco recebido
-        self.mempool = [tx for tx in self.mempool if tx not in block['transactions']]
+        node.undo = self._update_utxo_set(block)
+        node.validated = True
+        self.tip = node
+        self.difficulty = node.difficulty
+
+        # Mantém os dados para desfazer apenas dos blocos mais recentes
+        if len(self.chain) > UNDO_DEPTH:
+            old = self.tree.get(self.hash(self.chain[-UNDO_DEPTH - 1]))
+            if old is not None:
+                old.undo = None
+        if len(self.chain) % 100 == 0:
+            self.tree.prune(lambda n: self.block_by_height(n.height) is n.block, len(self.chain) - UNDO_DEPTH)
         return True
 
-    def _adjust_difficulty(self):
+    def _disconnect_tip(self):
+        """Desconecta o bloco da ponta usando os dados para desfazê-lo. Retorna o bloco."""
+        node = self.tip
+        self._undo_utxo_set(node.block, node.undo)
+        node.undo = None
+        self.chain.pop()
+        self.tip = node.parent
+        self.difficulty = self.tip.difficulty if self.tip else INITIAL_DIFFICULTY
+        return node.block
+
+    def _rewind_to(self, ancestor):
         """
-        Ajusta a dificuldade da mineração a cada DIFFICULTY_ADJUSTMENT_INTERVAL blocos.
+        Desconecta os blocos acima de `ancestor` (None: todos). Retorna os blocos
+        desconectados, da ponta para baixo. Sem dados para desfazer algum
+        deles, a cadeia é cortada e o conjunto de UTXOs é reconstruído.
         """
-        # O bloco gênese não conta para o ajuste
-        if len(self.chain) % self.difficulty_adjustment_interval != 0 or len(self.chain) == 0:
-            return
+        path = self.tree.path(ancestor, self.tip)
+        if path:
+            # Os retratos publicados compartilham a lista da cadeia: os blocos saem de uma cópia
+            self.chain = list(self.chain)
+        if all(node.undo is not None for node in path):
+            return [self._disconnect_tip() for _ in path]
+
+        height = ancestor.height if ancestor else 0
+        disconnected = self.chain[height:][::-1]
+        del self.chain[height:]
+        self.tip = ancestor
+        self.difficulty = ancestor.difficulty if ancestor else INITIAL_DIFFICULTY
+        self._rebuild_utxo_set()
+        for node in path:
+            node.undo = None
+        return disconnected
 
-        last_adjustment_block = self.chain[-self.difficulty_adjustment_interval]
-        current_block = self.last_block
+    @timed(CHAIN_OPERATION_SECONDS, operation='reorganize')
+    def _reorganize(self, new_tip):
+        """
+        Troca a cadeia ativa pelo ramo terminado em `new_tip`: desconecta só os
+        blocos acima do ancestral comum e conecta os do novo ramo. Se algum
+        bloco do novo ramo for inválido, ele e seus descendentes saem da
+        árvore e a cadeia anterior é restaurada.
+        """
+        # Sem ancestral comum (gêneses diferentes), a cadeia inteira é trocada
+        fork = self.tree.common_ancestor(self.tip, new_tip)
+        fork_height = fork.height if fork else 0
+        disconnected = self._rewind_to(fork)
+        path = self.tree.path(fork, new_tip)
+
+        for node in path:
+            if not self._connect_block(node, validate=True):
+                self.tree.remove_subtree(node)
+                self._rewind_to(fork)
+                for block in reversed(disconnected):
+                    self._connect_block(self.tree.get(self.hash(block)))
+                return False
 
-        actual_time = current_block['timestamp'] - last_adjustment_block['timestamp']
-        expected_time = self.difficulty_adjustment_interval * self.block_generation_interval
+        # Persiste apenas a diferença: corta o log no ancestral comum e anexa o novo ramo
+        self.storage.truncate(fork_height)
+        self.undo_log.truncate(fork_height)
+        for node in path:
+            self.storage.append(node.block)
+            if node.undo is not None:
+                self.undo_log.append(node.height, node.hash, node.undo)
+            self.mempool.remove_for_block(node.block)
+        self.index.rebuild_from(self.chain, fork_height + 1, self.hash)
+        self._maybe_save_utxo_snapshot()
+        self._return_to_mempool(reversed(disconnected))
+        return True
 
-        if actual_time < expected_time / 2:
-            self.difficulty += 1
-        elif actual_time > expected_time * 2:
-            self.difficulty = max(1, self.difficulty - 1)
+    @timed(CHAIN_OPERATION_SECONDS, operation='persist_block')
+    def _block_connected(self, block):
+        """Persiste e indexa um bloco recém-conectado na ponta e atualiza o mempool."""
+        self.storage.append(block) # Anexa apenas o novo bloco ao armazenamento
+        self.undo_log.append(self.tip.height, self.tip.hash, self.tip.undo)
+        self._maybe_save_utxo_snapshot()
+        self.index.connect_block(block, self.hash(block), self.block_by_height)
+
+        # Remove do mempool as transações incluídas no bloco (e as que conflitam com elas)
+        self.mempool.remove_for_block(block)
+
+    def _return_to_mempool(self, blocks):
+        """
+        Devolve ao mempool as transações de blocos desconectados que não estão
+        na nova cadeia, e descarta as pendentes que deixaram de ser válidas
+        (ex: gastavam uma coinbase desconectada).
+        """
+        for block in blocks:
+            for tx in block['transactions']:
+                if is_coinbase(tx) or tx['id'] in self.mempool or self.index.transaction_location(tx['id']):
+                    continue
+                tx = to_plain(tx)
+                if not self.mempool.conflicts(tx) and self.verify_transaction(tx):
+                    self.mempool.add(tx, self.get_transaction_fee(tx))
+
+        for tx in list(self.mempool):
+            if is_coinbase(tx):
+                continue
+            for input_tx in tx['inputs']:
+                if self._lookup_output(f"{input_tx['transaction_id']}:{input_tx['output_index']}") is None:
+                    self.mempool.remove(tx['id'], with_descendants=True)
+                    break
+
+    def block_by_height(self, height):
+        """Bloco na altura informada (o gênese tem altura 1), ou None."""
+        if 1 <= height <= len(self.chain):
+            return self.chain[height - 1]
+        return None
+
+    def block_by_hash(self, block_hash):
+        height = self.index.block_height(block_hash)
+        block = self.block_by_height(height) if height else None
+        return block if block and self.hash(block) == block_hash else None
+
+    def find_transaction(self, txid):
+        """Retorna (bloco, posição da transação no bloco) de uma transação confirmada, ou None."""
+        location = self.index.transaction_location(txid)
+        if location is None:
+            return None
+        block = self.block_by_height(location[0])
+        if block is None or location[1] >= len(block['transactions']) or block['transactions'][location[1]]['id'] != txid:
+            return None
+        return block, location[1]
+
+    def transaction_proof(self, txid, max_headers=PROOF_MAX_HEADERS):
+        """
+        Prova de inclusão de uma transação confirmada, para clientes leves: a
+        transação, o ramo de Merkle até a raiz do bloco e os cabeçalhos do pai
+        do bloco até a ponta (no máximo `max_headers` após o bloco), que
+        permitem conferir o encadeamento e as provas de trabalho.
+        Retorna None se a transação não estiver confirmada ou se o bloco não
+        tiver raiz de Merkle.
+        """
+        with self.lock:
+            found = self.find_transaction(txid)
+            if found is None or 'merkle_root' not in found[0]:
+                return None
+            block, position = found
+            height = block['index']
+            return {
+                'transaction': block['transactions'][position],
+                'height': height,
+                'position': position,
+                'branch': merkle_branch([tx['id'] for tx in block['transactions']], position),
+                'headers': self.headers(max(0, height - 2), min(height, 2) + max_headers),
+                'length': len(self.chain),
+            }
+
+    def address_history(self, address, start=0, limit=50):
+        """Transações confirmadas que envolvem o endereço, da mais recente para a mais antiga, e o total."""
+        return self.index.address_history(address, start, limit)
 
     def _find_spendable_outputs(self, owner_address, amount_needed):
         spendable_outputs = []
         accumulated_amount = 0
-        for utxo_key, utxo_output in self.utxo.items():
-            if utxo_output['recipient_address'] == owner_address:
-                accumulated_amount += utxo_output['amount']
-                spendable_outputs.append(utxo_key)
-                if accumulated_amount >= amount_needed:
-                    break
+        # Percorre apenas as UTXOs do próprio dono, via índice por endereço
+        for utxo_key, utxo_output in self.utxo_by_address.get(owner_address, {}).items():
+            # Ignora saídas já gastas por transações pendentes no mempool
+            if self.mempool.is_spent(utxo_key):
+                continue
+            accumulated_amount += utxo_output['amount']
+            spendable_outputs.append(utxo_key)
+            if accumulated_amount >= amount_needed:
+                break
         return accumulated_amount, spendable_outputs
 
     def new_utxo_transaction(self, wallet, recipient_address, amount, fee=0.0):
@@ -253,38 +853,72 @@ class Blockchain:
         # Agora, a transação é assinada
         signed_tx = self.sign_transaction(wallet, unsigned_tx)
 
-        self.mempool.append(signed_tx.to_dict())
+        if not self.mempool.add(signed_tx.to_dict(), fee):
+            raise ValueError("Transação recusada pelo mempool (cheio ou em conflito)")
         return signed_tx
 
     def get_transaction_fee(self, tx_dict):
         """Calcula a taxa de uma transação."""
         # Ignora transações coinbase
-        if not tx_dict['inputs'] or tx_dict['inputs'][0]['transaction_id'] == '0':
+        if is_coinbase(tx_dict):
             return 0.0
 
         total_input_value = 0
         for input_tx_dict in tx_dict['inputs']:
             utxo_key = f"{input_tx_dict['transaction_id']}:{input_tx_dict['output_index']}"
             # Assume que a transação já foi verificada, então a UTXO existe
-            if utxo_key in self.utxo:
-                total_input_value += self.utxo[utxo_key]['amount']
+            output = self._lookup_output(utxo_key)
+            if output is not None:
+                total_input_value += output['amount']
 
         total_output_value = sum(output['amount'] for output in tx_dict['outputs'])
         
         return total_input_value - total_output_value
 
-    def new_coinbase_transaction(self, recipient_address, fees=0.0):
-        """Cria a transação de mineração (coinbase)."""
-        # A entrada da transação coinbase é especial
-        coinbase_input = TxInput(transaction_id='0', output_index=-1)
+    def _lookup_output(self, utxo_key):
+        """Busca uma saída não gasta confirmada ou criada por uma transação pendente no mempool."""
+        output = self.utxo.get(utxo_key)
+        if output is None:
+            output = self.mempool.output(utxo_key)
+        return output
+
+    def create_coinbase_transaction(self, recipient_address, fees=0.0):
+        """Cria a transação de mineração (coinbase) do próximo bloco."""
+        # A entrada da transação coinbase é especial: o índice da saída carrega a
+        # altura do bloco, para que coinbases de blocos diferentes tenham ids diferentes
+        coinbase_input = TxInput(transaction_id='0', output_index=len(self.chain) + 1)
         # A recompensa de mineração é 1 + taxas
         block_reward = 1.0 + fees
         coinbase_output = TxOutput(recipient_address, block_reward)
         
-        tx = Transaction(inputs=[coinbase_input], outputs=[coinbase_output])
-        self.mempool.append(tx.to_dict())
+        return Transaction(inputs=[coinbase_input], outputs=[coinbase_output])
+
+    def new_coinbase_transaction(self, recipient_address, fees=0.0):
+        """Cria a transação de mineração (coinbase) e a adiciona ao mempool."""
+        tx = self.create_coinbase_transaction(recipient_address, fees)
+        self.mempool.add(tx.to_dict())
         return tx
 
+    def block_template(self, reward_address):
+        """
+        Monta o modelo do próximo bloco: a coinbase (recompensa + taxas)
+        seguida das transações do mempool escolhidas pelo BlockAssembler.
+        `fees` traz a taxa de cada transação escolhida, já calculada no mempool.
+        """
+        entries, size = self.assembler.select()
+        total_fees = sum(entry.fee for entry in entries)
+        coinbase = self.create_coinbase_transaction(reward_address, total_fees)
+        return {
+            'index': len(self.chain) + 1,
+            'previous_hash': self.hash(self.last_block),
+            'bits': self.difficulty,
+            'transactions': [coinbase.to_dict()] + [entry.tx for entry in entries],
+            'total_fees': total_fees,
+            'fees': {entry.tx['id']: entry.fee for entry in entries},
+            'size': size,
+            'max_size': self.assembler.max_block_size,
+        }
+
     def sign_transaction(self, wallet, tx):
         """Assina uma transação e retorna uma nova transação com as assinaturas."""
         tx_hash = tx.calculate_hash()
@@ -296,55 +930,38 @@ class Blockchain:
 
         return Transaction(signed_inputs, tx.outputs)
 
+    @timed(VERIFY_TRANSACTION_SECONDS)
     def verify_transaction(self, tx_dict):
         """Verifica se uma transação é válida."""
         # Transações coinbase não precisam de verificação de entrada
-        if not tx_dict['inputs'] or tx_dict['inputs'][0]['transaction_id'] == '0':
+        if is_coinbase(tx_dict):
             return True
 
-        # Recria a transação a partir do dicionário para calcular o hash
-        tx_for_hash = Transaction(
-            [TxInput.from_dict(i) for i in tx_dict['inputs']],
-            [TxOutput.from_dict(o) for o in tx_dict['outputs']]
-        )
-        tx_hash = tx_for_hash.calculate_hash()
-
-        total_input_value = 0
-        for i, input_tx_dict in enumerate(tx_dict['inputs']):
-            utxo_key = f"{input_tx_dict['transaction_id']}:{input_tx_dict['output_index']}"
-            
-            # 1. Verifica se a UTXO que está sendo gasta realmente existe
-            if utxo_key not in self.utxo:
-                print(f"Erro de verificação: UTXO {utxo_key} não encontrada.")
-                return False
+        # Entradas podem gastar saídas confirmadas ou de transações pendentes no mempool
+        signature_jobs = collect_signature_jobs(tx_dict, self._lookup_output)
+        if signature_jobs is None:
+            return False
 
-            utxo = self.utxo[utxo_key]
-            total_input_value += utxo['amount']
-            
-            # 2. Verifica a assinatura
-            # A chave pública do dono da UTXO é o endereço do destinatário da saída original
-            public_key = utxo['recipient_address']
-            signature = input_tx_dict['signature']
+        SIGNATURES_VERIFIED.inc(len(signature_jobs))
+        for i, (public_key, signature, tx_hash) in enumerate(signature_jobs):
             if not Wallet.verify_signature(public_key, signature, tx_hash):
                 print(f"Erro de verificação: Assinatura inválida para a entrada {i}.")
                 return False
 
-        # 3. Verifica se a soma das entradas é maior ou igual à soma das saídas
-        total_output_value = sum(output['amount'] for output in tx_dict['outputs'])
-        if total_input_value < total_output_value:
-            print(f"Erro de verificação: Valor de entrada ({total_input_value}) é menor que o de saída ({total_output_value}).")
-            return False
-
         return True
 
     @staticmethod
     def hash(block):
         """
-        Cria um hash SHA-256 de um bloco
+        Cria um hash SHA-256 do cabeçalho de um bloco.
+        O cabeçalho tem tamanho fixo, e o hash é memorizado por cabeçalho.
         """
-        # Precisamos garantir que o dicionário esteja ordenado ou teremos hashes inconsistentes
-        block_string = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        if 'merkle_root' not in block:
+            # Blocos legados, anteriores à raiz de Merkle, são hasheados por inteiro
+            # Precisamos garantir que o dicionário esteja ordenado ou teremos hashes inconsistentes
+            block_string = json.dumps(to_plain(block), sort_keys=True).encode()
+            return hashlib.sha256(block_string).hexdigest()
+        return _hash_header(tuple((field, block[field]) for field in HEADER_FIELDS if field in block))
 
     @property
     def last_block(self):
@@ -355,25 +972,17 @@ class Blockchain:
         # O alvo é um número de 256 bits, representado como um hexadecimal
         # A dificuldade representa o número de bits zerados no início do hash
         # Ex: Dificuldade 4 significa que o hash deve começar com 0000...
-        target = 2**(256 - self.difficulty)
-        return f'{target:064x}'
+        return f'{ProofOfWorkMiner.target_for(self.difficulty):064x}'
 
     def proof_of_work(self, last_block):
         """
         Encontra uma prova de trabalho que satisfaça o alvo de dificuldade.
+        Retorna None se a mineração for cancelada (ver `ProofOfWorkMiner.cancel`).
         """
-        last_proof = last_block['proof']
-        last_hash = self.hash(last_block)
-        proof = 0
-        while self.valid_proof(last_proof, proof, last_hash) is False:
-            proof += 1
-
-        return proof
+        return self.miner.mine(last_block['proof'], self.hash(last_block), self.difficulty)
 
     def valid_proof(self, last_proof, proof, last_hash):
         """
         Valida a prova: o hash(last_proof, proof, last_hash) é menor que o alvo?
         """
-        guess = f'{last_proof}{proof}{last_hash}'.encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash < self.get_target()
\ No newline at end of file
+        return check_proof(last_proof, proof, last_hash, self.difficulty)
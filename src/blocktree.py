@@ -0,0 +1,97 @@
+class BlockNode:
+    """
+    Um bloco na árvore de blocos.
+
+    `difficulty` é a dificuldade exigida dos filhos deste bloco (já com o
+    ajuste periódico aplicado), `work` é o trabalho acumulado da gênese até
+    ele e `undo` guarda as saídas gastas pelo bloco enquanto ele está
+    conectado à cadeia ativa (None quando não há dados para desfazê-lo).
+    `validated` indica que o bloco já foi conectado, isto é, teve as
+    transações e assinaturas conferidas; antes disso, um bloco de ramo
+    lateral só foi conferido no formato e na prova de trabalho.
+    """
+
+    __slots__ = ('hash', 'block', 'parent', 'height', 'difficulty', 'work', 'undo', 'validated')
+
+    def __init__(self, block_hash, block, parent, difficulty, work):
+        self.hash = block_hash
+        self.block = block
+        self.parent = parent
+        self.height = block['index']
+        self.difficulty = difficulty
+        self.work = work
+        self.undo = None
+        self.validated = False
+
+    def ancestor(self, height):
+        """O ancestral (ou o próprio nó) na altura informada."""
+        node = self
+        while node is not None and node.height > height:
+            node = node.parent
+        return node
+
+
+def block_work(difficulty):
+    """Trabalho esperado para encontrar uma prova com a dificuldade informada."""
+    return 1 << difficulty
+
+
+class BlockTree:
+    """
+    Todos os blocos conhecidos e válidos no formato, organizados pelo hash do
+    bloco anterior: a cadeia ativa e os ramos laterais (bifurcações). O
+    ramo com maior trabalho acumulado é o candidato a cadeia ativa.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def __contains__(self, block_hash):
+        return block_hash in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, block_hash):
+        return self.nodes.get(block_hash)
+
+    def insert(self, node):
+        self.nodes[node.hash] = node
+        return node
+
+    def remove_subtree(self, node):
+        """Remove o nó e todos os seus descendentes (ex: um ramo com bloco inválido)."""
+        doomed = {node.hash}
+        # Os nós são visitados por altura, para que os pais sejam marcados antes dos filhos
+        candidates = [other for other in self.nodes.values() if other.height > node.height]
+        for other in sorted(candidates, key=lambda n: n.height):
+            if other.parent is not None and other.parent.hash in doomed:
+                doomed.add(other.hash)
+        for block_hash in doomed:
+            self.nodes.pop(block_hash, None)
+
+    def prune(self, keep, min_height):
+        """Descarta os ramos laterais abaixo de `min_height`; `keep(nó)` indica os nós da cadeia ativa."""
+        for block_hash, node in list(self.nodes.items()):
+            if node.height < min_height and not keep(node):
+                self.nodes.pop(block_hash, None)
+
+    @staticmethod
+    def common_ancestor(a, b):
+        """O ancestral comum mais recente de dois nós."""
+        a = a.ancestor(b.height)
+        b = b.ancestor(a.height)
+        while a is not b:
+            a, b = a.parent, b.parent
+        return a
+
+    @staticmethod
+    def path(ancestor, tip):
+        """Os nós de `ancestor` (exclusive) até `tip` (inclusive), do mais antigo ao mais novo."""
+        path = []
+        node = tip
+        while node is not ancestor:
+            path.append(node)
+            node = node.parent
+        path.reverse()
+        return path
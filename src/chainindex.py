@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+from validation import is_coinbase
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    txid TEXT PRIMARY KEY,
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_height ON transactions (height);
+CREATE TABLE IF NOT EXISTS address_transactions (
+    address TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    txid TEXT NOT NULL,
+    PRIMARY KEY (address, height, position)
+);
+CREATE INDEX IF NOT EXISTS address_transactions_height ON address_transactions (height);
+'''
+
+
+class ChainIndex:
+    """
+    Índices persistentes da cadeia, em SQLite, para o explorador de blocos:
+    hash do bloco -> altura, id da transação -> (altura, posição no bloco) e
+    endereço -> transações que pagam ou gastam saídas do endereço.
+
+    Os índices são atualizados a cada bloco conectado; ao trocar de cadeia,
+    os blocos a partir do ponto de divergência são descartados e reindexados.
+    As alturas são as do campo `index` dos blocos (o gênese tem altura 1).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def height(self):
+        """Altura do último bloco indexado (0 se vazio)."""
+        with self._lock:
+            row = self._db.execute('SELECT MAX(height) FROM blocks').fetchone()
+        return row[0] or 0
+
+    def block_hash(self, height):
+        with self._lock:
+            row = self._db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+        return row[0] if row else None
+
+    def block_height(self, block_hash):
+        with self._lock:
+            row = self._db.execute('SELECT height FROM blocks WHERE hash = ?', (block_hash,)).fetchone()
+        return row[0] if row else None
+
+    def transaction_location(self, txid):
+        """(altura, posição no bloco) da transação, ou None."""
+        with self._lock:
+            row = self._db.execute('SELECT height, position FROM transactions WHERE txid = ?', (txid,)).fetchone()
+        return tuple(row) if row else None
+
+    def address_history(self, address, start=0, limit=50):
+        """
+        Transações que envolvem o endereço, da mais recente para a mais antiga,
+        como tuplas (txid, altura), e o total de transações do endereço.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT txid, height FROM address_transactions WHERE address = ? '
+                'ORDER BY height DESC, position DESC LIMIT ? OFFSET ?',
+                (address, limit, start),
+            ).fetchall()
+            total = self._db.execute(
+                'SELECT COUNT(*) FROM address_transactions WHERE address = ?', (address,)
+            ).fetchone()[0]
+        return [tuple(row) for row in rows], total
+
+    def connect_block(self, block, block_hash, get_block):
+        """
+        Indexa um bloco, substituindo o que houver indexado na mesma altura ou
+        acima. `get_block(altura)` é usado para descobrir o dono das saídas
+        gastas pelas entradas do bloco.
+        """
+        with self._lock, self._db:
+            self._connect(block, block_hash, get_block)
+
+    def rebuild_from(self, chain, height, hash_block):
+        """Reindexa os blocos de `chain` a partir da altura `height`, em uma única transação."""
+        def get_block(h):
+            return chain[h - 1]
+
+        with self._lock, self._db:
+            self._truncate(height)
+            for block in chain[height - 1:]:
+                self._connect(block, hash_block(block), get_block)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _truncate(self, height):
+        for table in ('blocks', 'transactions', 'address_transactions'):
+            self._db.execute(f'DELETE FROM {table} WHERE height >= ?', (height,))
+
+    def _connect(self, block, block_hash, get_block):
+        height = block['index']
+        self._truncate(height)
+        self._db.execute('INSERT INTO blocks (height, hash) VALUES (?, ?)', (height, block_hash))
+
+        # Saídas criadas no próprio bloco podem ser gastas por transações posteriores dele
+        in_block = {tx['id']: tx for tx in block['transactions']}
+        tx_rows = []
+        address_rows = set()
+        for position, tx in enumerate(block['transactions']):
+            tx_rows.append((tx['id'], height, position))
+            addresses = {output['recipient_address'] for output in tx['outputs']}
+            if not is_coinbase(tx):
+                for tx_input in tx['inputs']:
+                    spent = self._find_output(tx_input, in_block, get_block)
+                    if spent is not None:
+                        addresses.add(spent['recipient_address'])
+            address_rows.update((address, height, position, tx['id']) for address in addresses)
+
+        self._db.executemany('INSERT OR REPLACE INTO transactions (txid, height, position) VALUES (?, ?, ?)', tx_rows)
+        self._db.executemany(
+            'INSERT INTO address_transactions (address, height, position, txid) VALUES (?, ?, ?, ?)',
+            sorted(address_rows),
+        )
+
+    def _find_output(self, tx_input, in_block, get_block):
+        txid, index = tx_input['transaction_id'], tx_input['output_index']
+        tx = in_block.get(txid)
+        if tx is None:
+            row = self._db.execute('SELECT height, position FROM transactions WHERE txid = ?', (txid,)).fetchone()
+            if row is None:
+                return None
+            tx = get_block(row[0])['transactions'][row[1]]
+        outputs = tx['outputs']
+        return outputs[index] if 0 <= index < len(outputs) else None
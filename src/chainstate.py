@@ -0,0 +1,185 @@
+import queue
+import threading
+from itertools import islice
+from concurrent.futures import Future
+
+# Mutações aguardando o escritor; acima disso, quem submete espera (contrapressão)
+DEFAULT_MAX_PENDING = 1000
+
+
+class ChainView:
+    """
+    Os `length` primeiros blocos da lista da cadeia ativa, sem copiá-la.
+
+    A lista só cresce no final enquanto a ponta avança; uma reorganização
+    troca a lista por uma cópia antes de desconectar blocos. Assim, os blocos
+    vistos por uma visão nunca mudam depois de publicada.
+    """
+
+    __slots__ = ('_blocks', '_length')
+
+    def __init__(self, blocks, length):
+        self._blocks = blocks
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return islice(self._blocks, self._length)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(self._length)[index]
+            if positions.step == 1:
+                return self._blocks[positions.start:positions.stop]
+            return [self._blocks[i] for i in positions]
+        return self._blocks[range(self._length)[index]]
+
+
+class BalanceVersion:
+    """
+    Saldos como estavam quando um retrato foi publicado.
+
+    Em vez de copiar os saldos a cada mudança de ponta, a versão lê o
+    dicionário vivo e guarda apenas o valor anterior dos endereços alterados
+    depois da publicação. Os valores anteriores às mudanças feitas depois de
+    versões mais novas ficam nessas versões (`newer`).
+    """
+
+    __slots__ = ('live', 'changed', 'newer')
+
+    def __init__(self, live):
+        self.live = live
+        self.changed = {}
+        self.newer = None
+
+    def get(self, address, default=0):
+        # O valor vivo é lido antes: o escritor guarda o valor anterior antes de alterá-lo
+        value = self.live.get(address, default)
+        version = self
+        while version is not None:
+            if address in version.changed:
+                return version.changed[address]
+            version = version.newer
+        return value
+
+    def record(self, address):
+        if address not in self.changed:
+            self.changed[address] = self.live.get(address, 0)
+
+
+class VersionedBalances(dict):
+    """Saldos por endereço que preservam, para os retratos publicados, os valores anteriores às alterações."""
+
+    __slots__ = ('version',)
+
+    def __init__(self):
+        super().__init__()
+        self.version = BalanceVersion(self)
+
+    def __setitem__(self, address, value):
+        self.version.record(address)
+        super().__setitem__(address, value)
+
+    def __delitem__(self, address):
+        self.version.record(address)
+        super().__delitem__(address)
+
+    def publish(self):
+        """Fixa os saldos atuais em uma versão; as alterações seguintes passam a ser guardadas nela."""
+        version = BalanceVersion(self)
+        self.version.newer = version
+        self.version = version
+        return version
+
+
+class ChainState:
+    """
+    Retrato imutável da cadeia ativa, publicado a cada mudança de ponta.
+
+    Os leitores pegam a referência atual (`blockchain.state`) sem lock: a
+    troca da referência é atômica e um retrato nunca é alterado depois de
+    publicado, então uma requisição vê sempre uma cadeia e saldos
+    consistentes entre si, mesmo durante uma reorganização. Publicar um
+    retrato não copia a cadeia nem os saldos: ele compartilha a lista de
+    blocos (até o seu comprimento) e uma versão dos saldos.
+    """
+
+    __slots__ = ('chain', 'tip', 'difficulty', 'balances')
+
+    def __init__(self, blockchain):
+        self.chain = ChainView(blockchain.chain, len(blockchain.chain))
+        self.tip = blockchain.tip
+        self.difficulty = blockchain.difficulty
+        self.balances = blockchain.balances.publish()
+
+    @property
+    def length(self):
+        return len(self.chain)
+
+    @property
+    def work(self):
+        return self.tip.work
+
+    def get_balance(self, address):
+        return self.balances.get(address, 0)
+
+    def block_by_height(self, height):
+        """Bloco na altura informada (o gênese tem altura 1), ou None."""
+        if 1 <= height <= len(self.chain):
+            return self.chain[height - 1]
+        return None
+
+
+class ChainWriter:
+    """
+    Escritor único da cadeia e do mempool.
+
+    As mutações (blocos e transações recebidos, blocos minerados, adoção de
+    uma cadeia sincronizada, registro de vizinhos) são executadas em ordem
+    por uma única thread, dentro de `blockchain.writing()`, que publica um
+    novo `ChainState` quando a ponta muda. As threads das requisições apenas
+    enfileiram o trabalho e esperam o resultado; as leituras usam o retrato.
+    """
+
+    def __init__(self, blockchain, max_pending=DEFAULT_MAX_PENDING):
+        self.blockchain = blockchain
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Enfileira `fn(*args, **kwargs)` e retorna um Future com o resultado (ou a exceção)."""
+        job = Future()
+        self._ensure_thread()
+        self._queue.put((job, fn, args, kwargs))
+        return job
+
+    def call(self, fn, *args, **kwargs):
+        """Executa `fn` no escritor e espera o resultado; na própria thread do escritor, executa direto."""
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='chain-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            if not job.set_running_or_notify_cancel():
+                continue
+            try:
+                with self.blockchain.writing():
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                job.set_exception(e)
+            else:
+                job.set_result(result)
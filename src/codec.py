@@ -0,0 +1,245 @@
+import struct
+
+# Formato binário compacto de blocos e transações (rede e armazenamento).
+#
+# Cada objeto de nível superior começa com a versão do formato e o tipo do
+# objeto. Inteiros usam varints (zigzag para valores com sinal), números de
+# ponto flutuante usam 8 bytes (IEEE 754) e strings hexadecimais (ids, hashes,
+# endereços, assinaturas) são gravadas como bytes crus, com metade do tamanho.
+# A decodificação reproduz exatamente o dicionário JSON original.
+FORMAT_VERSION = 1
+KIND_BLOCK = ord('B')
+KIND_TRANSACTION = ord('T')
+KIND_BLOCK_LIST = ord('L')
+
+# Tipo de conteúdo usado na negociação com os endpoints HTTP
+BINARY_MIMETYPE = 'application/x-cryptomesh'
+
+STRING_HEX = 0
+STRING_UTF8 = 1
+NUMBER_INT = 0
+NUMBER_FLOAT = 1
+
+BLOCK_HAS_MERKLE_ROOT = 0x01
+BLOCK_HAS_BITS = 0x02
+
+BLOCK_FIELDS = ('index', 'timestamp', 'transactions', 'proof', 'previous_hash')
+TRANSACTION_FIELDS = ('inputs', 'outputs', 'id')
+INPUT_FIELDS = ('transaction_id', 'output_index', 'signature')
+OUTPUT_FIELDS = ('recipient_address', 'amount')
+
+DOUBLE = struct.Struct('>d')
+
+
+def is_binary(data):
+    """Indica se `data` está no formato binário (JSON nunca começa com esse byte)."""
+    return data[:1] == bytes([FORMAT_VERSION])
+
+
+def encode_block(block):
+    out = _header(KIND_BLOCK)
+    _write_block(out, block)
+    return bytes(out)
+
+
+def decode_block(data):
+    reader = _Reader(data, KIND_BLOCK)
+    block = reader.block()
+    reader.done()
+    return block
+
+
+def encode_transaction(tx):
+    out = _header(KIND_TRANSACTION)
+    _write_transaction(out, tx)
+    return bytes(out)
+
+
+def decode_transaction(data):
+    reader = _Reader(data, KIND_TRANSACTION)
+    tx = reader.transaction()
+    reader.done()
+    return tx
+
+
+def encode_blocks(blocks):
+    out = _header(KIND_BLOCK_LIST)
+    _write_varint(out, len(blocks))
+    for block in blocks:
+        _write_block(out, block)
+    return bytes(out)
+
+
+def decode_blocks(data):
+    reader = _Reader(data, KIND_BLOCK_LIST)
+    blocks = [reader.block() for _ in range(reader.varint())]
+    reader.done()
+    return blocks
+
+
+# --- Escrita ---
+
+def _header(kind):
+    return bytearray((FORMAT_VERSION, kind))
+
+
+def _check_fields(obj, required, optional=()):
+    extra = obj.keys() - set(required) - set(optional)
+    if extra or any(k not in obj for k in required):
+        raise ValueError(f'Campos não suportados pelo formato binário: {sorted(extra) or sorted(set(required) - obj.keys())}')
+
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError('varint negativo')
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_number(out, value):
+    # bool é subclasse de int, mas seria decodificado como inteiro
+    if type(value) is int:
+        out.append(NUMBER_INT)
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)  # zigzag
+    elif type(value) is float:
+        out.append(NUMBER_FLOAT)
+        out += DOUBLE.pack(value)
+    else:
+        raise ValueError(f'Número não suportado pelo formato binário: {value!r}')
+
+
+def _write_string(out, value):
+    if not isinstance(value, str):
+        raise ValueError(f'String não suportada pelo formato binário: {value!r}')
+    try:
+        raw = bytes.fromhex(value)
+        kind = STRING_HEX if raw.hex() == value else STRING_UTF8
+    except ValueError:
+        kind = STRING_UTF8
+    if kind == STRING_UTF8:
+        raw = value.encode()
+    out.append(kind)
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _write_block(out, block):
+    _check_fields(block, BLOCK_FIELDS, ('merkle_root', 'bits'))
+    flags = (BLOCK_HAS_MERKLE_ROOT if 'merkle_root' in block else 0) | (BLOCK_HAS_BITS if 'bits' in block else 0)
+    out.append(flags)
+    _write_number(out, block['index'])
+    _write_number(out, block['timestamp'])
+    _write_number(out, block['proof'])
+    _write_string(out, block['previous_hash'])
+    if flags & BLOCK_HAS_MERKLE_ROOT:
+        _write_string(out, block['merkle_root'])
+    if flags & BLOCK_HAS_BITS:
+        _write_varint(out, block['bits'])
+    _write_varint(out, len(block['transactions']))
+    for tx in block['transactions']:
+        _write_transaction(out, tx)
+
+
+def _write_transaction(out, tx):
+    _check_fields(tx, TRANSACTION_FIELDS)
+    _write_string(out, tx['id'])
+    _write_varint(out, len(tx['inputs']))
+    for tx_input in tx['inputs']:
+        _check_fields(tx_input, INPUT_FIELDS)
+        _write_string(out, tx_input['transaction_id'])
+        _write_number(out, tx_input['output_index'])
+        _write_string(out, tx_input['signature'])
+    _write_varint(out, len(tx['outputs']))
+    for output in tx['outputs']:
+        _check_fields(output, OUTPUT_FIELDS)
+        _write_string(out, output['recipient_address'])
+        _write_number(out, output['amount'])
+
+
+# --- Leitura ---
+
+class _Reader:
+    def __init__(self, data, kind):
+        self.data = memoryview(data)
+        self.pos = 2
+        if len(data) < 2 or data[0] != FORMAT_VERSION:
+            raise ValueError('Versão do formato binário não suportada')
+        if data[1] != kind:
+            raise ValueError('Tipo de objeto binário inesperado')
+
+    def done(self):
+        if self.pos != len(self.data):
+            raise ValueError('Dados excedentes após o objeto binário')
+
+    def take(self, n):
+        if self.pos + n > len(self.data):
+            raise ValueError('Objeto binário truncado')
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def byte(self):
+        return self.take(1)[0]
+
+    def varint(self):
+        value = shift = 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7f) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def number(self):
+        kind = self.byte()
+        if kind == NUMBER_INT:
+            zigzag = self.varint()
+            return zigzag >> 1 if not zigzag & 1 else -((zigzag + 1) >> 1)
+        if kind == NUMBER_FLOAT:
+            return DOUBLE.unpack(self.take(DOUBLE.size))[0]
+        raise ValueError(f'Tipo numérico desconhecido: {kind}')
+
+    def string(self):
+        kind = self.byte()
+        raw = self.take(self.varint())
+        if kind == STRING_HEX:
+            return raw.hex()
+        if kind == STRING_UTF8:
+            return str(raw, 'utf-8')
+        raise ValueError(f'Tipo de string desconhecido: {kind}')
+
+    def block(self):
+        flags = self.byte()
+        index = self.number()
+        timestamp = self.number()
+        proof = self.number()
+        previous_hash = self.string()
+        merkle = self.string() if flags & BLOCK_HAS_MERKLE_ROOT else None
+        bits = self.varint() if flags & BLOCK_HAS_BITS else None
+        transactions = [self.transaction() for _ in range(self.varint())]
+        block = {
+            'index': index,
+            'timestamp': timestamp,
+            'transactions': transactions,
+            'proof': proof,
+            'previous_hash': previous_hash,
+        }
+        if merkle is not None:
+            block['merkle_root'] = merkle
+        if bits is not None:
+            block['bits'] = bits
+        return block
+
+    def transaction(self):
+        tx_id = self.string()
+        inputs = [
+            {'transaction_id': self.string(), 'output_index': self.number(), 'signature': self.string()}
+            for _ in range(self.varint())
+        ]
+        outputs = [
+            {'recipient_address': self.string(), 'amount': self.number()}
+            for _ in range(self.varint())
+        ]
+        return {'inputs': inputs, 'outputs': outputs, 'id': tx_id}
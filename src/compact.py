@@ -0,0 +1,174 @@
+import sys
+from collections.abc import Mapping
+
+
+def to_plain(obj):
+    """Converte recursivamente registros compactos em dicionários e listas (para JSON)."""
+    if isinstance(obj, CompactRecord):
+        return obj.to_dict()
+    if isinstance(obj, Mapping):
+        return {k: to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(v) for v in obj]
+    return obj
+
+
+def json_default(obj):
+    """`default` para json.dumps: materializa os registros compactos."""
+    if isinstance(obj, CompactRecord):
+        return obj.to_dict()
+    raise TypeError(f'Objeto do tipo {type(obj).__name__} não é serializável em JSON')
+
+
+def _compact_hex(value):
+    """Strings hexadecimais viram bytes (metade do tamanho); as demais são mantidas."""
+    try:
+        raw = bytes.fromhex(value)
+    except (ValueError, TypeError):
+        return value
+    return raw if raw.hex() == value else value
+
+
+def _expand_hex(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+class CompactRecord(Mapping):
+    """
+    Base dos registros compactos da cadeia em memória.
+
+    Os campos ficam em `__slots__` (sem um dicionário por objeto) e as listas
+    em tuplas. Os registros são imutáveis e se comportam como dicionários
+    somente-leitura (`registro['campo']`), então o código que lê blocos e
+    transações funciona igual; `to_dict()` materializa o dicionário
+    apenas quando necessário (ex: na resposta da API).
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} é imutável')
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.to_dict() == to_plain(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def __reduce__(self):
+        return (type(self).from_dict, (self.to_dict(),))
+
+    def _init(self, **fields):
+        for key, value in fields.items():
+            object.__setattr__(self, key, value)
+
+    def to_dict(self):
+        return {key: to_plain(self[key]) for key in self}
+
+
+class CompactOutput(CompactRecord):
+    __slots__ = ('recipient_address', 'amount')
+    FIELDS = __slots__
+
+    def __init__(self, recipient_address, amount):
+        # Cada endereço (~600 caracteres) é guardado uma única vez, por mais saídas que o usem
+        self._init(recipient_address=sys.intern(recipient_address), amount=amount)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['recipient_address'], data['amount'])
+
+
+class CompactInput(CompactRecord):
+    __slots__ = ('transaction_id', 'output_index', '_signature')
+    FIELDS = ('transaction_id', 'output_index', 'signature')
+
+    def __init__(self, transaction_id, output_index, signature=''):
+        self._init(
+            transaction_id=sys.intern(transaction_id),
+            output_index=output_index,
+            _signature=_compact_hex(signature),
+        )
+
+    @property
+    def signature(self):
+        return _expand_hex(self._signature)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['transaction_id'], data['output_index'], data.get('signature', ''))
+
+
+class CompactTransaction(CompactRecord):
+    __slots__ = ('inputs', 'outputs', 'id')
+    FIELDS = __slots__
+
+    def __init__(self, inputs, outputs, id):
+        self._init(inputs=tuple(inputs), outputs=tuple(outputs), id=sys.intern(id))
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(
+            [CompactInput.from_dict(i) for i in data['inputs']],
+            [CompactOutput.from_dict(o) for o in data['outputs']],
+            data['id'],
+        )
+
+
+class CompactBlock(CompactRecord):
+    """Bloco compacto. Campos opcionais ausentes (None) não aparecem como chaves."""
+
+    __slots__ = ('index', 'timestamp', 'transactions', 'proof', 'previous_hash', 'merkle_root', 'bits', '_keys')
+    REQUIRED = ('index', 'timestamp', 'transactions', 'proof', 'previous_hash')
+    OPTIONAL = ('merkle_root', 'bits')
+
+    def __init__(self, index, timestamp, transactions, proof, previous_hash, merkle_root=None, bits=None):
+        keys = self.REQUIRED + tuple(f for f, v in zip(self.OPTIONAL, (merkle_root, bits)) if v is not None)
+        self._init(
+            index=index,
+            timestamp=timestamp,
+            transactions=tuple(transactions),
+            proof=proof,
+            previous_hash=previous_hash,
+            merkle_root=merkle_root,
+            bits=bits,
+            _keys=keys,
+        )
+
+    @property
+    def FIELDS(self):
+        return self._keys
+
+    @classmethod
+    def from_dict(cls, data):
+        """Converte um bloco em dicionário para a forma compacta; blocos com campos desconhecidos são mantidos como estão."""
+        if isinstance(data, cls):
+            return data
+        if data.keys() - set(cls.REQUIRED) - set(cls.OPTIONAL) or any(f not in data for f in cls.REQUIRED):
+            return data
+        return cls(
+            data['index'],
+            data['timestamp'],
+            [CompactTransaction.from_dict(tx) for tx in data['transactions']],
+            data['proof'],
+            data['previous_hash'],
+            **{field: data[field] for field in cls.OPTIONAL if field in data},
+        )
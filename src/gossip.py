@@ -0,0 +1,105 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Endpoint em que os nós anunciam os ids de transações e blocos que têm
+INVENTORY_PATH = '/inventory'
+# Endpoint que recebe o item completo, por tipo de inventário
+ITEM_PATHS = {'tx': '/transactions/receive', 'block': '/blocks/receive'}
+# Ids lembrados por tipo (os mais antigos são esquecidos primeiro)
+DEFAULT_SEEN_SIZE = 50000
+# Ids aceitos por anúncio
+MAX_INVENTORY = 1000
+# Tempo (em segundos) em que um item pedido a um vizinho não é pedido a outro
+REQUEST_TIMEOUT = 10.0
+
+
+class SeenCache:
+    """
+    Conjunto limitado de ids vistos recentemente. Acima de `max_size`, os
+    mais antigos são descartados; com `ttl`, cada id expira após `ttl`
+    segundos.
+    """
+
+    def __init__(self, max_size=DEFAULT_SEEN_SIZE, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._alive(key)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key):
+        """Marca o id como visto. Retorna False se ele já estava no conjunto."""
+        with self._lock:
+            if self._alive(key):
+                return False
+            self._items[key] = time.monotonic()
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def _alive(self, key):
+        added = self._items.get(key)
+        if added is None:
+            return False
+        if self.ttl is not None and time.monotonic() - added > self.ttl:
+            del self._items[key]
+            return False
+        return True
+
+
+class Gossip:
+    """
+    Propagação de transações e blocos por inventário.
+
+    Quem tem um item novo anuncia apenas o id (`POST /inventory`); cada
+    vizinho responde com os ids que não tem, e só esses recebem o item
+    completo. Os ids já vistos (aceitos, rejeitados ou anunciados por este
+    nó) não são pedidos nem verificados de novo, e um item pedido a um
+    vizinho não é pedido a outro por REQUEST_TIMEOUT segundos. Assim, a
+    retransmissão por todos os nós custa um anúncio por aresta e uma
+    entrega por nó, e não uma entrega por aresta.
+    """
+
+    def __init__(self, peers, seen_size=DEFAULT_SEEN_SIZE, request_timeout=REQUEST_TIMEOUT):
+        self.peers = peers
+        self.seen = {kind: SeenCache(seen_size) for kind in ITEM_PATHS}
+        self.requested = {kind: SeenCache(seen_size, ttl=request_timeout) for kind in ITEM_PATHS}
+
+    def mark_seen(self, kind, item_id):
+        """Marca um item recebido como visto. Retorna False se ele já tinha sido visto."""
+        self.requested[kind].discard(item_id)
+        return self.seen[kind].add(item_id)
+
+    def wanted(self, kind, ids, have):
+        """Dos ids anunciados, os que devem ser pedidos: nem vistos, nem em `have(id)`, nem já pedidos."""
+        wanted = []
+        for item_id in ids[:MAX_INVENTORY]:
+            if not isinstance(item_id, str) or item_id in self.seen[kind] or have(item_id):
+                continue
+            if self.requested[kind].add(item_id):
+                wanted.append(item_id)
+        return wanted
+
+    def announce(self, nodes, kind, items):
+        """
+        Anuncia `items` ({id: item codificado}) aos nós, em segundo plano, e
+        entrega o item completo apenas aos que o pedirem. Retorna os futures.
+        """
+        for item_id in items:
+            self.seen[kind].add(item_id)
+        path = ITEM_PATHS[kind]
+        return self.peers.relay(
+            nodes, INVENTORY_PATH, {'type': kind, 'ids': list(items)},
+            {item_id: (path, payload) for item_id, payload in items.items()},
+        )
@@ -0,0 +1,75 @@
+from blockchain import Blockchain
+from blocktree import block_work
+from merkle import verify_merkle_branch
+from miner import check_proof, MIN_DIFFICULTY, MAX_DIFFICULTY
+from validation import transaction_hash
+
+def confirmation_work(confirmations, difficulty):
+    """Trabalho de `confirmations` blocos na dificuldade informada (a da rede, obtida de fonte confiável)."""
+    return confirmations * block_work(difficulty)
+
+
+def verify_transaction_proof(proof, txid, address=None, *, min_work):
+    """
+    Confere, sem baixar a cadeia, uma prova de inclusão retornada por
+    `GET /tx/<id>/proof`: o id da transação contra o seu conteúdo, o ramo de
+    Merkle contra a raiz do cabeçalho do bloco e o encadeamento e as provas
+    de trabalho dos cabeçalhos seguintes (cada um com a sua dificuldade,
+    dentro da faixa que um nó pode exigir).
+
+    As dificuldades (`bits`) vêm do próprio nó e não são conferidas contra
+    o ajuste de dificuldade da rede, que depende do histórico inteiro: um
+    nó desonesto pode montar cabeçalhos de dificuldade baixa quase de graça.
+    Por isso o trabalho mínimo `min_work` é obrigatório e deve vir de quem
+    chama, a partir da dificuldade atual da rede conhecida por outra fonte
+    (ver `confirmation_work`); não há um valor padrão seguro.
+
+    Retorna um dicionário com as confirmações, o trabalho dos cabeçalhos
+    conferidos, se ele atinge `min_work` (`confirmed`) e o valor pago a
+    `address`, ou None se a prova for inválida ou malformada.
+    """
+    try:
+        return _verify_transaction_proof(proof, txid, address, min_work)
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        print("Prova inválida: formato inesperado.")
+        return None
+
+
+def _verify_transaction_proof(proof, txid, address, min_work):
+    tx = proof['transaction']
+    if tx['id'] != txid or transaction_hash(tx) != txid:
+        print("Prova inválida: a transação não confere com o id.")
+        return None
+
+    headers = proof['headers']
+    hashes = [Blockchain.hash(header) for header in headers]
+    offset = next((i for i, header in enumerate(headers) if header['index'] == proof['height']), None)
+    if offset is None or 'merkle_root' not in headers[offset]:
+        print("Prova inválida: cabeçalho do bloco ausente.")
+        return None
+    if not verify_merkle_branch(txid, proof['position'], proof['branch'], headers[offset]['merkle_root']):
+        print("Prova inválida: o ramo de Merkle não leva à raiz do bloco.")
+        return None
+
+    work = 0
+    for i in range(1, len(headers)):
+        previous, header = headers[i - 1], headers[i]
+        if header['previous_hash'] != hashes[i - 1] or header['index'] != previous['index'] + 1:
+            print(f"Prova inválida: cabeçalho {header['index']} fora da cadeia.")
+            return None
+        bits = header.get('bits')
+        if type(bits) is not int or not MIN_DIFFICULTY <= bits <= MAX_DIFFICULTY:
+            print(f"Prova inválida: dificuldade do cabeçalho {header['index']} fora da faixa.")
+            return None
+        if not check_proof(previous['proof'], header['proof'], hashes[i - 1], bits):
+            print(f"Prova inválida: prova de trabalho do cabeçalho {header['index']} não confere.")
+            return None
+        work += block_work(bits)
+
+    return {
+        'height': proof['height'],
+        'confirmations': len(headers) - offset,
+        'work': work,
+        'confirmed': work >= min_work,
+        'amount': sum(output['amount'] for output in tx['outputs'] if output['recipient_address'] == address),
+    }
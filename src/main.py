@@ -2,6 +2,7 @@ import json
 import requests
 import inquirer
 from wallet import Wallet
+from lightclient import verify_transaction_proof, confirmation_work
 
 # --- Funções de Interação com a API ---
 
@@ -39,13 +40,43 @@ def mine_block(host, port):
 
 def print_chain(host, port):
     try:
-        response = requests.get(f"http://{host}:{port}/chain")
-        response.raise_for_status()
-        print("\nBlockchain atual:")
-        print(json.dumps(response.json(), indent=2) + '\n')
+        # Recebe a cadeia em streaming (um bloco por linha), sem carregá-la inteira
+        with requests.get(f"http://{host}:{port}/chain", params={'stream': 'true'}, stream=True) as response:
+            response.raise_for_status()
+            print("\nBlockchain atual:")
+            for line in response.iter_lines():
+                if line:
+                    print(json.dumps(json.loads(line), indent=2))
+            print()
     except requests.exceptions.RequestException as e:
         print(f"\nErro ao obter a blockchain: {e}\n")
 
+def verify_payment(host, port, txid, min_work, address=None):
+    try:
+        # Baixa apenas a prova de inclusão (alguns KB), não a cadeia
+        response = requests.get(f"http://{host}:{port}/tx/{txid}/proof")
+        response.raise_for_status()
+        proof = response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"\nErro ao obter a prova da transação: {e}\n")
+        return
+    except ValueError:
+        print("\nErro ao obter a prova da transação: resposta inválida do nó.\n")
+        return
+
+    result = verify_transaction_proof(proof, txid, address, min_work=min_work)
+    if result is None:
+        print()
+        return
+    print(f"\nTransação incluída no bloco {result['height']} ({result['confirmations']} confirmações verificadas, trabalho {result['work']}).")
+    if result['confirmed']:
+        print("Transação confirmada.")
+    else:
+        print(f"Ainda não confirmada: trabalho verificado abaixo do mínimo ({min_work}).")
+    if address:
+        print(f"Valor pago ao endereço: {result['amount']}")
+    print()
+
 # --- Funções da CLI Interativa ---
 
 def create_wallet_cli():
@@ -96,6 +127,23 @@ def print_chain_cli(default_host, default_port):
     answers = inquirer.prompt(questions)
     print_chain(answers['host'], int(answers['port']))
 
+def verify_payment_cli(default_host, default_port):
+    questions = [
+        inquirer.Text('txid', message="Id da transação"),
+        inquirer.Text('address', message="Endereço do recebedor (opcional)"),
+        inquirer.Text('confirmations', message="Confirmações exigidas", default='6'),
+        inquirer.Text('difficulty', message="Dificuldade atual da rede (de uma fonte confiável, não do nó consultado)"),
+        inquirer.Text('host', message="Host do nó", default=default_host),
+        inquirer.Text('port', message="Porta do nó", default=str(default_port)),
+    ]
+    answers = inquirer.prompt(questions)
+    try:
+        min_work = confirmation_work(int(answers['confirmations']), int(answers['difficulty']))
+    except ValueError:
+        print("\nErro: confirmações e dificuldade devem ser números inteiros.\n")
+        return
+    verify_payment(answers['host'], int(answers['port']), answers['txid'], min_work, answers['address'] or None)
+
 def main():
     default_host = 'localhost'
     default_port = 5000
@@ -110,6 +158,7 @@ def main():
                               'Enviar moedas',
                               'Minerar um bloco',
                               'Imprimir a blockchain',
+                              'Verificar um pagamento',
                               'Sair'
                           ]),
         ]
@@ -127,6 +176,8 @@ def main():
             mine_cli(default_host, default_port)
         elif command == 'Imprimir a blockchain':
             print_chain_cli(default_host, default_port)
+        elif command == 'Verificar um pagamento':
+            verify_payment_cli(default_host, default_port)
         elif command == 'Sair':
             break
 
@@ -0,0 +1,188 @@
+import json
+import time
+import heapq
+import itertools
+from dataclasses import dataclass
+from compact import json_default
+
+
+def transaction_size(tx_dict):
+    """Tamanho aproximado da transação em bytes (JSON compacto)."""
+    return len(json.dumps(tx_dict, separators=(',', ':'), default=json_default))
+
+
+def spent_outpoints(tx_dict):
+    """Saídas (`txid:índice`) gastas por uma transação; vazio para coinbase."""
+    if not tx_dict['inputs'] or tx_dict['inputs'][0]['transaction_id'] == '0':
+        return []
+    return [f"{i['transaction_id']}:{i['output_index']}" for i in tx_dict['inputs']]
+
+
+@dataclass
+class MempoolEntry:
+    tx: dict
+    fee: float
+    size: int
+    added_at: float
+    order: int
+    parents: frozenset = frozenset()  # ids de transações pendentes cujas saídas esta gasta
+
+    @property
+    def fee_rate(self):
+        """Taxa por byte."""
+        return self.fee / self.size if self.size else 0.0
+
+
+class Mempool:
+    """
+    Conjunto de transações pendentes, indexado pelo id da transação.
+
+    Mantém um índice das saídas gastas por transações pendentes (para
+    detectar conflitos em O(entradas)), filas de prioridade por taxa por byte
+    para a montagem de blocos e para o descarte, e um limite de tamanho: ao
+    ultrapassá-lo, a transação com menor taxa por byte é descartada.
+
+    Transações podem gastar saídas de outras transações pendentes; essas
+    dependências (pais/filhos) são registradas, e remover um pai por conflito
+    ou descarte remove também os seus descendentes.
+
+    A iteração percorre as transações na ordem em que entraram no mempool.
+    """
+
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self.entries = {}   # id da transação -> MempoolEntry
+        self.spent = {}     # saída gasta ('txid:índice') -> id da transação que a gasta
+        self.children = {}  # id da transação -> ids das pendentes que gastam suas saídas
+        self._by_fee_rate = []  # heap de (-taxa por byte, ordem, id), para montagem de blocos
+        self._eviction = []     # heap de (taxa por byte, -ordem, id), para descarte
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return (entry.tx for entry in list(self.entries.values()))
+
+    def __contains__(self, tx_id):
+        return tx_id in self.entries
+
+    def get(self, tx_id):
+        entry = self.entries.get(tx_id)
+        return entry.tx if entry else None
+
+    def output(self, outpoint):
+        """Saída (`txid:índice`) de uma transação pendente, ou None."""
+        tx_id, _, index = outpoint.rpartition(':')
+        entry = self.entries.get(tx_id)
+        if entry is None or not index.lstrip('-').isdigit():
+            return None
+        index = int(index)
+        outputs = entry.tx['outputs']
+        return outputs[index] if 0 <= index < len(outputs) else None
+
+    def is_spent(self, outpoint):
+        """Indica se a saída já é gasta por alguma transação pendente."""
+        return outpoint in self.spent
+
+    def conflicts(self, tx_dict):
+        """Ids das transações pendentes que gastam alguma das mesmas saídas."""
+        return {self.spent[o] for o in spent_outpoints(tx_dict) if o in self.spent}
+
+    def add(self, tx_dict, fee=0.0):
+        """
+        Adiciona uma transação ao mempool. Retorna False se ela já estiver
+        presente, se conflitar com uma transação pendente, ou se o mempool
+        estiver cheio e ela tiver a menor taxa por byte.
+        """
+        tx_id = tx_dict['id']
+        if tx_id in self.entries or self.conflicts(tx_dict):
+            return False
+
+        order = next(self._counter)
+        parents = frozenset(o.rpartition(':')[0] for o in spent_outpoints(tx_dict)) & self.entries.keys()
+        entry = MempoolEntry(tx_dict, fee, transaction_size(tx_dict), time.time(), order, parents)
+        self.entries[tx_id] = entry
+        for outpoint in spent_outpoints(tx_dict):
+            self.spent[outpoint] = tx_id
+        for parent_id in parents:
+            self.children.setdefault(parent_id, set()).add(tx_id)
+        heapq.heappush(self._by_fee_rate, (-entry.fee_rate, order, tx_id))
+        heapq.heappush(self._eviction, (entry.fee_rate, -order, tx_id))
+
+        while len(self.entries) > self.max_size and tx_id in self.entries:
+            self._pop_lowest_fee_rate()
+        return tx_id in self.entries
+
+    def remove(self, tx_id, with_descendants=False):
+        """
+        Remove uma transação; as entradas das filas de prioridade são
+        descartadas depois. Com `with_descendants`, remove também as pendentes
+        que dependem dela (que deixariam de ser válidas).
+        """
+        entry = self.entries.pop(tx_id, None)
+        if entry is None:
+            return None
+        for outpoint in spent_outpoints(entry.tx):
+            if self.spent.get(outpoint) == tx_id:
+                del self.spent[outpoint]
+        for parent_id in entry.parents:
+            self.children.get(parent_id, set()).discard(tx_id)
+
+        children = self.children.pop(tx_id, set())
+        if with_descendants:
+            for child_id in children:
+                self.remove(child_id, with_descendants=True)
+        else:
+            # Os filhos continuam válidos (ex: o pai foi confirmado em um bloco)
+            for child_id in children:
+                child = self.entries.get(child_id)
+                if child is not None:
+                    child.parents = child.parents - {tx_id}
+
+        self._compact()
+        return entry
+
+    def remove_for_block(self, block):
+        """
+        Remove as transações incluídas em um bloco e as pendentes que gastam
+        as mesmas saídas (que passaram a ser gastos duplos). Custo O(bloco).
+        """
+        for tx in block['transactions']:
+            self.remove(tx['id'])
+            for outpoint in spent_outpoints(tx):
+                if outpoint in self.spent:
+                    self.remove(self.spent[outpoint], with_descendants=True)
+
+    def by_fee_rate(self):
+        """Gera as entradas em ordem decrescente de taxa por byte."""
+        heap = list(self._by_fee_rate)
+        while heap:
+            _, order, tx_id = heapq.heappop(heap)
+            entry = self.entries.get(tx_id)
+            if entry is not None and entry.order == order:
+                yield entry
+
+    def clear(self):
+        self.entries.clear()
+        self.spent.clear()
+        self.children.clear()
+        self._by_fee_rate = []
+        self._eviction = []
+
+    def _pop_lowest_fee_rate(self):
+        while self._eviction:
+            _, negative_order, tx_id = heapq.heappop(self._eviction)
+            entry = self.entries.get(tx_id)
+            if entry is not None and entry.order == -negative_order:
+                self.remove(tx_id, with_descendants=True)
+                return tx_id
+        return None
+
+    def _compact(self):
+        # Reconstrói as filas quando a maior parte das posições já foi removida
+        if len(self._by_fee_rate) > 2 * len(self.entries) + 64:
+            self._by_fee_rate = [(-e.fee_rate, e.order, tx_id) for tx_id, e in self.entries.items()]
+            heapq.heapify(self._by_fee_rate)
+            self._eviction = [(e.fee_rate, -e.order, tx_id) for tx_id, e in self.entries.items()]
+            heapq.heapify(self._eviction)
@@ -0,0 +1,60 @@
+import hashlib
+from functools import lru_cache
+
+
+def hash_pair(left, right):
+    """Hash de um nó interno da árvore a partir dos hashes (hex) dos filhos."""
+    return hashlib.sha256(f'{left}{right}'.encode()).hexdigest()
+
+
+def merkle_root(tx_ids):
+    """
+    Calcula a raiz de Merkle dos ids (hex) das transações de um bloco.
+    Em níveis com número ímpar de nós, o último nó é combinado com ele mesmo.
+    """
+    if not tx_ids:
+        return hashlib.sha256(b'').hexdigest()
+
+    level = list(tx_ids)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+@lru_cache(maxsize=256)
+def merkle_tree(tx_ids):
+    """
+    Todos os níveis da árvore de Merkle de um bloco, das folhas (`tx_ids`,
+    uma tupla) até a raiz. As árvores dos blocos consultados recentemente
+    ficam em cache, para servir várias provas do mesmo bloco.
+    """
+    levels = [tuple(tx_ids) or (hashlib.sha256(b'').hexdigest(),)]
+    while len(levels[-1]) > 1:
+        level = list(levels[-1])
+        if len(level) % 2:
+            level.append(level[-1])
+        levels.append(tuple(hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)))
+    return levels
+
+
+def merkle_branch(tx_ids, position):
+    """Os hashes irmãos, da folha até a raiz, que provam a inclusão da transação na posição informada."""
+    branch = []
+    for level in merkle_tree(tuple(tx_ids))[:-1]:
+        sibling = position ^ 1
+        branch.append(level[sibling] if sibling < len(level) else level[position])
+        position //= 2
+    return branch
+
+
+def verify_merkle_branch(tx_id, position, branch, root):
+    """Confere se `tx_id`, na posição informada, leva à raiz de Merkle `root` pelos hashes de `branch`."""
+    if position < 0 or position >= 1 << len(branch):
+        return False
+    current = tx_id
+    for sibling in branch:
+        current = hash_pair(current, sibling) if position % 2 == 0 else hash_pair(sibling, current)
+        position //= 2
+    return current == root
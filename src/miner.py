@@ -0,0 +1,192 @@
+import os
+import time
+import hashlib
+import threading
+import multiprocessing
+import metrics
+
+MINING_HASHES = metrics.counter('cryptomesh_mining_hashes_total', 'Hashes calculados na mineração')
+MINING_SECONDS = metrics.histogram('cryptomesh_mining_seconds', 'Duração de cada rodada de mineração', buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300))
+
+# Faixa de dificuldades (bits zerados do hash) que um nó pode exigir
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 256
+
+# Evento de parada compartilhado com os processos do pool (definido no initializer)
+_worker_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _worker_stop_event
+    _worker_stop_event = stop_event
+
+
+def _search_worker(last_proof, last_hash, target, start, count):
+    return search_nonces(last_proof, last_hash, target, start, count, _worker_stop_event)
+
+
+def check_proof(last_proof, proof, last_hash, difficulty):
+    """Confere se sha256(f'{last_proof}{proof}{last_hash}') está abaixo do alvo da dificuldade."""
+    guess_hash = hashlib.sha256(f'{last_proof}{proof}{last_hash}'.encode()).digest()
+    return int.from_bytes(guess_hash, 'big') < ProofOfWorkMiner.target_for(difficulty)
+
+
+def search_nonces(last_proof, last_hash, target, start, count, stop_event=None, check_every=4096):
+    """
+    Procura, no intervalo [start, start + count), uma prova cujo hash
+    sha256(f'{last_proof}{proof}{last_hash}') seja menor que o alvo.
+
+    O prefixo constante (`last_proof`) é absorvido uma única vez em um estado
+    sha256 que é copiado a cada tentativa, e o alvo é comparado como inteiro.
+    Retorna (prova ou None, número de hashes calculados).
+    """
+    seeded = hashlib.sha256(str(last_proof).encode())
+    suffix = last_hash.encode()
+    from_bytes = int.from_bytes
+
+    for proof in range(start, start + count):
+        h = seeded.copy()
+        h.update(b'%d%s' % (proof, suffix))
+        if from_bytes(h.digest(), 'big') < target:
+            return proof, proof - start + 1
+        if stop_event is not None and (proof - start) % check_every == 0 and stop_event.is_set():
+            return None, proof - start + 1
+    return None, count
+
+
+class ProofOfWorkMiner:
+    """
+    Motor de mineração que divide o espaço de provas entre um pool de processos.
+
+    Cada rodada distribui um bloco contíguo de `chunk_size` provas para cada
+    processo; quando um deles encontra uma prova válida, os demais são
+    interrompidos pelo evento de parada da rodada, que mine() limpa ao
+    começar. `cancel()` aborta a mineração em andamento (ex: quando um bloco
+    concorrente chega pela rede) por uma marca separada, que só reset() limpa.
+    """
+
+    def __init__(self, workers=None, chunk_size=50000):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        # Evita fork() de um processo com várias threads (servidor HTTP, agendador)
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._ctx = multiprocessing.get_context(start_method)
+        # O evento só precisa ser compartilhado entre processos quando há um pool
+        self._stop = self._ctx.Event() if self.workers > 1 else threading.Event()
+        self._pool = None
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self.mining = False
+        self.last_hashes = 0
+        self.last_elapsed = 0.0
+        self.total_hashes = 0
+
+    @staticmethod
+    def target_for(difficulty):
+        """Alvo inteiro correspondente à dificuldade (número de bits zerados)."""
+        return 1 << (256 - difficulty)
+
+    def mine(self, last_proof, last_hash, difficulty):
+        """
+        Retorna uma prova válida, ou None se a mineração for cancelada. Um
+        cancel() feito desde o último reset() também vale para esta rodada.
+        """
+        with self._lock:
+            self.mining = True
+            started = time.perf_counter()
+            hashes = 0
+            try:
+                target = self.target_for(difficulty)
+                # A parada da rodada anterior (prova encontrada) não vale para
+                # esta; um cancel() concorrente marca _cancelled antes do
+                # evento, então conferir depois de limpar não o perde
+                self._stop.clear()
+                if self._cancelled:
+                    self._stop.set()
+                if self.workers == 1:
+                    proof, hashes = self._mine_inline(last_proof, last_hash, target)
+                else:
+                    proof, hashes = self._mine_parallel(last_proof, last_hash, target)
+                return proof
+            finally:
+                self.mining = False
+                self.last_hashes = hashes
+                self.last_elapsed = time.perf_counter() - started
+                self.total_hashes += hashes
+                MINING_HASHES.inc(hashes)
+                MINING_SECONDS.observe(self.last_elapsed)
+
+    def reset(self):
+        """
+        Descarta um cancelamento anterior. Quem agenda a mineração chama antes
+        de escolher a ponta, para que um cancel() feito entre a escolha e o
+        início de mine() não se perca.
+        """
+        self._cancelled = False
+        self._stop.clear()
+
+    def cancel(self):
+        """Interrompe a mineração em andamento, se houver."""
+        self._cancelled = True
+        self._stop.set()
+
+    def stats(self):
+        """Estatísticas da última rodada de mineração, incluindo a taxa de hash."""
+        hash_rate = self.last_hashes / self.last_elapsed if self.last_elapsed else 0.0
+        return {
+            'workers': self.workers,
+            'mining': self.mining,
+            'last_hashes': self.last_hashes,
+            'last_elapsed': self.last_elapsed,
+            'hash_rate': hash_rate,
+            'total_hashes': self.total_hashes,
+        }
+
+    def close(self):
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _mine_inline(self, last_proof, last_hash, target):
+        start = 0
+        hashes = 0
+        while not self._cancelled:
+            proof, count = search_nonces(last_proof, last_hash, target, start, self.chunk_size, self._stop)
+            hashes += count
+            if proof is not None:
+                return proof, hashes
+            start += self.chunk_size
+        return None, hashes
+
+    def _mine_parallel(self, last_proof, last_hash, target):
+        if self._pool is None:
+            self._pool = self._ctx.Pool(self.workers, initializer=_init_worker, initargs=(self._stop,))
+
+        def on_result(result):
+            # Avisa os demais processos assim que uma prova é encontrada
+            if result[0] is not None:
+                self._stop.set()
+
+        start = 0
+        hashes = 0
+        while not self._cancelled:
+            pending = [
+                self._pool.apply_async(
+                    _search_worker,
+                    (last_proof, last_hash, target, start + i * self.chunk_size, self.chunk_size),
+                    callback=on_result,
+                )
+                for i in range(self.workers)
+            ]
+            found = []
+            for result in pending:
+                proof, count = result.get()
+                hashes += count
+                if proof is not None:
+                    found.append(proof)
+
+            if found:
+                return min(found), hashes
+            start += self.workers * self.chunk_size
+        return None, hashes
@@ -0,0 +1,132 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from codec import BINARY_MIMETYPE
+import metrics
+
+PEER_REQUEST_SECONDS = metrics.histogram('cryptomesh_peer_request_seconds', 'Latência das requisições a outros nós', ('peer', 'path'))
+PEER_REQUEST_FAILURES = metrics.counter('cryptomesh_peer_request_failures_total', 'Requisições a outros nós que falharam após as novas tentativas', ('peer', 'path'))
+
+# Vizinhos com séries próprias nas métricas. Qualquer um pode registrar
+# endereços em /nodes/register, então os que passarem do limite são somados
+# no rótulo OTHER_PEER_LABEL em vez de criar séries novas em /metrics.
+MAX_PEER_LABELS = 64
+OTHER_PEER_LABEL = 'other'
+_peer_labels = set()
+_peer_labels_lock = threading.Lock()
+
+
+def peer_label(node):
+    """Rótulo `peer` das métricas de `node`: o próprio endereço, enquanto couber no limite, ou OTHER_PEER_LABEL."""
+    if node in _peer_labels:
+        return node
+    with _peer_labels_lock:
+        if len(_peer_labels) < MAX_PEER_LABELS:
+            _peer_labels.add(node)
+            return node
+    return OTHER_PEER_LABEL
+
+
+class PeerClient:
+    """
+    Camada de comunicação com os outros nós da rede.
+
+    Mantém uma sessão HTTP com conexões keep-alive reaproveitadas entre
+    requisições, aplica timeout e novas tentativas com espera exponencial a
+    cada chamada, e distribui chamadas para vários nós em um pool de threads
+    de tamanho limitado, para que um nó lento não atrase os demais.
+    """
+
+    def __init__(self, timeout=5.0, retries=2, backoff=0.2, max_workers=16, pool_size=32):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='peer')
+
+    def request(self, method, node, path, **kwargs):
+        """
+        Faz uma requisição a um nó, com novas tentativas em caso de falha de
+        conexão ou timeout. Levanta a última exceção se todas falharem.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                with PEER_REQUEST_SECONDS.time(peer=peer_label(node), path=path):
+                    return self.session.request(method, f'http://{node}{path}', **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    PEER_REQUEST_FAILURES.inc(peer=peer_label(node), path=path)
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, node, path, params=None, headers=None):
+        return self.request('GET', node, path, params=params, headers=headers)
+
+    def post(self, node, path, payload):
+        """Envia `payload` como JSON, ou no formato binário compacto se já vier codificado (bytes)."""
+        if isinstance(payload, bytes):
+            return self.request('POST', node, path, data=payload, headers={'Content-Type': BINARY_MIMETYPE})
+        return self.request('POST', node, path, json=payload)
+
+    def map(self, nodes, call):
+        """
+        Executa `call(node)` para todos os nós em paralelo e retorna
+        {nó: resultado}. Nós que falharem ficam com resultado None.
+        """
+        futures = {node: self._executor.submit(call, node) for node in nodes}
+        results = {}
+        for node, future in futures.items():
+            try:
+                results[node] = future.result()
+            except requests.exceptions.RequestException:
+                # Ignora nós que não estão respondendo
+                results[node] = None
+        return results
+
+    def get_many(self, nodes, path, params=None):
+        """GET de `path` em todos os nós em paralelo: {nó: resposta}, com None para os que falharem."""
+        return self.map(nodes, lambda node: self.get(node, path, params))
+
+    def broadcast(self, nodes, path, payload):
+        """
+        Envia `payload` para todos os nós em segundo plano, sem bloquear quem
+        chamou. Retorna os futures das entregas.
+        """
+        return [self._executor.submit(self._deliver, node, path, payload) for node in nodes]
+
+    def relay(self, nodes, inventory_path, inventory, items):
+        """
+        Anuncia `inventory` a todos os nós em segundo plano e entrega a cada
+        um apenas os itens que ele pedir (`items`: {id: (caminho, payload)}).
+        Retorna os futures, resolvidos com o número de itens entregues.
+        """
+        return [self._executor.submit(self._relay_to, node, inventory_path, inventory, items) for node in list(nodes)]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def _relay_to(self, node, inventory_path, inventory, items):
+        try:
+            response = self.post(node, inventory_path, inventory)
+            wanted = response.json().get('wanted', []) if response.status_code == 200 else []
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        delivered = 0
+        for item_id in wanted:
+            if item_id in items and self._deliver(node, *items[item_id]) is not None:
+                delivered += 1
+        return delivered
+
+    def _deliver(self, node, path, payload):
+        try:
+            return self.post(node, path, payload).status_code
+        except requests.exceptions.RequestException:
+            # Ignora nós que não estão respondendo
+            return None
@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Limites de uma sessão de profiling, para que ela seja segura em um nó carregado
+DEFAULT_INTERVAL = 0.01
+MIN_INTERVAL = 0.001
+DEFAULT_DURATION = 10.0
+MAX_DURATION = 300.0
+# Número máximo de pilhas distintas guardadas; as excedentes são somadas em OVERFLOW_STACK
+MAX_STACKS = 10000
+OVERFLOW_STACK = '(outras pilhas)'
+# Quadros guardados por pilha (os mais próximos do topo)
+MAX_DEPTH = 128
+
+
+class ProfilerBusy(RuntimeError):
+    """Já existe uma sessão de profiling em andamento."""
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem que pode ser ligado com o nó em execução.
+
+    Uma thread amostra, a cada `interval` segundos, a pilha de todas as
+    outras threads do processo (requisições, agendador de mineração, pool
+    de vizinhos) e conta as pilhas no formato "collapsed" dos flame graphs
+    (`thread;arquivo:função;... contagem`). A sessão termina após `seconds`
+    segundos ou após `requests` requisições (ver `request_finished`), o que
+    vier primeiro, e nunca dura mais que MAX_DURATION.
+
+    O custo é o de percorrer as pilhas a cada amostra, com o GIL, e não
+    depende da carga do nó; os processos de mineração e de validação não
+    são amostrados.
+    """
+
+    def __init__(self, max_stacks=MAX_STACKS):
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counts = Counter()
+        self._samples = 0
+        self._interval = DEFAULT_INTERVAL
+        self._started = None
+        self._finished = None
+        self._deadline = None
+        self._requests_left = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None, requests=None, interval=None):
+        """Inicia uma sessão. Levanta ProfilerBusy se já houver uma em andamento."""
+        with self._lock:
+            if self.running:
+                raise ProfilerBusy('Já existe uma sessão de profiling em andamento')
+            if seconds is None and requests is None:
+                seconds = DEFAULT_DURATION
+            self._interval = max(MIN_INTERVAL, interval or DEFAULT_INTERVAL)
+            self._counts = Counter()
+            self._samples = 0
+            self._started = time.time()
+            self._finished = None
+            self._deadline = time.monotonic() + min(seconds or MAX_DURATION, MAX_DURATION)
+            self._requests_left = max(1, requests) if requests is not None else None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Encerra a sessão em andamento (se houver) e espera a última amostra."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def request_finished(self):
+        """Conta uma requisição atendida; na sessão limitada por requisições, encerra ao atingir o limite."""
+        if self._requests_left is None or not self.running:
+            return
+        with self._lock:
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._stop.set()
+
+    def status(self):
+        return {
+            'running': self.running,
+            'started': self._started,
+            'finished': self._finished,
+            'interval': self._interval,
+            'samples': self._samples,
+            'stacks': len(self._counts),
+            'requests_left': self._requests_left,
+        }
+
+    def collapsed(self):
+        """Pilhas amostradas no formato collapsed (uma por linha, da mais frequente para a menos)."""
+        with self._lock:
+            counts = self._counts.copy()
+        return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        try:
+            while not self._stop.wait(self._interval) and time.monotonic() < self._deadline:
+                self._sample(own)
+        finally:
+            self._finished = time.time()
+
+    def _sample(self, own):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            stacks.append(';'.join(reversed(stack)))
+        with self._lock:
+            for key in stacks:
+                if key not in self._counts and len(self._counts) >= self.max_stacks:
+                    key = OVERFLOW_STACK
+                self._counts[key] += 1
+            self._samples += 1
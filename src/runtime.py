@@ -0,0 +1,459 @@
+import io
+import sys
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, unquote
+import requests
+from requests.structures import CaseInsensitiveDict
+from codec import BINARY_MIMETYPE
+from peers import PEER_REQUEST_SECONDS, PEER_REQUEST_FAILURES, peer_label
+from server import DEFAULT_THREADS, KEEPALIVE_TIMEOUT
+
+# Conexões simultâneas com outros nós (todas no mesmo laço de eventos)
+DEFAULT_MAX_CONNECTIONS = 1000
+# Conexões keep-alive ociosas guardadas por vizinho
+DEFAULT_POOL_SIZE = 4
+# Tamanho máximo do cabeçalho e do corpo de uma requisição recebida
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 32 * 1024 * 1024
+
+
+class PeerResponse:
+    """Resposta de um vizinho, com a mesma interface usada da `requests.Response`."""
+
+    __slots__ = ('status_code', 'headers', 'content')
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+async def _read_headers(reader):
+    """Lê a primeira linha e os cabeçalhos de uma mensagem HTTP. Retorna (linha, cabeçalhos) ou None no EOF."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError('Conexão encerrada no meio do cabeçalho')
+    except asyncio.LimitOverrunError:
+        raise ValueError('Cabeçalho HTTP grande demais')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip()] = value.strip()
+    return lines[0], headers
+
+
+async def _read_body(reader, headers, until_eof=False):
+    """Lê o corpo pelo Content-Length ou pela codificação chunked (ou até o EOF, se permitido)."""
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        chunks = []
+        total = 0
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+            total += size
+            if total > MAX_BODY_SIZE:
+                raise ValueError('Corpo HTTP grande demais')
+            if size == 0:
+                await reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    length = int(headers.get('Content-Length', 0))
+    if length:
+        if length > MAX_BODY_SIZE:
+            raise ValueError('Corpo HTTP grande demais')
+        return await reader.readexactly(length)
+    return await reader.read() if until_eof else b''
+
+
+def _keep_alive(version, headers):
+    connection = headers.get('Connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+class AsyncPeerClient:
+    """
+    Cliente HTTP assíncrono para os outros nós, sobre as streams do asyncio.
+
+    Todas as conexões vivem no laço de eventos do runtime: milhares de
+    vizinhos custam sockets e corrotinas, não threads. Mantém conexões
+    keep-alive por vizinho e aplica timeout e novas tentativas com espera
+    exponencial como o `PeerClient`; as falhas levantam as mesmas exceções
+    de `requests`, tratadas pela sincronização da cadeia.
+    """
+
+    def __init__(self, timeout=5.0, retries=2, backoff=0.2, max_connections=DEFAULT_MAX_CONNECTIONS, pool_size=DEFAULT_POOL_SIZE):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = {}
+
+    async def request(self, method, node, path, params=None, data=b'', headers=None):
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        attempt = 0
+        while True:
+            async with self._slots:
+                connection, reused = None, False
+                try:
+                    with PEER_REQUEST_SECONDS.time(peer=peer_label(node), path=path.split('?', 1)[0]):
+                        connection, reused = await asyncio.wait_for(self._connection(node), self.timeout)
+                        response, keep_alive = await asyncio.wait_for(
+                            self._exchange(connection, method, node, path, data, headers), self.timeout)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                    if connection is not None:
+                        connection[1].close()
+                    # Conexão ociosa fechada pelo vizinho: tenta de novo com uma nova, sem contar tentativa
+                    if reused and not isinstance(e, asyncio.TimeoutError):
+                        continue
+                    if attempt == self.retries:
+                        PEER_REQUEST_FAILURES.inc(peer=peer_label(node), path=path.split('?', 1)[0])
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise requests.exceptions.Timeout(f'{node}{path}') from e
+                        raise requests.exceptions.ConnectionError(f'{node}{path}: {e}') from e
+                else:
+                    self._release(node, connection, keep_alive)
+                    return response
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def get(self, node, path, params=None, headers=None):
+        return await self.request('GET', node, path, params=params, headers=headers)
+
+    async def post(self, node, path, payload):
+        """Envia `payload` como JSON, ou no formato binário compacto se já vier codificado (bytes)."""
+        if isinstance(payload, bytes):
+            return await self.request('POST', node, path, data=payload, headers={'Content-Type': BINARY_MIMETYPE})
+        return await self.request('POST', node, path, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+
+    async def get_many(self, nodes, path, params=None):
+        """GET de `path` em todos os nós ao mesmo tempo: {nó: resposta}, com None para os que falharem."""
+        results = await asyncio.gather(*(self.get(node, path, params) for node in nodes), return_exceptions=True)
+        responses = {}
+        for node, result in zip(nodes, results):
+            if isinstance(result, requests.exceptions.RequestException):
+                result = None
+            elif isinstance(result, BaseException):
+                raise result
+            responses[node] = result
+        return responses
+
+    async def deliver(self, node, path, payload):
+        try:
+            return (await self.post(node, path, payload)).status_code
+        except requests.exceptions.RequestException:
+            # Ignora nós que não estão respondendo
+            return None
+
+    async def relay_to(self, node, inventory_path, inventory, items):
+        """Anuncia `inventory` ao nó e entrega só os itens que ele pedir. Retorna quantos foram entregues."""
+        try:
+            response = await self.post(node, inventory_path, inventory)
+            wanted = response.json().get('wanted', []) if response.status_code == 200 else []
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        delivered = 0
+        for item_id in wanted:
+            if item_id in items and await self.deliver(node, *items[item_id]) is not None:
+                delivered += 1
+        return delivered
+
+    async def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _connection(self, node):
+        idle = self._idle.get(node)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+        host, _, port = node.rpartition(':') if ':' in node else (node, '', '80')
+        return await asyncio.open_connection(host, int(port)), False
+
+    def _release(self, node, connection, keep_alive):
+        idle = self._idle.setdefault(node, [])
+        if keep_alive and len(idle) < self.pool_size:
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def _exchange(self, connection, method, node, path, data, headers):
+        reader, writer = connection
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {node}', f'Content-Length: {len(data)}']
+        lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
+
+        head = await _read_headers(reader)
+        if head is None:
+            raise ConnectionError('Conexão encerrada pelo vizinho')
+        status_line, response_headers = head
+        version, status = status_line.split(' ', 2)[:2]
+        keep_alive = _keep_alive(version, response_headers)
+        body = b'' if method == 'HEAD' else await _read_body(reader, response_headers, until_eof=not keep_alive)
+        return PeerResponse(int(status), response_headers, body), keep_alive
+
+
+class LoopPeerClient:
+    """
+    A interface síncrona do `PeerClient` sobre o `AsyncPeerClient` do runtime.
+
+    O código síncrono (sincronização da cadeia, rotas do Flask) continua
+    chamando `get`/`post`/`broadcast`; as requisições rodam no laço de
+    eventos, e `get_many` e `broadcast` não ocupam uma thread por vizinho.
+    """
+
+    def __init__(self, runtime, client):
+        self.runtime = runtime
+        self.client = client
+
+    def request(self, method, node, path, params=None, data=b'', headers=None):
+        return self.runtime.call(self.client.request(method, node, path, params=params, data=data, headers=headers))
+
+    def get(self, node, path, params=None, headers=None):
+        return self.runtime.call(self.client.get(node, path, params, headers))
+
+    def post(self, node, path, payload):
+        return self.runtime.call(self.client.post(node, path, payload))
+
+    def get_many(self, nodes, path, params=None):
+        return self.runtime.call(self.client.get_many(list(nodes), path, params))
+
+    def map(self, nodes, call):
+        """Executa `call(node)` (síncrona) para todos os nós, no pool de threads do runtime."""
+        futures = {node: self.runtime.handlers.submit(call, node) for node in nodes}
+        results = {}
+        for node, future in futures.items():
+            try:
+                results[node] = future.result()
+            except requests.exceptions.RequestException:
+                results[node] = None
+        return results
+
+    def broadcast(self, nodes, path, payload):
+        """Agenda no laço de eventos a entrega de `payload` a todos os nós. Retorna os futures das entregas."""
+        return [self.runtime.submit(self.client.deliver(node, path, payload)) for node in list(nodes)]
+
+    def relay(self, nodes, inventory_path, inventory, items):
+        """Agenda no laço de eventos o anúncio do inventário a todos os nós (ver `PeerClient.relay`)."""
+        return [self.runtime.submit(self.client.relay_to(node, inventory_path, inventory, items)) for node in list(nodes)]
+
+    def close(self):
+        self.runtime.call(self.client.close())
+
+
+class NodeRuntime:
+    """
+    Runtime assíncrono do nó: um laço de eventos, em uma thread própria, é
+    dono das conexões com os vizinhos (cliente e servidor HTTP), da
+    retransmissão e da sincronização periódica.
+
+    As rotas do Flask continuam síncronas: o servidor lê e escreve as
+    requisições no laço de eventos e só ocupa uma thread do pool
+    `handlers` enquanto a rota executa. Conexões ociosas, clientes lentos e
+    entregas aos vizinhos não ocupam threads.
+    """
+
+    def __init__(self, timeout=5.0, handler_threads=DEFAULT_THREADS, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.loop = asyncio.new_event_loop()
+        self.threads = handler_threads
+        self.handlers = ThreadPoolExecutor(max_workers=handler_threads, thread_name_prefix='http')
+        self._thread = threading.Thread(target=self.loop.run_forever, name='node-loop', daemon=True)
+        self._thread.start()
+        self._server = None
+        self._tasks = set()
+        self.client = self.call(self._new_client(timeout, max_connections))
+        self.peers = LoopPeerClient(self, self.client)
+
+    @staticmethod
+    async def _new_client(timeout, max_connections):
+        # O semáforo do cliente pertence ao laço do runtime
+        return AsyncPeerClient(timeout=timeout, max_connections=max_connections)
+
+    def submit(self, coro):
+        """Agenda `coro` no laço de eventos; retorna um `concurrent.futures.Future`."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro):
+        """Executa `coro` no laço de eventos e espera o resultado (não pode ser chamada de dentro do laço)."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('NodeRuntime.call chamada de dentro do laço de eventos')
+        return self.submit(coro).result()
+
+    def start_server(self, app, host='0.0.0.0', port=5000):
+        """Passa a atender `app` (WSGI) na porta informada. Retorna a porta efetiva."""
+        self._server = self.call(asyncio.start_server(
+            lambda reader, writer: self._serve_connection(app, reader, writer), host, port,
+            limit=MAX_HEADER_SIZE, backlog=1024))
+        return self._server.sockets[0].getsockname()[1]
+
+    def start_sync(self, blockchain, interval, on_new_tip=None):
+        """Resolve conflitos com os vizinhos a cada `interval` segundos, fora das requisições."""
+        self._spawn(self._sync_forever(blockchain, interval, on_new_tip))
+
+    def serve_forever(self, app, host='0.0.0.0', port=5000):
+        port = self.start_server(app, host, port)
+        print(f"Servindo em http://{host}:{port} (asyncio, {self.threads} threads para as rotas)")
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.submit(self._shutdown()).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.handlers.shutdown(wait=False, cancel_futures=True)
+
+    async def _shutdown(self):
+        # Para de aceitar conexões e encerra as abertas (keep-alive) e as tarefas periódicas
+        if self._server is not None:
+            self._server.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.client.close()
+
+    def _spawn(self, coro):
+        def spawn():
+            task = self.loop.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self.loop.call_soon_threadsafe(spawn)
+
+    async def _sync_forever(self, blockchain, interval, on_new_tip):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                replaced = await self.loop.run_in_executor(self.handlers, blockchain.resolve_conflicts)
+            except Exception as e:
+                print(f"Erro na sincronização com os vizinhos: {e}")
+                continue
+            if replaced and on_new_tip:
+                on_new_tip()
+
+    async def _serve_connection(self, app, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        peer = writer.get_extra_info('peername') or ('', 0)
+        local = writer.get_extra_info('sockname') or ('', 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(_read_headers(reader), KEEPALIVE_TIMEOUT)
+                    if head is None:
+                        return
+                    request_line, headers = head
+                    method, target, version = request_line.split(' ', 2)
+                    body = await _read_body(reader, headers)
+                except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+                    return
+                except ValueError:
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                    return
+
+                environ = self._environ(method, target, version, headers, body, peer, local)
+                keep_alive = _keep_alive(version, headers)
+                keep_alive = await self._respond(app, environ, writer, version, keep_alive, method == 'HEAD')
+                if not keep_alive:
+                    return
+        except asyncio.CancelledError:
+            # Encerramento do runtime: a conexão é fechada sem propagar o cancelamento ao asyncio.start_server
+            pass
+        finally:
+            self._tasks.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _environ(method, target, version, headers, body, peer, local):
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(local[0]),
+            'SERVER_PORT': str(local[1]),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': str(peer[0]),
+            'REMOTE_PORT': str(peer[1]),
+            'CONTENT_TYPE': headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[key] = value
+        return environ
+
+    async def _respond(self, app, environ, writer, version, keep_alive, head_only):
+        """Executa a rota no pool de threads e escreve a resposta. Retorna se a conexão continua aberta."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = status, headers
+
+        def run():
+            result = app(environ, start_response)
+            iterator = iter(result)
+            # Respostas com tamanho conhecido são lidas de uma vez; as demais, pedaço a pedaço
+            first = next(iterator, None)
+            return result, iterator, first
+
+        result, iterator, first = await self.loop.run_in_executor(self.handlers, run)
+        try:
+            headers = started['headers']
+            sized = any(name.lower() == 'content-length' for name, _ in headers)
+            chunked = not sized and version == 'HTTP/1.1'
+            keep_alive = keep_alive and (sized or chunked)
+            lines = [f'{version} {started["status"]}', *(f'{name}: {value}' for name, value in headers)]
+            if chunked:
+                lines.append('Transfer-Encoding: chunked')
+            lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if head_only:
+                return keep_alive
+
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+                chunk = next(iterator, None) if sized else await self.loop.run_in_executor(self.handlers, next, iterator, None)
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+            await writer.drain()
+            return keep_alive
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
@@ -0,0 +1,143 @@
+import time
+import threading
+from concurrent.futures import Future
+
+
+class MiningScheduler:
+    """
+    Executa a mineração em uma thread de fundo, fora das requisições HTTP.
+
+    A thread monta um modelo (template) de bloco a partir da ponta atual da
+    cadeia e do mempool, busca a prova de trabalho e forja o bloco. Como a
+    prova depende apenas do bloco anterior, transações que chegam durante a
+    busca entram no bloco no momento em que ele é forjado. Quando a ponta
+    muda (ex: bloco recebido de outro nó), a busca é cancelada e reiniciada
+    sobre a nova ponta.
+
+    Há dois modos de uso, que podem coexistir:
+    * contínuo: `start()` / `stop()` mineram blocos indefinidamente;
+    * sob demanda: `submit()` retorna um `Future` resolvido com o próximo
+      bloco minerado por este nó (ou None, se a mineração for interrompida).
+    """
+
+    def __init__(self, blockchain, reward_address, on_block=None):
+        self.blockchain = blockchain
+        self.reward_address = reward_address
+        self.on_block = on_block
+        self.running = False
+        self.blocks_mined = 0
+        self.template = None
+        self._jobs = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Inicia a mineração contínua."""
+        with self._cond:
+            self.running = True
+            self._ensure_thread()
+            self._cond.notify()
+
+    def stop(self):
+        """Interrompe a mineração contínua e os pedidos pendentes."""
+        with self._cond:
+            self.running = False
+            jobs, self._jobs = self._jobs, []
+        self.blockchain.miner.cancel()
+        for job in jobs:
+            job.set_result(None)
+
+    def submit(self):
+        """Agenda a mineração de um bloco e retorna um Future com o bloco minerado."""
+        job = Future()
+        with self._cond:
+            self._jobs.append(job)
+            self._ensure_thread()
+            self._cond.notify()
+        return job
+
+    def notify_new_tip(self):
+        """Avisa que a ponta da cadeia mudou: a busca atual é descartada."""
+        self.blockchain.miner.cancel()
+
+    def status(self):
+        with self._cond:
+            pending = len(self._jobs)
+        return {
+            'running': self.running,
+            'pending_jobs': pending,
+            'blocks_mined': self.blocks_mined,
+            'template': self.template,
+            'miner': self.blockchain.miner.stats(),
+        }
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='mining-scheduler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self.running or self._jobs):
+                    self.template = None
+                    self._cond.wait()
+                # Um cancel() (nova ponta, parada) a partir daqui interrompe a próxima busca
+                self.blockchain.miner.reset()
+
+            last_block = self._new_template()
+            proof = self.blockchain.proof_of_work(last_block)
+            if proof is None:
+                # Cancelada: nova ponta ou parada solicitada; monta um novo template
+                continue
+
+            with self._cond:
+                wanted = self.running or self._jobs
+            block = self._forge(last_block, proof) if wanted else None
+            if block is None:
+                continue
+
+            self.blocks_mined += 1
+            with self._cond:
+                jobs, self._jobs = self._jobs, []
+            for job in jobs:
+                job.set_result(block)
+            if self.on_block:
+                try:
+                    self.on_block(block)
+                except Exception as e:
+                    print(f"Erro ao transmitir o bloco minerado: {e}")
+
+    def _new_template(self):
+        with self.blockchain.lock:
+            last_block = self.blockchain.last_block
+            self.template = {
+                'index': last_block['index'] + 1,
+                'previous_hash': self.blockchain.hash(last_block),
+                'difficulty': self.blockchain.difficulty,
+                'transactions': len(self.blockchain.mempool),
+                'created_at': time.time(),
+            }
+        return last_block
+
+    def _forge(self, last_block, proof):
+        # O bloco é forjado pelo escritor da cadeia, em ordem com as demais mutações
+        return self.blockchain.writer.call(self._forge_block, last_block, proof)
+
+    def _forge_block(self, last_block, proof):
+        # A ponta mudou enquanto a prova era buscada: a prova não serve mais
+        if self.blockchain.last_block is not last_block:
+            return None
+        # A mineração foi interrompida enquanto o bloco esperava o escritor
+        with self._cond:
+            if not (self.running or self._jobs):
+                return None
+
+        # Monta o bloco a partir do modelo: coinbase (recompensa + taxas) e as
+        # transações do mempool de maior taxa por byte que cabem no bloco
+        template = self.blockchain.block_template(self.reward_address)
+        self.template = dict(self.template or {}, transactions=len(template['transactions']) - 1,
+                             total_fees=template['total_fees'], size=template['size'])
+
+        # Forja o novo Bloco, adicionando-o à cadeia
+        return self.blockchain.new_block(proof, template['previous_hash'], template['transactions'])
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Threads que atendem requisições simultaneamente
+DEFAULT_THREADS = 32
+# Tempo (em segundos) que uma conexão keep-alive ociosa pode ocupar uma thread
+KEEPALIVE_TIMEOUT = 5
+# Conexões aguardando na fila do socket antes de serem recusadas
+LISTEN_BACKLOG = 1024
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Servidor WSGI com um pool fixo de threads, para o nó em produção.
+
+    Ao contrário do servidor de desenvolvimento do Flask (uma thread nova
+    por conexão), o número de threads é limitado: sob carga, as conexões
+    esperam na fila do socket em vez de esgotar a memória do processo.
+
+    Modelo de concorrência: as threads do pool só leem o retrato publicado
+    da cadeia (`blockchain.state`) e o mempool; toda mutação é entregue ao
+    escritor único (`blockchain.writer`). A validação pesada (assinaturas,
+    prova de trabalho) roda nos pools de processos, fora do GIL.
+    """
+
+    multithread = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, host, port, app, threads=DEFAULT_THREADS):
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(app, host='0.0.0.0', port=5000, threads=DEFAULT_THREADS):
+    """Atende `app` com o servidor de produção até o processo ser interrompido."""
+    server = PooledWSGIServer(host, port, app, threads=threads)
+    print(f"Servindo em http://{host}:{server.server_port} com {threads} threads")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,370 @@
+import os
+import json
+import struct
+import zlib
+import codec
+from compact import json_default
+
+# Políticas de fsync suportadas pelo log de blocos
+FSYNC_ALWAYS = 'always'  # fsync a cada bloco gravado (mais seguro, mais lento)
+FSYNC_BATCH = 'batch'    # fsync a cada `fsync_batch` blocos e ao fechar
+FSYNC_NEVER = 'never'    # apenas flush; o sistema operacional decide quando gravar
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER)
+
+# Cabeçalho do arquivo e de cada registro do log
+LOG_MAGIC = b'CMBLOG\x00\x01'
+UNDO_MAGIC = b'CMBUNDO\x01'
+RECORD_HEADER = struct.Struct('>II')  # tamanho do payload, crc32 do payload
+
+
+def encode_block(block):
+    """
+    Serializa um bloco para gravação em disco, no formato binário compacto.
+    Blocos com campos que o formato não representa são gravados em JSON.
+    """
+    try:
+        return codec.encode_block(block)
+    except (ValueError, KeyError, TypeError):
+        return json.dumps(block, separators=(',', ':'), default=json_default).encode()
+
+
+def decode_block(payload):
+    """Desserializa um bloco gravado em disco (binário ou JSON, de logs antigos)."""
+    if codec.is_binary(payload):
+        return codec.decode_block(payload)
+    return json.loads(payload)
+
+
+class JSONStorage:
+    """
+    Armazenamento legado: reescreve a cadeia inteira em um único arquivo JSON
+    a cada bloco. Mantido para compatibilidade e para nós muito pequenos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.blocks = []
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.blocks = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.blocks = []
+        return list(self.blocks)
+
+    def append(self, block):
+        self.blocks.append(block)
+        self._write()
+
+    def truncate(self, length):
+        """Mantém apenas os `length` primeiros blocos."""
+        self.blocks = self.blocks[:length]
+        self._write()
+
+    def iter_blocks(self, start=0, stop=None):
+        """Os blocos já estão em memória: percorre uma cópia do intervalo pedido."""
+        return iter(self.blocks[start:stop])
+
+    def rewrite(self, chain):
+        self.blocks = list(chain)
+        self._write()
+
+    def close(self):
+        pass
+
+    def _write(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.blocks, f, indent=2, default=json_default)
+
+
+class BlockLogStorage:
+    """
+    Log de blocos somente-anexação (append-only).
+
+    Cada registro é gravado como `tamanho (4 bytes) | crc32 (4 bytes) | bloco`,
+    de modo que gravar um bloco custa O(tamanho do bloco), independente da
+    altura da cadeia. Na abertura, um registro final incompleto ou corrompido
+    (ex: queda de energia no meio de uma gravação) é descartado e o arquivo é
+    truncado no último registro válido.
+    """
+
+    def __init__(self, path, fsync=FSYNC_BATCH, fsync_batch=16, legacy_json_path=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Política de fsync inválida: {fsync}')
+        self.path = path
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self.legacy_json_path = legacy_json_path
+        self.offsets = []  # posição de cada registro no arquivo, por altura
+        self._file = None
+        self._unsynced = 0
+
+    def load(self):
+        """Abre o log, recupera a cauda se necessário e retorna os blocos."""
+        blocks = self._open()
+        if not blocks and self.legacy_json_path and os.path.exists(self.legacy_json_path):
+            blocks = self._migrate_from_json(self.legacy_json_path)
+        return blocks
+
+    def append(self, block):
+        payload = encode_block(block)
+        offset = self._file.tell()
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self.offsets.append(offset)
+
+        self._unsynced += 1
+        if self.fsync == FSYNC_ALWAYS or (self.fsync == FSYNC_BATCH and self._unsynced >= self.fsync_batch):
+            self.sync()
+
+    def truncate(self, length):
+        """
+        Descarta os registros a partir da altura `length` (usado ao desconectar
+        blocos em uma reorganização), mantendo os `length` primeiros blocos.
+        """
+        if length >= len(self.offsets):
+            return
+        self._file.truncate(self.offsets[length])
+        self._file.seek(self.offsets[length])
+        self.offsets = self.offsets[:length]
+        self.sync()
+
+    def iter_blocks(self, start=0, stop=None):
+        """
+        Lê os blocos [start, stop) direto do arquivo, um de cada vez, sem
+        carregar o intervalo inteiro em memória. O intervalo e o descritor do
+        arquivo são fixados na chamada: anexações e reescritas (`rewrite`,
+        que troca o arquivo) não afetam uma leitura em andamento, mas um
+        `truncate` corta o mesmo arquivo. Nesse caso, a leitura para no
+        primeiro registro ausente ou que não confere com o seu crc; como os
+        blocos anexados depois do corte podem ocupar as mesmas posições, a
+        leitura não é um retrato consistente da cadeia (use `ChainState`).
+        """
+        return map(decode_block, self.iter_payloads(start, stop))
+
+    def iter_payloads(self, start=0, stop=None):
+        """Como `iter_blocks`, mas gera os blocos serializados, como gravados no log."""
+        offsets = self.offsets[start:stop]
+        f = open(self.path, 'rb')
+        return self._read_records(f, offsets)
+
+    @staticmethod
+    def _read_records(f, offsets):
+        with f:
+            if offsets:
+                f.seek(offsets[0])
+            for _ in offsets:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                yield payload
+
+    def rewrite(self, chain):
+        """Substitui o log inteiro de forma atômica (usado quando a cadeia é trocada)."""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(LOG_MAGIC)
+            for block in chain:
+                payload = encode_block(block)
+                f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if self._file:
+            self._file.close()
+            self._file = None
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def sync(self):
+        if self._file and self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        if self._file:
+            self._file.close()
+
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(LOG_MAGIC):
+            with open(self.path, 'wb') as f:
+                f.write(LOG_MAGIC)
+
+        self._file = open(self.path, 'r+b')
+        if self._file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            self._file.close()
+            self._file = None
+            raise ValueError(f'{self.path} não é um log de blocos válido')
+
+        blocks = []
+        self.offsets = []
+        good_end = self._file.tell()
+        while True:
+            header = self._file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc = RECORD_HEADER.unpack(header)
+            payload = self._file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            try:
+                block = decode_block(payload)
+            except ValueError:
+                break
+            blocks.append(block)
+            self.offsets.append(good_end)
+            good_end = self._file.tell()
+
+        # Descarta qualquer registro parcial após o último bloco válido
+        if good_end != os.path.getsize(self.path):
+            print(f"Aviso: descartando registro incompleto no final de {self.path}.")
+            self._file.truncate(good_end)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+        self._file.seek(good_end)
+        self._unsynced = 0
+        return blocks
+
+    def _migrate_from_json(self, json_path):
+        """Importa uma cadeia do antigo formato JSON para o log."""
+        legacy = JSONStorage(json_path)
+        blocks = legacy.load()
+        if blocks:
+            self.rewrite(blocks)
+            os.replace(json_path, f'{json_path}.migrated')
+            print(f"Cadeia migrada de {json_path} para {self.path} ({len(blocks)} blocos).")
+        return blocks
+
+
+def open_storage(path, fsync=FSYNC_BATCH):
+    """
+    Cria o backend de armazenamento adequado para o caminho informado.
+    Arquivos `.json` usam o formato legado; os demais usam o log de blocos,
+    migrando automaticamente um `.json` de mesmo nome, se existir.
+    """
+    root, ext = os.path.splitext(path)
+    if ext == '.json':
+        return JSONStorage(path)
+    return BlockLogStorage(path, fsync=fsync, legacy_json_path=f'{root}.json')
+
+
+class UndoLogStorage:
+    """
+    Dados para desfazer os blocos mais recentes, gravados ao lado do log de
+    blocos: um registro `[altura, hash, saídas gastas]` por bloco conectado,
+    no mesmo formato de registro do log. Permite reorganizar a cadeia depois
+    de um reinício sem reconstruir o conjunto de UTXOs.
+
+    Só os `keep` blocos mais recentes interessam, então o arquivo é compactado
+    quando passa do dobro disso. Os registros não recebem fsync: um registro
+    perdido ou corrompido só faz a reorganização cair na reconstrução.
+    """
+
+    def __init__(self, path, keep):
+        self.path = path
+        self.keep = keep
+        self._entries = None  # (altura, posição no arquivo) de cada registro, em ordem de altura
+
+    def load(self, min_height=0):
+        """Retorna [(altura, hash, dados)] dos registros acima de `min_height`, descartando uma cauda inválida."""
+        records = []
+        self._entries = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r+b') as f:
+            good_end = len(UNDO_MAGIC) if f.read(len(UNDO_MAGIC)) == UNDO_MAGIC else 0
+            while good_end:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                height, block_hash, undo = json.loads(payload)
+                self._entries.append((height, good_end))
+                if height > min_height:
+                    records.append((height, block_hash, undo))
+                good_end = f.tell()
+            f.truncate(good_end)
+        return records
+
+    def append(self, height, block_hash, undo):
+        """Grava os dados do bloco na altura `height`, descartando antes os registros de alturas iguais ou maiores."""
+        self.truncate(height - 1)
+        payload = json.dumps([height, block_hash, undo], separators=(',', ':'), default=json_default).encode()
+        with open(self.path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(UNDO_MAGIC)
+            self._entries.append((height, f.tell()))
+            f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            f.write(payload)
+        if len(self._entries) > 2 * self.keep:
+            self._compact()
+
+    def truncate(self, height):
+        """Descarta os registros acima da altura `height` (blocos desconectados)."""
+        if self._entries is None:
+            self.load()
+        cut = next((i for i, (entry_height, _) in enumerate(self._entries) if entry_height > height), None)
+        if cut is None:
+            return
+        with open(self.path, 'r+b') as f:
+            f.truncate(self._entries[cut][1])
+        del self._entries[cut:]
+
+    def _compact(self):
+        """Regrava o arquivo apenas com os `keep` registros mais recentes."""
+        records = self.load(self._entries[-1][0] - self.keep)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(UNDO_MAGIC)
+            for record in records:
+                payload = json.dumps(record, separators=(',', ':'), default=json_default).encode()
+                f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                f.write(payload)
+        os.replace(tmp_path, self.path)
+        self.load()
+
+
+class UTXOSnapshotStore:
+    """
+    Snapshot persistido do conjunto de UTXOs, marcado com a altura e o hash
+    do bloco ao qual corresponde. Permite que o nó reinicie carregando o
+    snapshot e reaplicando apenas os blocos posteriores a ele.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not all(k in snapshot for k in ('height', 'hash', 'utxo')):
+            return None
+        return snapshot
+
+    def save(self, height, block_hash, utxo):
+        """Grava o snapshot de forma atômica (arquivo temporário + rename)."""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'height': height, 'hash': block_hash, 'utxo': utxo}, f, separators=(',', ':'), default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
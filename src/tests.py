@@ -4,7 +4,30 @@ import subprocess
 import time
 import os
 import sys
+import json
+import tempfile
 from wallet import Wallet
+from storage import BlockLogStorage, UndoLogStorage
+from blockchain import Blockchain, GENESIS_ADDRESS, BLOCK_REJECTED, BLOCK_SIDE_BRANCH, BLOCK_CONNECTED
+from miner import ProofOfWorkMiner, search_nonces
+from scheduler import MiningScheduler
+from merkle import merkle_root, merkle_branch, verify_merkle_branch
+from lightclient import verify_transaction_proof, confirmation_work
+import peers
+from peers import PeerClient
+from mempool import Mempool, transaction_size
+from validation import UtxoView, MAX_BLOCK_SIZE
+from transaction import Transaction, TxInput, TxOutput
+import codec
+import benchmark
+import metrics
+from profiler import SamplingProfiler, ProfilerBusy
+from server import PooledWSGIServer
+from runtime import NodeRuntime
+from gossip import SeenCache, Gossip
+from compact import CompactBlock, json_default
+from assembler import BlockAssembler, COINBASE_RESERVED_SIZE
+import threading
 
 api_process_1 = None
 api_process_2 = None
@@ -28,8 +51,9 @@ def tearDownModule():
 
     # Limpa os arquivos de teste
     for port in [5001, 5002]:
-        if os.path.exists(f"blockchain-{port}.json"):
-            os.remove(f"blockchain-{port}.json")
+        for suffix in [".json", ".log", "-utxo.json", "-undo.log", "-index.sqlite", "-index.sqlite-wal", "-index.sqlite-shm"]:
+            if os.path.exists(f"blockchain-{port}{suffix}"):
+                os.remove(f"blockchain-{port}{suffix}")
         if os.path.exists(f"wallet-{port}.json"):
             os.remove(f"wallet-{port}.json")
     if os.path.exists("wallet-user_wallet.json"):
@@ -107,6 +131,39 @@ class TestBlockchain(unittest.TestCase):
         chain_response = requests.get(f"{self.base_url_1}/chain")
         self.assertEqual(len(chain_response.json()['chain']), 4) # 1 genesis + 3 minerados no nó 2
 
+    def test_06b_headers_first_sync(self):
+        """Após a bifurcação ser resolvida, o nó 1 baixa apenas os blocos novos do nó 2."""
+        for i in range(2):
+            requests.get(f"{self.base_url_2}/mine")
+
+        headers = requests.get(f"{self.base_url_2}/headers", params={"from": 4}).json()
+        self.assertEqual(headers['length'], 6)
+        self.assertEqual([h['index'] for h in headers['headers']], [5, 6])
+        self.assertNotIn('transactions', headers['headers'][0])
+
+        blocks = requests.get(f"{self.base_url_2}/blocks", params={"from": 5, "limit": 1}).json()
+        self.assertEqual(blocks['blocks'][0]['merkle_root'], headers['headers'][1]['merkle_root'])
+
+        resolve_response = requests.get(f"{self.base_url_1}/nodes/resolve")
+        self.assertEqual(resolve_response.json()['message'], 'Nossa cadeia foi substituída')
+        chain_1 = requests.get(f"{self.base_url_1}/chain").json()['chain']
+        chain_2 = requests.get(f"{self.base_url_2}/chain").json()['chain']
+        self.assertEqual(chain_1, chain_2)
+
+    def test_06c_paginated_and_streamed_chain(self):
+        """A cadeia pode ser lida em páginas ou em streaming NDJSON, um bloco por linha."""
+        full = requests.get(f"{self.base_url_1}/chain").json()
+        self.assertGreaterEqual(full['length'], 2)
+
+        page = requests.get(f"{self.base_url_1}/chain", params={'start': 1, 'limit': 1}).json()
+        self.assertEqual(page['chain'], full['chain'][1:2])
+        self.assertEqual(page['next'], 2 if full['length'] > 2 else None)
+
+        response = requests.get(f"{self.base_url_1}/chain", params={'stream': 'true'}, stream=True)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        streamed = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertEqual(streamed, full['chain'])
+
     def test_07_insufficient_balance(self):
         """Testa o envio de uma transação com saldo insuficiente."""
         with open("wallet-user_wallet.json", 'r') as f:
@@ -124,5 +181,1301 @@ class TestBlockchain(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn("Endereço do destinatário inválido", response.text)
 
+class TestPeerClient(unittest.TestCase):
+
+    def setUp(self):
+        self.peers = PeerClient(timeout=1.0, retries=1, backoff=0.01)
+
+    def tearDown(self):
+        self.peers.close()
+
+    def test_map_tolerates_unreachable_nodes(self):
+        """Chamadas em paralelo devolvem None para nós que não respondem."""
+        results = self.peers.map(["localhost:5001", "localhost:5999"], lambda node: self.peers.get(node, "/headers", {"limit": 0}).json())
+        self.assertGreaterEqual(results["localhost:5001"]["length"], 1)
+        self.assertIsNone(results["localhost:5999"])
+
+    def test_broadcast_does_not_block(self):
+        """broadcast retorna imediatamente, e a entrega a um nó inacessível resulta em None."""
+        futures = self.peers.broadcast(["localhost:5999"], "/transactions/receive", {})
+        self.assertEqual([f.result(timeout=5) for f in futures], [None])
+
+    def test_resolve_conflicts_skips_malformed_peers(self):
+        """Vizinhos com respostas malformadas são ignorados um a um, sem interromper a sincronização com os demais."""
+        import logging
+        from flask import Flask, request as flask_request
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        missing_fields = Flask('missing_fields')
+        missing_fields.add_url_rule('/headers', 'headers', lambda: {'length': 5})
+        not_json = Flask('not_json')
+        not_json.add_url_rule('/headers', 'headers', lambda: 'isto não é json')
+        bad_headers = Flask('bad_headers')
+        visited = []
+
+        @bad_headers.route('/headers')
+        def headers():
+            visited.append(flask_request.args.get('limit'))
+            if flask_request.args.get('limit') == '0':
+                return {'length': 3, 'work': 1 << 40}
+            return {'headers': [{'hash': 'x'}]}
+
+        servers = [make_server('127.0.0.1', 0, app, threaded=True) for app in (missing_fields, not_json, bad_headers)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            blockchain = Blockchain(storage_path=os.path.join(tmpdir, "resolve.log"), peers=self.peers)
+            try:
+                for server in servers:
+                    blockchain.register_node(f'http://127.0.0.1:{server.server_port}')
+                self.assertFalse(blockchain.resolve_conflicts())
+            finally:
+                for server in servers:
+                    server.shutdown()
+                    server.server_close()
+                blockchain.index.close()
+                blockchain.storage.close()
+        self.assertGreater(len(visited), 1)
+
+class TestMempool(unittest.TestCase):
+
+    def _tx(self, tx_id, outpoints):
+        inputs = [{'transaction_id': o.split(':')[0], 'output_index': int(o.split(':')[1]), 'signature': ''} for o in outpoints]
+        return {'id': tx_id, 'inputs': inputs, 'outputs': [{'recipient_address': 'alice', 'amount': 1.0}]}
+
+    def test_duplicates_and_conflicts_are_rejected(self):
+        """O mempool recusa ids repetidos e transações que gastam a mesma saída."""
+        mempool = Mempool()
+        self.assertTrue(mempool.add(self._tx('a', ['x:0']), fee=0.1))
+        self.assertFalse(mempool.add(self._tx('a', ['x:0']), fee=0.1))
+        self.assertFalse(mempool.add(self._tx('b', ['x:0', 'y:0']), fee=0.5))
+        self.assertEqual(mempool.conflicts(self._tx('c', ['x:0'])), {'a'})
+        self.assertEqual(len(mempool), 1)
+
+    def test_fee_rate_order_and_eviction(self):
+        """As transações saem por taxa por byte, e a de menor taxa é descartada quando o mempool enche."""
+        mempool = Mempool(max_size=2)
+        mempool.add(self._tx('low', ['x:0']), fee=0.1)
+        mempool.add(self._tx('high', ['y:0']), fee=0.9)
+        self.assertTrue(mempool.add(self._tx('mid', ['z:0']), fee=0.5))
+        self.assertEqual([e.tx['id'] for e in mempool.by_fee_rate()], ['high', 'mid'])
+        self.assertFalse(mempool.add(self._tx('lowest', ['w:0']), fee=0.01))
+        self.assertNotIn('lowest', mempool)
+
+    def test_remove_for_block_drops_conflicts(self):
+        """Conectar um bloco remove suas transações e as pendentes que viraram gasto duplo."""
+        mempool = Mempool()
+        mempool.add(self._tx('a', ['x:0']), fee=0.1)
+        mempool.add(self._tx('b', ['y:0']), fee=0.1)
+        mempool.remove_for_block({'transactions': [self._tx('a', ['x:0']), self._tx('c', ['y:0'])]})
+        self.assertEqual(len(mempool), 0)
+        self.assertFalse(mempool.is_spent('y:0'))
+
+    def test_conflict_removes_descendants(self):
+        """Uma transação que gasta a saída de outra pendente sai junto com o pai em conflito."""
+        mempool = Mempool()
+        mempool.add(self._tx('parent', ['x:0']), fee=0.1)
+        mempool.add(self._tx('child', ['parent:0']), fee=0.1)
+        self.assertEqual(mempool.output('parent:0')['amount'], 1.0)
+        mempool.remove_for_block({'transactions': [self._tx('other', ['x:0'])]})
+        self.assertEqual(len(mempool), 0)
+
+class TestBlockAssembler(unittest.TestCase):
+
+    def _tx(self, tx_id, outpoints):
+        inputs = [{'transaction_id': o.split(':')[0], 'output_index': int(o.split(':')[1]), 'signature': ''} for o in outpoints]
+        return {'id': tx_id, 'inputs': inputs, 'outputs': [{'recipient_address': 'alice', 'amount': 1.0}]}
+
+    def test_selects_by_fee_rate_with_parents_first(self):
+        """O modelo prioriza taxa por byte, coloca pais antes dos filhos e respeita o tamanho máximo."""
+        mempool = Mempool()
+        mempool.add(self._tx('low', ['x:0']), fee=0.01)
+        mempool.add(self._tx('parent', ['y:0']), fee=0.02)
+        mempool.add(self._tx('child', ['parent:0']), fee=0.9)
+        mempool.add(self._tx('high', ['z:0']), fee=0.5)
+
+        entries, size = BlockAssembler(mempool, max_block_size=10_000).select()
+        ids = [e.tx['id'] for e in entries]
+        self.assertEqual(ids, ['parent', 'child', 'high', 'low'])
+        self.assertEqual(size, sum(e.size for e in entries))
+
+        # Espaço apenas para o pacote pai + filho, além da reserva da coinbase
+        package_size = mempool.entries['parent'].size + mempool.entries['child'].size
+        entries, _ = BlockAssembler(mempool, max_block_size=COINBASE_RESERVED_SIZE + package_size).select()
+        self.assertEqual([e.tx['id'] for e in entries], ['parent', 'child'])
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip_matches_json(self):
+        """O formato binário reproduz exatamente o JSON original e é menor que ele."""
+        wallet_key = "30820122" + "ab" * 290
+        tx = {
+            'inputs': [{'transaction_id': 'f0' * 32, 'output_index': 3, 'signature': '5e' * 256}],
+            'outputs': [{'recipient_address': wallet_key, 'amount': 0.5}, {'recipient_address': 'bob', 'amount': 2}],
+            'id': 'a1' * 32,
+        }
+        coinbase = {'inputs': [{'transaction_id': '0', 'output_index': -1, 'signature': ''}], 'outputs': [], 'id': 'ABC'}
+        block = {
+            'index': 7, 'timestamp': 1700000000.25, 'transactions': [tx, coinbase],
+            'proof': 123456, 'previous_hash': '1', 'merkle_root': 'cd' * 32,
+        }
+
+        encoded = codec.encode_block(block)
+        self.assertTrue(codec.is_binary(encoded))
+        decoded = codec.decode_block(encoded)
+        self.assertEqual(json.dumps(decoded, sort_keys=True), json.dumps(block, sort_keys=True))
+        self.assertLess(len(encoded), len(json.dumps(block)) * 0.6)
+        self.assertEqual(codec.decode_blocks(codec.encode_blocks([block, block])), [block, block])
+        self.assertEqual(codec.decode_transaction(codec.encode_transaction(tx)), tx)
+        with self.assertRaises(ValueError):
+            codec.decode_block(encoded[:-1])
+
+    def test_transaction_bytes_and_storage_fallback(self):
+        """Transaction.from_bytes preserva o id, e blocos fora do formato são gravados em JSON."""
+        tx = Transaction([TxInput('ab' * 32, 0, 'cd')], [TxOutput('alice', 1.0)])
+        self.assertEqual(Transaction.from_bytes(tx.to_bytes()).id, tx.id)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = BlockLogStorage(os.path.join(tmpdir, "chain.log"))
+            storage.load()
+            storage.append({"index": 1, "transactions": [], "extra": True})
+            storage.close()
+            reopened = BlockLogStorage(storage.path)
+            self.assertEqual(reopened.load(), [{"index": 1, "transactions": [], "extra": True}])
+            reopened.close()
+
+class TestCompactRecords(unittest.TestCase):
+
+    def test_compact_block_behaves_like_its_dict(self):
+        """O bloco compacto é lido como o dicionário original, materializa-o sob demanda e compartilha os endereços."""
+        address = "ab" * 294
+        block = {
+            'index': 2, 'timestamp': 1.5, 'proof': 7, 'previous_hash': '1', 'merkle_root': 'cd' * 32,
+            'transactions': [
+                {'inputs': [{'transaction_id': 'ef' * 32, 'output_index': 0, 'signature': '12' * 256}],
+                 'outputs': [{'recipient_address': address, 'amount': 1.0}], 'id': '34' * 32},
+                {'inputs': [{'transaction_id': '0', 'output_index': 2, 'signature': ''}],
+                 'outputs': [{'recipient_address': "".join(["ab"] * 294), 'amount': 1}], 'id': '56' * 32},
+            ],
+        }
+        compact = CompactBlock.from_dict(json.loads(json.dumps(block)))
+
+        self.assertEqual(compact, block)
+        self.assertEqual(compact.to_dict(), block)
+        self.assertEqual(compact['transactions'][0]['inputs'][0]['signature'], '12' * 256)
+        self.assertIn('merkle_root', compact)
+        outputs = [tx['outputs'][0]['recipient_address'] for tx in compact['transactions']]
+        self.assertIs(outputs[0], outputs[1])
+        with self.assertRaises(AttributeError):
+            compact.proof = 8
+
+        legacy = {k: v for k, v in block.items() if k != 'merkle_root'}
+        self.assertNotIn('merkle_root', CompactBlock.from_dict(legacy))
+        self.assertEqual(json.loads(json.dumps(CompactBlock.from_dict(legacy), default=json_default)), legacy)
+
+class TestMerkleProofs(unittest.TestCase):
+
+    def test_branches_for_every_position(self):
+        """Cada folha, inclusive em níveis ímpares, tem um ramo que leva à raiz; ramos trocados falham."""
+        for count in (1, 2, 5, 8):
+            tx_ids = [f'{i:064x}' for i in range(count)]
+            root = merkle_root(tx_ids)
+            for position, tx_id in enumerate(tx_ids):
+                branch = merkle_branch(tx_ids, position)
+                self.assertTrue(verify_merkle_branch(tx_id, position, branch, root))
+                self.assertFalse(verify_merkle_branch('ff' * 32, position, branch, root))
+        self.assertFalse(verify_merkle_branch(tx_ids[1], 2, merkle_branch(tx_ids, 1), root))
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_synthetic_chain_and_comparison(self):
+        """A cadeia sintética padrão só tem transações válidas, e a comparação aponta pioras além da tolerância."""
+        chain, wallets = benchmark.synthetic_chain()
+        self.assertEqual(len(chain), benchmark.DEFAULT_BLOCKS + 1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            node = Blockchain(storage_path=os.path.join(tmpdir, "bench.log"))
+            node.chain = [CompactBlock.from_dict(chain[0])]
+            node._rebuild_utxo_set()
+            # Cada transação é conferida contra as UTXOs dos blocos anteriores
+            for block in chain[1:]:
+                for tx in block['transactions'][1:]:
+                    self.assertTrue(node.verify_transaction(tx), tx['id'])
+                node._update_utxo_set(CompactBlock.from_dict(block))
+            node.verifier.close()
+            node.index.close()
+            node.storage.close()
+
+        baseline = {'results': {'hash': {'value': 100.0, 'better': 'higher'}, 'http_tx': {'value': 2.0, 'better': 'lower'}}}
+        current = {'results': {'hash': {'value': 95.0, 'better': 'higher'}, 'http_tx': {'value': 3.0, 'better': 'lower'}}}
+        self.assertEqual([(name, regressed) for name, _, _, _, regressed in benchmark.compare(baseline, current)], [('hash', False), ('http_tx', True)])
+
+class TestMetrics(unittest.TestCase):
+
+    def test_registry_renders_prometheus_text(self):
+        """Contadores e histogramas saem no formato do Prometheus; desativados, não registram nada."""
+        registry = metrics.Registry()
+        requests_total = registry.counter('rpc_total', 'Chamadas', ('peer',))
+        latency = registry.histogram('rpc_seconds', 'Latência', buckets=(0.1, 1.0))
+        requests_total.inc(peer='a:5000')
+        requests_total.inc(2, peer='a:5000')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        with latency.time():
+            pass
+
+        text = registry.render()
+        self.assertIn('# TYPE rpc_total counter\nrpc_total{peer="a:5000"} 3\n', text)
+        self.assertIn('rpc_seconds_bucket{le="0.1"} 2\n', text)
+        self.assertIn('rpc_seconds_bucket{le="1.0"} 3\n', text)
+        self.assertIn('rpc_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('rpc_seconds_count 3\n', text)
+
+        registry.enabled = False
+        requests_total.inc(peer='a:5000')
+        self.assertIs(latency.time(), metrics.NULL_TIMER)
+        self.assertEqual(requests_total.value(peer='a:5000'), 3)
+
+    def test_peer_labels_are_bounded(self):
+        """Endereços de vizinhos além do limite caem no rótulo 'other', sem criar séries novas."""
+        saved = peers.MAX_PEER_LABELS, set(peers._peer_labels)
+        peers.MAX_PEER_LABELS = len(peers._peer_labels) + 2
+        try:
+            labels = [peers.peer_label(f'10.0.0.{i}:5000') for i in range(5)]
+            self.assertEqual(labels, ['10.0.0.0:5000', '10.0.0.1:5000'] + [peers.OTHER_PEER_LABEL] * 3)
+            self.assertEqual(peers.peer_label('10.0.0.1:5000'), '10.0.0.1:5000')
+        finally:
+            peers.MAX_PEER_LABELS = saved[0]
+            peers._peer_labels.intersection_update(saved[1])
+
+    def test_metrics_endpoint(self):
+        """/metrics expõe a latência por endpoint, o estado do nó e a conexão de blocos."""
+        import api
+        with tempfile.TemporaryDirectory() as tmpdir:
+            api.blockchain = Blockchain(storage_path=os.path.join(tmpdir, "metrics.log"))
+            try:
+                client = api.app.test_client()
+                self.assertEqual(client.get('/balance/alguem').status_code, 200)
+                response = client.get('/metrics')
+                text = response.get_data(as_text=True)
+            finally:
+                api.blockchain.index.close()
+                api.blockchain.storage.close()
+                api.blockchain = None
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('cryptomesh_http_requests_total{endpoint="get_balance",status="200"}', text)
+        self.assertIn('cryptomesh_http_request_seconds_count{endpoint="get_balance",method="GET"}', text)
+        self.assertIn('cryptomesh_utxo_count 1\n', text)
+        self.assertIn('cryptomesh_chain_operation_seconds_count{operation="connect_block"}', text)
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_samples_other_threads_in_collapsed_format(self):
+        """As pilhas das demais threads são contadas no formato collapsed; só uma sessão por vez."""
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop,), name='ocupada')
+        worker.start()
+        profiler = SamplingProfiler()
+        try:
+            profiler.start(seconds=0.3, interval=0.005)
+            with self.assertRaises(ProfilerBusy):
+                profiler.start(seconds=1)
+            profiler._thread.join()
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertFalse(profiler.running)
+        self.assertGreater(profiler.status()['samples'], 5)
+        busy = [line for line in profiler.collapsed().splitlines() if line.startswith('ocupada;')]
+        self.assertTrue(busy)
+        self.assertTrue(all('tests.py:_busy_loop' in line for line in busy))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in busy))
+
+    def test_admin_endpoints_by_request_count(self):
+        """A sessão por número de requisições termina sozinha; fora do host local, o acesso é negado."""
+        import api
+        with tempfile.TemporaryDirectory() as tmpdir:
+            api.blockchain = Blockchain(storage_path=os.path.join(tmpdir, "profile.log"))
+            try:
+                client = api.app.test_client()
+                remote = api.app.test_client()
+                remote.environ_base['REMOTE_ADDR'] = '10.0.0.7'
+                self.assertEqual(remote.post('/admin/profiler/start').status_code, 403)
+
+                self.assertEqual(client.post('/admin/profiler/start?requests=2&interval=0.001').status_code, 202)
+                self.assertEqual(client.post('/admin/profiler/start').status_code, 409)
+                client.get('/balance/alguem')
+                client.get('/balance/alguem')
+                api.profiler._thread.join(timeout=5)
+                self.assertFalse(client.get('/admin/profiler').get_json()['running'])
+                self.assertEqual(client.get('/admin/profiler?format=collapsed').mimetype, 'text/plain')
+            finally:
+                api.profiler.stop()
+                api.blockchain.index.close()
+                api.blockchain.storage.close()
+                api.blockchain = None
+
+class TestChainWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "writer.log"))
+
+    def tearDown(self):
+        self.blockchain.index.close()
+        self.blockchain.storage.close()
+        self.tmpdir.cleanup()
+
+    def _forge(self):
+        template = self.blockchain.block_template('minerador')
+        return self.blockchain.new_block(100, template['previous_hash'], template['transactions'])
+
+    def test_writer_publishes_consistent_snapshots(self):
+        """As mutações passam pelo escritor; os leitores veem retratos imutáveis e consistentes."""
+        first = self.blockchain.state
+        inconsistent = []
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                state = self.blockchain.state
+                if state.chain[-1] is not state.tip.block or state.length != state.tip.height:
+                    inconsistent.append(state)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for _ in range(20):
+                self.blockchain.writer.call(self._forge)
+        finally:
+            done.set()
+            reader.join()
+
+        self.assertEqual(inconsistent, [])
+        self.assertEqual(first.length, 1)
+        self.assertEqual(first.get_balance('minerador'), 0)
+        self.assertEqual(self.blockchain.state.length, 21)
+        self.assertEqual(self.blockchain.state.get_balance('minerador'), self.blockchain.get_balance('minerador'))
+        self.assertGreater(self.blockchain.state.get_balance('minerador'), 0)
+        # Exceções da mutação chegam a quem a submeteu
+        with self.assertRaises(ValueError):
+            self.blockchain.writer.call(self.blockchain.register_node, '')
+
+    def test_pooled_server_serves_concurrent_requests(self):
+        """O servidor de produção atende requisições simultâneas com um pool fixo de threads."""
+        import api
+        import logging
+        from concurrent.futures import ThreadPoolExecutor
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        api.blockchain = self.blockchain
+        server = PooledWSGIServer('127.0.0.1', 0, api.app, threads=4)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}'
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                responses = list(executor.map(
+                    lambda i: requests.get(f'{url}/balance/alguem' if i % 2 else f'{url}/chain', timeout=5),
+                    range(40),
+                ))
+        finally:
+            server.shutdown()
+            server.server_close()
+            api.blockchain = None
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(responses[0].json()['length'], 1)
+
+class TestNodeRuntime(unittest.TestCase):
+
+    def setUp(self):
+        import api
+        self.api = api
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.served = Blockchain(storage_path=os.path.join(self.tmpdir.name, "served.log"))
+        for _ in range(3):
+            template = self.served.block_template('minerador')
+            proof = self.served.proof_of_work(self.served.last_block)
+            self.served.writer.call(self.served.new_block, proof, template['previous_hash'], template['transactions'])
+        api.blockchain = self.served
+        self.runtime = NodeRuntime(timeout=2, handler_threads=4)
+        self.node = f'127.0.0.1:{self.runtime.start_server(api.app, "127.0.0.1", 0)}'
+
+    def tearDown(self):
+        self.runtime.close()
+        self.api.blockchain = None
+        self.served.index.close()
+        self.served.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_serves_rest_routes_on_the_event_loop(self):
+        """As rotas do Flask respondem pelo servidor asyncio, com keep-alive, streaming e erros preservados."""
+        peers = self.runtime.peers
+        self.assertEqual(peers.get(self.node, '/chain').json()['length'], 4)
+        self.assertEqual(peers.get(self.node, '/balance/minerador').json()['balance'], self.served.get_balance('minerador'))
+        streamed = peers.get(self.node, '/chain', {'stream': 'true'})
+        self.assertEqual(len(streamed.text.splitlines()), 4)
+        self.assertEqual(peers.post(self.node, '/transactions/receive', {}).status_code, 400)
+        self.assertEqual(requests.get(f'http://{self.node}/blocks/99', timeout=5).status_code, 404)
+
+        # Vizinhos inacessíveis não impedem a consulta aos demais
+        self.runtime.client.retries = 0
+        responses = peers.get_many([self.node, '127.0.0.1:1'], '/headers', {'limit': 0})
+        self.assertEqual(responses[self.node].json()['length'], 4)
+        self.assertIsNone(responses['127.0.0.1:1'])
+
+    def test_headers_first_sync_through_the_runtime(self):
+        """Um nó cujos vizinhos são acessados pelo runtime adota a cadeia com mais trabalho."""
+        follower = Blockchain(storage_path=os.path.join(self.tmpdir.name, "follower.log"), peers=self.runtime.peers)
+        try:
+            follower.register_node(self.node)
+            self.assertTrue(follower.resolve_conflicts())
+            self.assertEqual(follower.state.length, 4)
+            self.assertEqual(follower.hash(follower.last_block), self.served.hash(self.served.last_block))
+        finally:
+            follower.index.close()
+            follower.storage.close()
+
+class TestGossip(unittest.TestCase):
+
+    def test_seen_cache_is_bounded_and_expires(self):
+        """O cache de ids vistos descarta os mais antigos e, com ttl, os expirados; o inventário só pede o que falta."""
+        seen = SeenCache(max_size=3)
+        self.assertTrue(seen.add('a'))
+        self.assertFalse(seen.add('a'))
+        for key in 'bcd':
+            seen.add(key)
+        self.assertEqual(len(seen), 3)
+        self.assertNotIn('a', seen)
+        self.assertIn('d', seen)
+
+        expiring = SeenCache(ttl=0.05)
+        expiring.add('x')
+        time.sleep(0.1)
+        self.assertNotIn('x', expiring)
+
+        gossip = Gossip(peers=None)
+        gossip.mark_seen('tx', 'visto')
+        self.assertEqual(gossip.wanted('tx', ['visto', 'temos', 'novo', 'novo'], lambda txid: txid == 'temos'), ['novo'])
+        # Já pedido a um vizinho: não é pedido a outro enquanto não expira
+        self.assertEqual(gossip.wanted('tx', ['novo'], lambda txid: False), [])
+
+    def test_inventory_relay_between_nodes(self):
+        """Um bloco anunciado é entregue só a quem o pede, e o nó retransmite apenas o anúncio."""
+        import api
+        import logging
+        from flask import Flask, request as flask_request
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        # Vizinho que só registra o que recebe e não pede nada
+        listener = Flask('listener')
+        received = []
+
+        @listener.route('/inventory', methods=['POST'])
+        def listener_inventory():
+            received.append(('inventory', flask_request.get_json()))
+            return {'wanted': []}
+
+        @listener.route('/blocks/receive', methods=['POST'])
+        def listener_block():
+            received.append(('block', None))
+            return '', 201
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            served = Blockchain(storage_path=os.path.join(tmpdir, "gossip.log"))
+            api.blockchain = served
+            api.mining_scheduler = MiningScheduler(served, 'minerador')
+            servers = [PooledWSGIServer('127.0.0.1', 0, api.app, threads=4), make_server('127.0.0.1', 0, listener, threaded=True)]
+            for server in servers:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            node, neighbour = (f'127.0.0.1:{server.server_port}' for server in servers)
+            served.register_node(neighbour)
+            announcer = Gossip(PeerClient(timeout=5))
+            try:
+                parent = served.last_block
+                parent_hash = served.hash(parent)
+                coinbase = Transaction([TxInput('0', 2)], [TxOutput('minerador', 1.0)]).to_dict()
+                block = {
+                    'index': 2,
+                    'timestamp': time.time(),
+                    'transactions': [coinbase],
+                    'proof': served.miner.mine(parent['proof'], parent_hash, served.difficulty),
+                    'previous_hash': parent_hash,
+                    'merkle_root': merkle_root([coinbase['id']]),
+                    'bits': served.difficulty,
+                }
+                block_hash = served.hash(block)
+                items = {block_hash: codec.encode_block(block)}
+
+                self.assertEqual([f.result() for f in announcer.announce([node], 'block', items)], [1])
+                self.assertEqual(served.state.length, 2)
+                # Quem já tem o bloco não o pede de novo, e uma reentrega não é reverificada
+                self.assertEqual([f.result() for f in announcer.announce([node], 'block', items)], [0])
+                response = requests.post(f'http://{node}/blocks/receive', data=items[block_hash],
+                                         headers={'Content-Type': codec.BINARY_MIMETYPE}, timeout=5)
+                self.assertEqual(response.status_code, 200)
+
+                deadline = time.time() + 5
+                while not received and time.time() < deadline:
+                    time.sleep(0.05)
+            finally:
+                for server in servers:
+                    server.shutdown()
+                    server.server_close()
+                announcer.peers.close()
+                api.blockchain = None
+                api.mining_scheduler = None
+                served.index.close()
+                served.storage.close()
+
+        self.assertEqual(received, [('inventory', {'type': 'block', 'ids': [block_hash]})])
+
+    def test_receive_rejects_malformed_items_and_forgets_orphans(self):
+        """Itens malformados dão 400; uma transação com entrada desconhecida pode voltar; ramo lateral não é retransmitido."""
+        import api
+        with tempfile.TemporaryDirectory() as tmpdir:
+            served = Blockchain(storage_path=os.path.join(tmpdir, "receive.log"))
+            api.blockchain = served
+            api.mining_scheduler = MiningScheduler(served, 'minerador')
+            try:
+                client = api.app.test_client()
+                self.assertEqual(client.post('/transactions/receive', json={'inputs': 5, 'outputs': [], 'id': 'x'}).status_code, 400)
+                self.assertEqual(client.post('/blocks/receive', json={'index': 2}).status_code, 400)
+                malformed = {'index': 2, 'timestamp': 0, 'proof': 0, 'previous_hash': 'x', 'merkle_root': 'y', 'transactions': [{'foo': 1}]}
+                self.assertEqual(client.post('/blocks/receive', json=malformed).status_code, 400)
+
+                orphan = Transaction([TxInput('ab' * 32, 0)], [TxOutput('alguem', 1.0)]).to_dict()
+                self.assertEqual(client.post('/transactions/receive', json=orphan).status_code, 400)
+                self.assertNotIn(orphan['id'], served.gossip.seen['tx'])
+
+                parent = served.last_block
+                parent_hash = served.hash(parent)
+                blocks = []
+                for recipient in ('a', 'b'):
+                    coinbase = Transaction([TxInput('0', 2)], [TxOutput(recipient, 1.0)]).to_dict()
+                    blocks.append({
+                        'index': 2,
+                        'timestamp': time.time(),
+                        'transactions': [coinbase],
+                        'proof': served.miner.mine(parent['proof'], parent_hash, served.difficulty),
+                        'previous_hash': parent_hash,
+                        'merkle_root': merkle_root([coinbase['id']]),
+                        'bits': served.difficulty,
+                    })
+                self.assertEqual(client.post('/blocks/receive', json=blocks[0]).status_code, 201)
+                tip = served.state.tip
+                self.assertEqual(client.post('/blocks/receive', json=blocks[1]).status_code, 202)
+                self.assertIs(served.state.tip, tip)
+            finally:
+                api.blockchain = None
+                api.mining_scheduler = None
+                served.index.close()
+                served.storage.close()
+
+class TestBlockLogStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "chain.log")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_and_reload(self):
+        """Blocos anexados ao log são recuperados na reabertura."""
+        storage = BlockLogStorage(self.path)
+        self.assertEqual(storage.load(), [])
+        storage.append({"index": 1, "transactions": []})
+        storage.append({"index": 2, "transactions": []})
+        storage.close()
+
+        reopened = BlockLogStorage(self.path)
+        self.assertEqual([b["index"] for b in reopened.load()], [1, 2])
+        reopened.close()
+
+    def test_truncates_partial_tail(self):
+        """Um registro incompleto no final do log é descartado na abertura."""
+        storage = BlockLogStorage(self.path, fsync="always")
+        storage.load()
+        storage.append({"index": 1, "transactions": []})
+        storage.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(b"\x00\x00\x01\x00parcial")
+
+        reopened = BlockLogStorage(self.path)
+        self.assertEqual(len(reopened.load()), 1)
+        self.assertEqual(os.path.getsize(self.path), size)
+        reopened.close()
+
+    def test_iter_blocks_reads_range_from_disk(self):
+        """Um intervalo de blocos é lido do arquivo, e anexações posteriores não afetam a leitura em andamento."""
+        storage = BlockLogStorage(self.path)
+        storage.load()
+        for index in range(1, 6):
+            storage.append({"index": index, "transactions": []})
+
+        blocks = storage.iter_blocks(1, 4)
+        storage.append({"index": 6, "transactions": []})
+        self.assertEqual([b["index"] for b in blocks], [2, 3, 4])
+        self.assertEqual([b["index"] for b in storage.iter_blocks(4)], [5, 6])
+        storage.close()
+
+    def test_read_in_progress_stops_at_truncation(self):
+        """Uma leitura em andamento para de forma limpa se o log for cortado por uma reorganização."""
+        storage = BlockLogStorage(self.path)
+        storage.load()
+        for index in range(1, 6):
+            storage.append({"index": index, "transactions": []})
+
+        blocks = storage.iter_blocks()
+        storage.truncate(2)
+        self.assertEqual([b["index"] for b in blocks], [1, 2])
+        storage.close()
+
+    def test_migrates_legacy_json(self):
+        """Uma cadeia no formato JSON antigo é importada para o log."""
+        legacy_path = os.path.join(self.tmpdir.name, "chain.json")
+        with open(legacy_path, "w") as f:
+            json.dump([{"index": 1, "transactions": []}], f)
+
+        storage = BlockLogStorage(self.path, legacy_json_path=legacy_path)
+        self.assertEqual(len(storage.load()), 1)
+        self.assertFalse(os.path.exists(legacy_path))
+        storage.close()
+
+    def test_undo_log_truncates_and_compacts(self):
+        """O log de dados para desfazer acompanha as alturas conectadas e guarda só os registros mais recentes."""
+        undo_path = os.path.join(self.tmpdir.name, "chain-undo.log")
+        undo_log = UndoLogStorage(undo_path, keep=3)
+        for height in range(1, 8):
+            undo_log.append(height, f"h{height}", [[[f"t{height}:0", {"amount": 1.0}]]])
+        # Acima de 2 * keep registros, ficam só os 3 mais recentes; reconectar a altura 6 descarta os de 6 em diante
+        undo_log.append(6, "outro", [[]])
+        with open(undo_path, "ab") as f:
+            f.write(b"\x00\x00\x01\x00parcial")
+
+        records = UndoLogStorage(undo_path, keep=3).load()
+        self.assertEqual([(height, block_hash) for height, block_hash, _ in records], [(5, "h5"), (6, "outro")])
+        self.assertEqual(records[0][2], [[["t5:0", {"amount": 1.0}]]])
+        self.assertEqual(len(UndoLogStorage(undo_path, keep=3).load(5)), 1)
+
+class TestUtxoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "chain.log"))
+
+    def tearDown(self):
+        self.blockchain.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_index_follows_spends(self):
+        """O índice por endereço e os saldos acompanham as UTXOs gastas e criadas."""
+        genesis_tx = self.blockchain.chain[0]['transactions'][0]
+        self.assertEqual(self.blockchain.get_balance(GENESIS_ADDRESS), 1.0)
+
+        spend = {
+            'id': 'spend',
+            'inputs': [{'transaction_id': genesis_tx['id'], 'output_index': 0, 'signature': ''}],
+            'outputs': [
+                {'recipient_address': 'alice', 'amount': 0.25},
+                {'recipient_address': 'alice', 'amount': 0.25},
+                {'recipient_address': 'bob', 'amount': 0.5},
+            ],
+        }
+        self.blockchain._update_utxo_set({'transactions': [spend]})
+
+        self.assertEqual(self.blockchain.get_balance(GENESIS_ADDRESS), 0)
+        self.assertNotIn(GENESIS_ADDRESS, self.blockchain.utxo_by_address)
+        self.assertEqual(self.blockchain.get_balance('alice'), 0.5)
+        self.assertEqual(self.blockchain.get_balance('bob'), 0.5)
+        self.assertEqual(self.blockchain._find_spendable_outputs('alice', 0.2), (0.25, ['spend:0']))
+
+class TestUtxoSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "chain.log")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _mine(self, blockchain, address):
+        blockchain.new_coinbase_transaction(address)
+        blockchain.new_block(proof=0)
+
+    def test_restart_from_snapshot(self):
+        """O nó reinicia a partir do snapshot e reaplica apenas os blocos seguintes."""
+        blockchain = Blockchain(storage_path=self.path, snapshot_interval=2)
+        self._mine(blockchain, 'alice')
+        self._mine(blockchain, 'bob')
+        blockchain.storage.close()
+        self.assertEqual(blockchain.snapshots.load()['height'], 2)
+
+        restarted = Blockchain(storage_path=self.path, snapshot_interval=2)
+        self.assertEqual(restarted.utxo, blockchain.utxo)
+        self.assertEqual(restarted.get_balance('bob'), 1.0)
+        self.assertTrue(restarted.verify_utxo_snapshot())
+        restarted.storage.close()
+
+    def test_verify_detects_divergent_snapshot(self):
+        """A verificação detecta um snapshot que não confere com a reaplicação completa."""
+        blockchain = Blockchain(storage_path=self.path, snapshot_interval=2)
+        self._mine(blockchain, 'alice')
+        blockchain.snapshots.save(2, blockchain.hash(blockchain.last_block), {})
+
+        self.assertFalse(blockchain.verify_utxo_snapshot(repair=True))
+        self.assertTrue(blockchain.verify_utxo_snapshot())
+        blockchain.storage.close()
+
+class TestProofOfWorkMiner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "chain.log"))
+        self.blockchain.difficulty = 10
+
+    def tearDown(self):
+        self.blockchain.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_parallel_proof_is_valid(self):
+        """A prova encontrada pelo pool de processos é aceita por valid_proof."""
+        miner = ProofOfWorkMiner(workers=2, chunk_size=500)
+        try:
+            last_hash = self.blockchain.hash(self.blockchain.last_block)
+            proof = miner.mine(100, last_hash, self.blockchain.difficulty)
+        finally:
+            miner.close()
+        self.assertTrue(self.blockchain.valid_proof(100, proof, last_hash))
+        self.assertGreater(miner.stats()['hash_rate'], 0)
+
+    def test_parallel_miner_mines_again_without_reset(self):
+        """A parada de uma rodada que achou a prova não impede a próxima chamada direta a mine()."""
+        miner = ProofOfWorkMiner(workers=2, chunk_size=500)
+        try:
+            last_hash = self.blockchain.hash(self.blockchain.last_block)
+            proofs = [miner.mine(last_proof, last_hash, self.blockchain.difficulty) for last_proof in (100, 101)]
+        finally:
+            miner.close()
+        # Uma rodada completa devolve a menor prova válida; com a parada antiga
+        # ainda ativa, cada processo só testaria o início do seu intervalo
+        target = ProofOfWorkMiner.target_for(self.blockchain.difficulty)
+        for last_proof, proof in zip((100, 101), proofs):
+            self.assertEqual(proof, search_nonces(last_proof, last_hash, target, 0, 1 << 20)[0])
+
+    def test_cancel_stops_mining(self):
+        """cancel() interrompe uma mineração em andamento."""
+        miner = ProofOfWorkMiner(workers=1, chunk_size=1000)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(miner.mine(100, 'abc', 200)))
+        thread.start()
+        time.sleep(0.2)
+        miner.cancel()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result, [None])
+
+    def test_cancel_before_mine_is_kept_until_reset(self):
+        """Um cancel() que chega antes de mine() começar não se perde; reset() prepara a próxima rodada."""
+        miner = ProofOfWorkMiner(workers=1, chunk_size=1000)
+        miner.cancel()
+        self.assertIsNone(miner.mine(100, 'abc', 200))
+        miner.reset()
+        self.assertIsNotNone(miner.mine(100, 'abc', 4))
+
+class TestMiningScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "chain.log"))
+        self.mined = []
+        self.scheduler = MiningScheduler(self.blockchain, 'miner', on_block=self.mined.append)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.blockchain.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_submit_mines_in_background(self):
+        """submit() retorna um Future resolvido com o bloco minerado em segundo plano."""
+        block = self.scheduler.submit().result(timeout=10)
+        self.assertEqual(block['index'], 2)
+        self.assertEqual(self.mined, [block])
+        self.assertEqual(self.blockchain.get_balance('miner'), 1.0)
+
+    def test_continuous_mining_start_stop(self):
+        """A mineração contínua produz blocos até ser interrompida."""
+        self.scheduler.start()
+        deadline = time.time() + 10
+        while self.scheduler.blocks_mined < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        self.scheduler.stop()
+        self.assertGreaterEqual(self.scheduler.blocks_mined, 2)
+        self.assertFalse(self.scheduler.status()['running'])
+
+class TestChainValidation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.wallet = Wallet(node_id="validation_test", password="test_password")
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.wallet.wallet_file)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "chain.log"), validation_workers=2)
+        # Força a verificação em paralelo mesmo com lotes pequenos
+        self.blockchain.verifier.parallel_threshold = 1
+
+    def tearDown(self):
+        self.blockchain.verifier.close()
+        self.blockchain.storage.close()
+        self.tmpdir.cleanup()
+
+    def _mine(self):
+        proof = self.blockchain.proof_of_work(self.blockchain.last_block)
+        self.blockchain.new_coinbase_transaction(self.wallet.public_key)
+        return self.blockchain.new_block(proof)
+
+    def test_valid_chain_with_signed_transactions(self):
+        """Uma cadeia com transações assinadas é validada em paralelo, e uma assinatura adulterada é rejeitada."""
+        self._mine()
+        self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5)
+        block = self._mine()
+        self.assertTrue(self.blockchain.valid_chain(self.blockchain.chain))
+
+        tampered = json.loads(json.dumps(self.blockchain.chain, default=json_default))
+        signed_tx = next(tx for tx in tampered[-1]['transactions'] if tx['inputs'][0]['transaction_id'] != '0')
+        signed_tx['inputs'][0]['signature'] = '00' * 256
+        self.assertFalse(self.blockchain.valid_chain(tampered))
+
+    def test_explorer_indexes(self):
+        """Os índices localizam blocos e transações e o histórico do endereço, e são refeitos na reabertura."""
+        first = self._mine()
+        spend = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        block = self._mine()
+
+        self.assertIs(self.blockchain.block_by_hash(self.blockchain.hash(block)), block)
+        found_block, position = self.blockchain.find_transaction(spend['id'])
+        self.assertIs(found_block, block)
+        self.assertEqual(found_block['transactions'][position], spend)
+
+        history, total = self.blockchain.address_history(self.wallet.public_key)
+        coinbase_ids = [tx['id'] for b in (block, first) for tx in b['transactions'] if tx['inputs'][0]['transaction_id'] == '0']
+        self.assertEqual(total, 3)
+        self.assertEqual({txid for txid, _ in history}, set(coinbase_ids) | {spend['id']})
+        self.assertEqual([height for _, height in history], [3, 3, 2])
+
+        # Um índice apagado é reconstruído a partir da cadeia
+        self.blockchain.storage.close()
+        self.blockchain.index.close()
+        os.remove(self.blockchain.index.path)
+        reopened = Blockchain(storage_path=self.blockchain.storage_path)
+        self.assertEqual(reopened.address_history(self.wallet.public_key), (history, total))
+        reopened.storage.close()
+
+    def test_transaction_inclusion_proof(self):
+        """A prova de inclusão é conferida só com cabeçalhos; transação ou cabeçalho adulterados são rejeitados."""
+        self._mine()
+        spend = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self._mine()
+        self._mine()
+
+        # A prova como chega ao cliente, em JSON
+        proof = json.loads(json.dumps(self.blockchain.transaction_proof(spend['id']), default=json_default))
+        self.assertEqual([header['index'] for header in proof['headers']], [2, 3, 4])
+        result = verify_transaction_proof(proof, spend['id'], self.wallet.public_key, min_work=confirmation_work(2, self.blockchain.difficulty))
+        self.assertEqual((result['height'], result['confirmations']), (3, 2))
+        self.assertEqual(result['amount'], sum(output['amount'] for output in spend['outputs']))
+        self.assertTrue(result['confirmed'])
+        # O mínimo vem de quem verifica: mais confirmações do que a prova cobre não confirmam
+        strict = verify_transaction_proof(proof, spend['id'], min_work=confirmation_work(6, self.blockchain.difficulty))
+        self.assertFalse(strict['confirmed'])
+        self.assertLess(len(json.dumps(proof)), len(json.dumps(self.blockchain.chain, default=json_default)))
+
+        self.assertIsNone(verify_transaction_proof(proof, 'ab' * 32, min_work=1))
+        forged = json.loads(json.dumps(proof))
+        forged['transaction']['outputs'][0]['amount'] = 50.0
+        self.assertIsNone(verify_transaction_proof(forged, spend['id'], min_work=1))
+        forged = json.loads(json.dumps(proof))
+        forged['headers'][1]['timestamp'] += 1
+        self.assertIsNone(verify_transaction_proof(forged, spend['id'], min_work=1))
+        self.assertIsNone(self.blockchain.transaction_proof('ab' * 32))
+
+        # Dificuldades fora da faixa (bits=0 aceitaria qualquer hash) e provas malformadas
+        self.assertEqual(result['work'], 2 * (1 << self.blockchain.difficulty))
+        for bits in (0, 300, '4'):
+            forged = json.loads(json.dumps(proof))
+            forged['headers'][-1]['bits'] = bits
+            self.assertIsNone(verify_transaction_proof(forged, spend['id'], min_work=1))
+        forged = json.loads(json.dumps(proof))
+        del forged['branch']
+        self.assertIsNone(verify_transaction_proof(forged, spend['id'], min_work=1))
+        self.assertIsNone(verify_transaction_proof({'transaction': None}, spend['id'], min_work=1))
+
+    def _block_on(self, parent, recipient, transactions=(), blockchain=None, timestamp=None):
+        """Minera, sem conectar, um bloco sobre `parent` com uma coinbase para `recipient`."""
+        blockchain = blockchain or self.blockchain
+        coinbase = Transaction([TxInput('0', parent['index'] + 1)], [TxOutput(recipient, 1.0)]).to_dict()
+        transactions = [coinbase] + list(transactions)
+        parent_hash = blockchain.hash(parent)
+        difficulty = blockchain.tree.get(parent_hash).difficulty
+        return {
+            'index': parent['index'] + 1,
+            'timestamp': timestamp or time.time(),
+            'transactions': transactions,
+            'proof': blockchain.miner.mine(parent['proof'], parent_hash, difficulty),
+            'previous_hash': parent_hash,
+            'merkle_root': merkle_root([tx['id'] for tx in transactions]),
+            'bits': difficulty,
+        }
+
+    def test_reorg_to_branch_with_more_work(self):
+        """Um ramo lateral com mais trabalho substitui só os blocos divergentes, com UTXOs, log e mempool coerentes."""
+        genesis = self.blockchain.last_block
+        self._mine()
+        spend = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self._mine()
+        self.assertEqual(self.blockchain.find_transaction(spend['id'])[0]['index'], 3)
+
+        b2 = self._block_on(genesis, 'bob')
+        self.assertTrue(self.blockchain.add_block(b2))
+        b3 = self._block_on(b2, 'bob')
+        self.assertTrue(self.blockchain.add_block(b3))
+        self.assertEqual(len(self.blockchain.chain), 3)  # mesmo trabalho: a cadeia ativa é mantida
+        b4 = self._block_on(b3, 'bob')
+        self.assertTrue(self.blockchain.add_block(b4))
+
+        self.assertEqual([self.blockchain.hash(b) for b in self.blockchain.chain[1:]], [self.blockchain.hash(b) for b in (b2, b3, b4)])
+        self.assertEqual(self.blockchain.get_balance('bob'), 3.0)
+        self.assertEqual(self.blockchain.get_balance(self.wallet.public_key), 0)
+        self.assertNotIn(spend['id'], self.blockchain.mempool)  # gastava uma coinbase desconectada
+        self.assertIsNone(self.blockchain.find_transaction(spend['id']))
+
+        replay = Blockchain.__new__(Blockchain)
+        replay.chain = self.blockchain.chain
+        replay._rebuild_utxo_set()
+        self.assertEqual(self.blockchain.utxo, replay.utxo)
+
+        self.blockchain.storage.close()
+        reopened = Blockchain(storage_path=self.blockchain.storage_path)
+        self.assertEqual(reopened.chain, self.blockchain.chain)
+        reopened.storage.close()
+
+    def test_mining_template_reports_mempool_fees(self):
+        """O modelo de mineração usa as taxas calculadas no mempool; a coinbase não tem taxa."""
+        import api
+        self._mine()
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5, 0.25)
+        api.blockchain, api.node_identifier = self.blockchain, 'minerador'
+        try:
+            template = api.app.test_client().get('/mining/template').get_json()
+        finally:
+            api.blockchain, api.node_identifier = None, None
+        self.assertEqual(template['total_fees'], 0.25)
+        self.assertEqual([(t['id'], t['fee']) for t in template['transactions'][1:]], [(tx.id, 0.25)])
+        self.assertEqual(template['transactions'][0]['fee'], 0.0)
+
+    def test_forged_signature_copy_does_not_block_the_real_item(self):
+        """Uma cópia com assinatura forjada (mesmo id, mesmo hash) é recusada sem impedir a transação e o bloco verdadeiros."""
+        import api
+        self._mine()
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self.blockchain.mempool.clear()
+        forged_tx = json.loads(json.dumps(tx))
+        for tx_input in forged_tx['inputs']:
+            tx_input['signature'] = '00' * 256
+        previous = self.blockchain.last_block
+        block = {
+            'index': previous['index'] + 1,
+            'timestamp': time.time(),
+            'transactions': [tx],
+            'proof': self.blockchain.proof_of_work(previous),
+            'previous_hash': self.blockchain.hash(previous),
+            'merkle_root': merkle_root([tx['id']]),
+            'bits': self.blockchain.difficulty,
+        }
+        forged_block = dict(block, transactions=[forged_tx])
+        self.assertEqual(self.blockchain.hash(forged_block), self.blockchain.hash(block))
+
+        api.blockchain = self.blockchain
+        api.mining_scheduler = MiningScheduler(self.blockchain, 'minerador')
+        try:
+            client = api.app.test_client()
+            self.assertEqual(client.post('/transactions/receive', json=forged_tx).status_code, 400)
+            self.assertEqual(client.post('/transactions/receive', json=tx).status_code, 201)
+            self.assertIn(tx['id'], self.blockchain.mempool)
+            self.assertEqual(client.post('/blocks/receive', json=forged_block).status_code, 400)
+            self.assertEqual(client.post('/blocks/receive', json=block).status_code, 201)
+        finally:
+            api.blockchain = None
+            api.mining_scheduler = None
+        self.assertEqual(self.blockchain.state.length, 3)
+
+    def test_forged_side_branch_copy_is_replaced(self):
+        """Uma cópia forjada de um bloco de ramo lateral não impede o verdadeiro, de mesmo hash, de entrar e vencer."""
+        self._mine()
+        fork = self.blockchain.last_block
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self.blockchain.mempool.clear()
+        self._mine()
+        self.assertIsNone(self.blockchain.find_transaction(tx['id']))
+        forged_tx = json.loads(json.dumps(tx))
+        for tx_input in forged_tx['inputs']:
+            tx_input['signature'] = '00' * 256
+
+        side = self._block_on(fork, 'bob', transactions=[tx])
+        forged = dict(side, transactions=[side['transactions'][0], forged_tx])
+        self.assertEqual(self.blockchain.add_block(forged), BLOCK_SIDE_BRANCH)
+        self.assertEqual(self.blockchain.add_block(forged), BLOCK_REJECTED)
+        self.assertEqual(self.blockchain.add_block(side), BLOCK_SIDE_BRANCH)
+        self.assertEqual(self.blockchain.add_block(self._block_on(side, 'bob')), BLOCK_CONNECTED)
+        self.assertEqual(self.blockchain.find_transaction(tx['id'])[0]['index'], 3)
+        # Depois de conectado, o bloco não é mais substituído
+        self.assertEqual(self.blockchain.add_block(forged), BLOCK_REJECTED)
+
+    def test_published_state_survives_reorg(self):
+        """Os retratos compartilham a cadeia e os saldos sem copiá-los, e não mudam com uma reorganização."""
+        genesis = self.blockchain.last_block
+        self.blockchain.writer.call(self._mine)
+        before = self.blockchain.state
+        balance = before.get_balance(self.wallet.public_key)
+        self.assertGreater(balance, 0)
+
+        parent = genesis
+        for _ in range(3):
+            parent = self._block_on(parent, 'bob')
+            self.blockchain.writer.call(self.blockchain.add_block, parent)
+        after = self.blockchain.state
+        self.assertEqual(after.length, 4)
+        self.assertIs(after.chain[-1], self.blockchain.last_block)
+        self.assertEqual((after.get_balance('bob'), after.get_balance(self.wallet.public_key)), (3.0, 0))
+
+        self.assertEqual(before.length, 2)
+        self.assertEqual(list(before.chain), [genesis, before.tip.block])
+        self.assertEqual(before.chain[1:], [before.tip.block])
+        self.assertEqual((before.get_balance('bob'), before.get_balance(self.wallet.public_key)), (0, balance))
+
+    def test_reorg_after_restart_uses_persisted_undo(self):
+        """Depois de um reinício, a reorganização desfaz os blocos com os dados gravados, sem reconstruir as UTXOs."""
+        genesis = self.blockchain.last_block
+        self._mine()
+        self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5)
+        self._mine()
+        self.blockchain.storage.close()
+
+        reopened = Blockchain(storage_path=self.blockchain.storage_path)
+        self.addCleanup(reopened.storage.close)
+        reopened._rebuild_utxo_set = lambda: self.fail('o conjunto de UTXOs foi reconstruído')
+        parent = genesis
+        for _ in range(3):
+            parent = self._block_on(parent, 'bob', blockchain=reopened)
+            self.assertTrue(reopened.add_block(parent))
+
+        self.assertEqual(reopened.hash(reopened.last_block), reopened.hash(parent))
+        self.assertEqual(reopened.get_balance('bob'), 3.0)
+        replay = Blockchain.__new__(Blockchain)
+        replay.chain = reopened.chain
+        Blockchain._rebuild_utxo_set(replay)
+        self.assertEqual(reopened.utxo, replay.utxo)
+
+    def test_fork_choice_by_cumulative_work(self):
+        """Um ramo mais curto vence se tiver mais trabalho; cada bloco declara e é conferido com o próprio alvo."""
+        blockchain = Blockchain(storage_path=os.path.join(self.tmpdir.name, "work.log"), difficulty_adjustment_interval=2)
+        self.addCleanup(blockchain.storage.close)
+        genesis = blockchain.last_block
+        t0 = genesis['timestamp']
+
+        # Ramo longo, em ritmo normal: a dificuldade fica em 4
+        parent = genesis
+        for i in range(1, 5):
+            parent = self._block_on(parent, 'longo', blockchain=blockchain, timestamp=t0 + 20 * i)
+            self.assertTrue(blockchain.add_block(parent))
+        self.assertEqual(len(blockchain.chain), 5)
+
+        # Ramo curto e rápido: a dificuldade sobe a cada ajuste
+        parent = genesis
+        short = []
+        for i in range(1, 4):
+            parent = self._block_on(parent, 'curto', blockchain=blockchain, timestamp=t0 + i)
+            if i == 2:
+                self.assertFalse(blockchain.add_block(dict(parent, bits=4)))
+            self.assertTrue(blockchain.add_block(parent))
+            short.append(parent)
+        self.assertEqual([block['bits'] for block in short], [4, 5, 5])
+        self.assertEqual(len(blockchain.chain), 4)
+        self.assertEqual(blockchain.tip.work, 16 + 32 + 32)
+        self.assertEqual(blockchain.difficulty, 6)
+        self.assertTrue(blockchain.valid_chain(blockchain.chain))
+
+        # Os cabeçalhos com a dificuldade adulterada não conferem com o histórico
+        tampered = json.loads(json.dumps(blockchain.chain, default=json_default))
+        tampered[2]['bits'] = 4
+        self.assertFalse(blockchain.valid_chain(tampered))
+
+    def test_invalid_branch_is_discarded(self):
+        """Se o ramo com mais trabalho tiver um bloco inválido, a cadeia anterior é restaurada."""
+        genesis = self.blockchain.last_block
+        self._mine()
+        tip = self.blockchain.last_block
+        forged = {
+            'inputs': [{'transaction_id': 'ab' * 32, 'output_index': 0, 'signature': ''}],
+            'outputs': [{'recipient_address': 'bob', 'amount': 5.0}],
+            'id': 'cd' * 32,
+        }
+        b2 = self._block_on(genesis, 'bob')
+        self.assertEqual(self.blockchain.add_block(b2), BLOCK_SIDE_BRANCH)
+        b3 = self._block_on(b2, 'bob', [forged])
+        self.assertFalse(self.blockchain.add_block(b3))
+
+        self.assertIs(self.blockchain.last_block, tip)
+        self.assertIsNone(self.blockchain.tree.get(self.blockchain.hash(b3)))
+        self.assertEqual(self.blockchain.get_balance(self.wallet.public_key), 1.0)
+        self.assertEqual(self.blockchain.get_balance('bob'), 0)
+
+    def test_foreign_genesis_is_not_stored(self):
+        """Um gênese desconhecido recebido avulso é rejeitado sem entrar na árvore; só a sincronização o adota."""
+        coinbase = Transaction([TxInput('0', 1)], [TxOutput('falso', 1.0)]).to_dict()
+        fake = {
+            'index': 1, 'timestamp': time.time(), 'transactions': [coinbase], 'proof': 100,
+            'previous_hash': '1', 'merkle_root': merkle_root([coinbase['id']]), 'bits': 4,
+        }
+        nodes = len(self.blockchain.tree)
+        self.assertEqual(self.blockchain.add_block(fake), BLOCK_REJECTED)
+        self.assertEqual(len(self.blockchain.tree), nodes)
+        self.assertEqual(self.blockchain.add_block(self._block_on(self.blockchain.last_block, 'bob')), BLOCK_CONNECTED)
+
+    def test_double_spend_inside_block_is_rejected(self):
+        """add_block rejeita um bloco que gasta a mesma UTXO duas vezes."""
+        self._mine()
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self.blockchain.mempool.clear()
+        previous = self.blockchain.last_block
+        block = {
+            'index': previous['index'] + 1,
+            'timestamp': time.time(),
+            'transactions': [tx, tx],
+            'proof': self.blockchain.proof_of_work(previous),
+            'previous_hash': self.blockchain.hash(previous),
+            'merkle_root': merkle_root([tx['id'], tx['id']]),
+            'bits': self.blockchain.difficulty,
+        }
+        self.assertFalse(self.blockchain.add_block(block))
+        block['transactions'] = [tx]
+        block['merkle_root'] = merkle_root([tx['id']])
+        self.assertTrue(self.blockchain.add_block(block))
+
+    def test_spending_output_created_earlier_in_block(self):
+        """Uma transação pode gastar a saída de outra anterior no mesmo bloco, mas não antes de ela aparecer."""
+        self._mine()
+        parent = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        child = self.blockchain.sign_transaction(self.wallet, Transaction([TxInput(parent['id'], 0)], [TxOutput(self.wallet.public_key, 0.5)])).to_dict()
+        self.blockchain.mempool.clear()
+        previous = self.blockchain.last_block
+        block = {
+            'index': previous['index'] + 1,
+            'timestamp': time.time(),
+            'transactions': [child, parent],
+            'proof': self.blockchain.proof_of_work(previous),
+            'previous_hash': self.blockchain.hash(previous),
+            'merkle_root': merkle_root([child['id'], parent['id']]),
+            'bits': self.blockchain.difficulty,
+        }
+        self.assertFalse(self.blockchain.add_block(block))
+        block['transactions'] = [parent, child]
+        block['merkle_root'] = merkle_root([parent['id'], child['id']])
+        self.assertTrue(self.blockchain.add_block(block))
+        self.assertIn(f"{child['id']}:0", self.blockchain.utxo)
+
+    def test_block_size_limit_is_consensus_not_local_setting(self):
+        """O limite de mineração do nó não decide a validade de blocos alheios; o limite de consenso, sim."""
+        self._mine()
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self.blockchain.assembler.max_block_size = COINBASE_RESERVED_SIZE
+        self.assertEqual(len(self.blockchain.block_template('minerador')['transactions']), 1)
+        self.blockchain.mempool.clear()
+
+        block = self._block_on(self.blockchain.last_block, 'bob', transactions=[tx])
+        self.assertEqual(self.blockchain.add_block(block), BLOCK_CONNECTED)
+        # Acima do limite de consenso, o bloco é inválido para qualquer nó
+        huge = dict(tx, outputs=tx['outputs'] * (MAX_BLOCK_SIZE // transaction_size(tx) + 1))
+        self.assertIsNone(self.blockchain._check_block_transactions(
+            dict(block, transactions=[huge], merkle_root=merkle_root([huge['id']])), UtxoView(self.blockchain.utxo)))
+
+    def test_tampered_transaction_breaks_merkle_root(self):
+        """O hash cobre só o cabeçalho, mas uma transação adulterada não confere com a raiz de Merkle."""
+        self._mine()
+        tx = self.blockchain.new_utxo_transaction(self.wallet, self.wallet.public_key, 0.5).to_dict()
+        self.blockchain.mempool.clear()
+        previous = self.blockchain.last_block
+        block = {
+            'index': previous['index'] + 1,
+            'timestamp': time.time(),
+            'transactions': [tx],
+            'proof': self.blockchain.proof_of_work(previous),
+            'previous_hash': self.blockchain.hash(previous),
+            'merkle_root': merkle_root([tx['id']]),
+            'bits': self.blockchain.difficulty,
+        }
+        block_hash = self.blockchain.hash(block)
+
+        tampered = json.loads(json.dumps(block))
+        tampered['transactions'][0]['outputs'][0]['amount'] = 0.9
+        self.assertEqual(self.blockchain.hash(tampered), block_hash)
+        self.assertFalse(self.blockchain.add_block(tampered))
+
+        tampered['transactions'][0]['id'] = '0' * 64
+        self.assertFalse(self.blockchain.add_block(tampered))
+        self.assertTrue(self.blockchain.add_block(block))
+
+class TestKeyCache(unittest.TestCase):
+
+    def test_verify_reuses_parsed_keys(self):
+        """Verificações repetidas com a mesma chave pública são servidas pelo cache."""
+        w = Wallet(node_id="key_cache_test", password="test_password")
+        self.addCleanup(os.remove, w.wallet_file)
+
+        signature = w.sign(w.private_key, "hash")
+        before = Wallet.key_cache_info()['public']
+        self.assertTrue(Wallet.verify_signature(w.public_key, signature, "hash"))
+        self.assertTrue(Wallet.verify_signature(w.public_key, signature, "hash"))
+        self.assertFalse(Wallet.verify_signature(w.public_key, signature, "outro hash"))
+        after = Wallet.key_cache_info()['public']
+
+        self.assertGreaterEqual(after['hits'] - before['hits'], 2)
+        self.assertLessEqual(after['misses'] - before['misses'], 1)
+        self.assertFalse(Wallet.is_valid_address("invalid_address"))
+
+    def test_private_key_stays_with_its_wallet(self):
+        """A chave privada decodificada fica só na carteira que assina, não em um cache do módulo."""
+        w = Wallet(node_id="signing_key_test", password="test_password")
+        self.addCleanup(os.remove, w.wallet_file)
+
+        signature = w.sign(w.private_key, "hash")
+        signing_key = w._signing_key
+        w.sign(w.private_key, "outro hash")
+        self.assertIs(w._signing_key, signing_key)
+        self.assertTrue(Wallet.verify_signature(w.public_key, signature, "hash"))
+        self.assertEqual(set(Wallet.key_cache_info()), {'public'})
+
+    def test_in_memory_wallet_touches_no_files(self):
+        """Sem node_id a carteira é criada só em memória e ainda assina normalmente."""
+        before = set(os.listdir('.'))
+        w = Wallet()
+        self.assertIsNone(w.wallet_file)
+        self.assertFalse(w.save_keys())
+        self.assertEqual(set(os.listdir('.')), before)
+        self.assertTrue(Wallet.verify_signature(w.public_key, w.sign(w.private_key, "hash"), "hash"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
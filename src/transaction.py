@@ -2,8 +2,23 @@ import json
 import hashlib
 from dataclasses import dataclass, asdict
 from typing import List
+import codec
 
-@dataclass(frozen=True)
+
+def hash_transaction_dict(tx_dict):
+    """
+    Calcula o hash (ID) de uma transação a partir do seu dicionário, sem
+    recriar os objetos. O hash cobre as entradas (sem assinatura) e as saídas.
+    """
+    tx_data = {
+        'inputs': [{'transaction_id': i['transaction_id'], 'output_index': i['output_index']} for i in tx_dict['inputs']],
+        'outputs': [{'recipient_address': o['recipient_address'], 'amount': o['amount']} for o in tx_dict['outputs']],
+    }
+    tx_string = json.dumps(tx_data, sort_keys=True).encode()
+    return hashlib.sha256(tx_string).hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
 class TxOutput:
     recipient_address: str
     amount: float
@@ -15,7 +30,7 @@ class TxOutput:
     def from_dict(cls, data):
         return cls(data['recipient_address'], data['amount'])
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TxInput:
     transaction_id: str
     output_index: int
@@ -28,7 +43,7 @@ class TxInput:
     def from_dict(cls, data):
         return cls(data['transaction_id'], data['output_index'], data.get('signature', ''))
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Transaction:
     inputs: List[TxInput]
     outputs: List[TxOutput]
@@ -46,14 +61,25 @@ class Transaction:
             'id': self.id
         }
 
+    def to_bytes(self):
+        """Serializa a transação no formato binário compacto (ver codec.py)."""
+        return codec.encode_transaction(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        """Recria a transação; o id é recalculado a partir do conteúdo."""
+        return cls([TxInput.from_dict(i) for i in data['inputs']], [TxOutput.from_dict(o) for o in data['outputs']])
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.from_dict(codec.decode_transaction(data))
+
     def calculate_hash(self):
         """
         Calcula o hash (ID) da transação.
         O hash é calculado sobre as entradas (sem assinatura) e saídas.
         """
-        tx_data = {
-            'inputs': [{k: v for k, v in i.to_dict().items() if k != 'signature'} for i in self.inputs],
+        return hash_transaction_dict({
+            'inputs': [i.to_dict() for i in self.inputs],
             'outputs': [o.to_dict() for o in self.outputs],
-        }
-        tx_string = json.dumps(tx_data, sort_keys=True).encode()
-        return hashlib.sha256(tx_string).hexdigest()
\ No newline at end of file
+        })
@@ -0,0 +1,167 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from wallet import Wallet
+from transaction import hash_transaction_dict
+from miner import check_proof
+from merkle import merkle_root
+import metrics
+
+SIGNATURES_VERIFIED = metrics.counter('cryptomesh_signatures_verified_total', 'Assinaturas de transações verificadas')
+
+# Regra de consenso: tamanho máximo de um bloco (soma dos tamanhos das transações,
+# em bytes). É igual em todos os nós; `--max-block-size` só limita os modelos de mineração
+MAX_BLOCK_SIZE = 1_000_000
+
+
+def is_coinbase(tx_dict):
+    return not tx_dict['inputs'] or tx_dict['inputs'][0]['transaction_id'] == '0'
+
+
+def transaction_hash(tx_dict):
+    """Hash assinado da transação, calculado direto do dicionário."""
+    return hash_transaction_dict(tx_dict)
+
+
+def valid_block_body(block):
+    """
+    Confere se a raiz de Merkle do cabeçalho cobre exatamente os ids das
+    transações do bloco, sem ids repetidos. O id de cada transação é conferido
+    contra o seu conteúdo aqui (coinbase) ou em `collect_signature_jobs`.
+    """
+    tx_ids = [tx['id'] for tx in block['transactions']]
+    if len(set(tx_ids)) != len(tx_ids):
+        return False
+    for tx in block['transactions']:
+        if is_coinbase(tx) and transaction_hash(tx) != tx['id']:
+            return False
+    return 'merkle_root' not in block or merkle_root(tx_ids) == block['merkle_root']
+
+
+def collect_signature_jobs(tx_dict, lookup_utxo):
+    """
+    Confere as entradas de uma transação (não coinbase) contra `lookup_utxo`
+    e retorna a lista de assinaturas a verificar, como tuplas
+    (chave pública, assinatura, hash). Retorna None se a transação for inválida.
+    """
+    tx_hash = transaction_hash(tx_dict)
+    if tx_hash != tx_dict['id']:
+        print(f"Erro de verificação: id da transação {tx_dict['id']} não confere com o conteúdo.")
+        return None
+
+    jobs = []
+    seen = set()
+    total_input_value = 0
+    for input_tx_dict in tx_dict['inputs']:
+        utxo_key = f"{input_tx_dict['transaction_id']}:{input_tx_dict['output_index']}"
+
+        # 1. Verifica se a UTXO que está sendo gasta realmente existe (e não é gasta duas vezes)
+        utxo = lookup_utxo(utxo_key)
+        if utxo is None:
+            print(f"Erro de verificação: UTXO {utxo_key} não encontrada.")
+            return None
+        if utxo_key in seen:
+            print(f"Erro de verificação: UTXO {utxo_key} gasta mais de uma vez.")
+            return None
+        seen.add(utxo_key)
+        total_input_value += utxo['amount']
+
+        # 2. A chave pública do dono da UTXO é o endereço do destinatário da saída original
+        jobs.append((utxo['recipient_address'], input_tx_dict['signature'], tx_hash))
+
+    # 3. Verifica se a soma das entradas é maior ou igual à soma das saídas
+    total_output_value = sum(output['amount'] for output in tx_dict['outputs'])
+    if total_input_value < total_output_value:
+        print(f"Erro de verificação: Valor de entrada ({total_input_value}) é menor que o de saída ({total_output_value}).")
+        return None
+
+    return jobs
+
+
+class UtxoView:
+    """
+    Visão de um conjunto de UTXOs com as alterações de um bloco aplicadas por
+    cima, sem modificar o conjunto original.
+    """
+
+    def __init__(self, base=None):
+        self.base = base if base is not None else {}
+        self.created = {}
+        self.spent = set()
+
+    def get(self, utxo_key):
+        if utxo_key in self.spent:
+            return None
+        if utxo_key in self.created:
+            return self.created[utxo_key]
+        return self.base.get(utxo_key)
+
+    def add(self, utxo_key, output):
+        self.spent.discard(utxo_key)
+        self.created[utxo_key] = output
+
+    def spend(self, utxo_key):
+        self.created.pop(utxo_key, None)
+        self.spent.add(utxo_key)
+
+
+def _first_invalid_proof(jobs):
+    for position, (last_proof, proof, last_hash, difficulty) in enumerate(jobs):
+        if not check_proof(last_proof, proof, last_hash, difficulty):
+            return position
+    return None
+
+
+def _first_invalid_signature(jobs):
+    for position, (public_key, signature, tx_hash) in enumerate(jobs):
+        if not Wallet.verify_signature(public_key, signature, tx_hash):
+            return position
+    return None
+
+
+class BatchVerifier:
+    """
+    Verifica lotes de provas de trabalho e de assinaturas, distribuindo-os
+    entre um pool de processos quando o lote é grande o bastante para
+    compensar o custo de envio. A verificação para no primeiro item inválido.
+    """
+
+    def __init__(self, workers=None, parallel_threshold=32):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.parallel_threshold = parallel_threshold
+        self._executor = None
+
+    def verify_proofs(self, jobs):
+        """jobs: tuplas (last_proof, proof, last_hash, difficulty)."""
+        return self._run(_first_invalid_proof, jobs)
+
+    def verify_signatures(self, jobs):
+        """jobs: tuplas (chave pública, assinatura, hash da transação)."""
+        SIGNATURES_VERIFIED.inc(len(jobs))
+        return self._run(_first_invalid_signature, jobs)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _run(self, check, jobs):
+        if self.workers == 1 or len(jobs) < self.parallel_threshold:
+            return check(jobs) is None
+
+        if self._executor is None:
+            # Evita fork() de um processo com várias threads (servidor HTTP, mineração)
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(start_method))
+
+        # Lotes menores que o número de processos permitem interromper cedo
+        size = max(1, -(-len(jobs) // (self.workers * 4)))
+        futures = [self._executor.submit(check, jobs[i:i + size]) for i in range(0, len(jobs), size)]
+        try:
+            for future in as_completed(futures):
+                if future.result() is not None:
+                    return False
+            return True
+        finally:
+            for future in futures:
+                future.cancel()
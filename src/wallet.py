@@ -9,14 +9,34 @@ import os
 from getpass import getpass
 from Crypto.Protocol.KDF import PBKDF2
 from base64 import b64encode, b64decode
+from functools import lru_cache
+
+# Tamanho do cache de chaves públicas já decodificadas (DER -> objeto RSA).
+# Chaves privadas não entram em caches do módulo: cada carteira guarda só a sua.
+PUBLIC_KEY_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+def _import_public_key(public_key_hex):
+    return RSA.import_key(binascii.unhexlify(public_key_hex))
 
 class Wallet:
-    def __init__(self, node_id, password=None):
+    def __init__(self, node_id=None, password=None):
+        """
+        Carrega (ou cria e salva) a carteira `wallet-<node_id>.json`. Sem
+        `node_id`, a carteira fica apenas em memória: as chaves são geradas
+        na hora e nada é lido ou gravado em disco.
+        """
         self.private_key = None
         self.public_key = None
-        self.wallet_file = f'wallet-{node_id}.json'
+        # Chave privada já decodificada, como (hex, objeto RSA), para assinar sem decodificá-la de novo
+        self._signing_key = None
+        self.wallet_file = f'wallet-{node_id}.json' if node_id is not None else None
         self.password = password
 
+        if self.wallet_file is None:
+            self.create_keys()
+            return
+
         # Tenta carregar as chaves, se não conseguir, cria novas e salva
         if not self.load_keys():
             self.create_keys()
@@ -35,6 +55,8 @@ class Wallet:
         """
         Salva as chaves da carteira em um arquivo JSON.
         """
+        if self.wallet_file is None:
+            return False
         if self.public_key and self.private_key:
             if not self.password:
                 self.password = getpass("Digite uma senha para sua carteira: ")
@@ -64,7 +86,7 @@ class Wallet:
         """
         Carrega as chaves da carteira de um arquivo.
         """
-        if os.path.exists(self.wallet_file):
+        if self.wallet_file is not None and os.path.exists(self.wallet_file):
             try:
                 with open(self.wallet_file, 'r') as f:
                     lines = f.readlines()
@@ -94,8 +116,9 @@ class Wallet:
         """
         Assina um hash de transação com a chave privada.
         """
-        private_key = RSA.importKey(binascii.unhexlify(private_key_hex))
-        signer = pkcs1_15.new(private_key)
+        if self._signing_key is None or self._signing_key[0] != private_key_hex:
+            self._signing_key = (private_key_hex, RSA.importKey(binascii.unhexlify(private_key_hex)))
+        signer = pkcs1_15.new(self._signing_key[1])
         h = SHA256.new(transaction_hash.encode('utf8'))
         return binascii.hexlify(signer.sign(h)).decode('ascii')
 
@@ -104,7 +127,7 @@ class Wallet:
         """
         Verifica a assinatura de um hash de transação.
         """
-        public_key = RSA.import_key(binascii.unhexlify(public_key_hex))
+        public_key = _import_public_key(public_key_hex)
         verifier = pkcs1_15.new(public_key)
         h = SHA256.new(transaction_hash.encode('utf8'))
         try:
@@ -117,7 +140,12 @@ class Wallet:
     def is_valid_address(address):
         """Verifica se um endereço (chave pública) é válido."""
         try:
-            RSA.import_key(binascii.unhexlify(address))
+            _import_public_key(address)
             return True
         except (ValueError, TypeError, binascii.Error):
-            return False
\ No newline at end of file
+            return False
+
+    @staticmethod
+    def key_cache_info():
+        """Retorna os contadores (acertos, falhas, tamanho) do cache de chaves públicas."""
+        return {'public': _import_public_key.cache_info()._asdict()}
\ No newline at end of file